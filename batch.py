@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import json
+import os
+
+from dotenv import load_dotenv
+
+from src.batch import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_ID_FIELD,
+    DEFAULT_QUESTION_FIELD,
+    DEFAULT_RATE,
+    iter_questions,
+    run_batch,
+)
+
+# Responde en lote las preguntas de un archivo JSONL con el grafo del chatbot
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Answer a JSONL file of questions, writing answers to JSONL."
+    )
+    parser.add_argument("questions", help="JSONL file with one question per line.")
+    parser.add_argument("output", help="JSONL file the answers are appended to.")
+    parser.add_argument("--question-field", default=DEFAULT_QUESTION_FIELD)
+    parser.add_argument("--id-field", default=DEFAULT_ID_FIELD,
+                        help="Field identifying each question (default: line number).")
+    parser.add_argument("--concurrency", type=int,
+                        help=f"Questions answered at once (default: $BATCH_CONCURRENCY "
+                             f"or {DEFAULT_CONCURRENCY}).")
+    parser.add_argument("--rate", type=float,
+                        help=f"Graph runs started per second, 0 for unlimited "
+                             f"(default: $BATCH_RATE or {DEFAULT_RATE:g}).")
+    parser.add_argument("--restart", action="store_true",
+                        help="Discard the output instead of resuming from it.")
+    parser.add_argument("--stub", action="store_true",
+                        help="Use stub LLMs and fake embeddings (no API key needed).")
+    load_dotenv(".env")
+    parser.set_defaults(
+        concurrency=int(os.getenv("BATCH_CONCURRENCY", DEFAULT_CONCURRENCY)),
+        rate=float(os.getenv("BATCH_RATE", DEFAULT_RATE)),
+    )
+    args = parser.parse_args()
+
+    from src.server import build_default_graph
+
+    graph = build_default_graph(stub=args.stub)
+    summary = asyncio.run(run_batch(
+        graph,
+        iter_questions(args.questions, args.question_field, args.id_field),
+        args.output,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        resume=not args.restart,
+    ))
+    print(json.dumps(summary))
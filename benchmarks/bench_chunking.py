@@ -0,0 +1,78 @@
+"""
+Compares chunkers: chunk count, tokens to embed, duplicated (overlap)
+tokens, chunking time and in-memory index build time with fake embeddings.
+
+Run from the repository root:
+    python -m benchmarks.bench_chunking --chunkers structural recursive
+"""
+import argparse
+import time
+import uuid
+
+from langchain_community.document_loaders import TextLoader
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.document_loader import chunk_document
+from src.memory import get_token_encoder
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+DEFAULT_FILE = "data/ley-769-de-2002-codigo-nacional-de-transito_preprocessed.txt"
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def bench_chunker(chunker, text, source):
+    """
+    Chunks the document and indexes the chunks with fake embeddings.
+
+    Returns:
+        Dict with chunk and token counts and timings.
+    """
+    start = time.perf_counter()
+    chunks = chunk_document(text, source, chunker)
+    chunk_s = time.perf_counter() - start
+
+    encoder = get_token_encoder()
+    chunk_tokens = sum(len(encoder.encode(doc.page_content)) for doc in chunks)
+    text_tokens = len(encoder.encode(text))
+
+    start = time.perf_counter()
+    Chroma.from_documents(
+        chunks,
+        DeterministicFakeEmbedding(size=256),
+        collection_name=f"bench-{uuid.uuid4().hex[:8]}",
+    )
+    index_s = time.perf_counter() - start
+
+    return {
+        "chunks": len(chunks),
+        "tokens": chunk_tokens,
+        "extra_tokens": max(0, chunk_tokens - text_tokens),
+        "chunk_ms": chunk_s * 1000,
+        "index_s": index_s,
+    }
+
+# -------------------------------------
+# Entry Point (Script Execution)
+# -------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunkers", nargs="+", default=["structural", "recursive"])
+    parser.add_argument("--file", default=DEFAULT_FILE)
+    args = parser.parse_args()
+
+    text = TextLoader(args.file, encoding="utf-8").load()[0].page_content
+
+    print(f"{'chunker':<12} {'chunks':>7} {'tokens':>8} {'overlap':>8} "
+          f"{'chunk ms':>9} {'index s':>8}")
+    for chunker in args.chunkers:
+        result = bench_chunker(chunker, text, args.file)
+        print(f"{chunker:<12} {result['chunks']:>7} {result['tokens']:>8} "
+              f"{result['extra_tokens']:>8} {result['chunk_ms']:>9.1f} "
+              f"{result['index_s']:>8.2f}")
@@ -0,0 +1,82 @@
+"""
+Compares embedding backends: indexing throughput over the chunks of the
+preprocessed code and per-query latency. The on-disk cache is disabled so
+every text is actually embedded.
+
+Run from the repository root:
+    python -m benchmarks.bench_embeddings --backends openai local
+"""
+import argparse
+import statistics
+import time
+
+from langchain_community.document_loaders import TextLoader
+
+from src.document_loader import chunk_document
+from src.embeddings import get_embedding_model
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+DEFAULT_FILE = "data/ley-769-de-2002-codigo-nacional-de-transito_preprocessed.txt"
+
+QUESTIONS = [
+    "¿Puede una moto circular por la línea discontinua amarilla entre los carros?",
+    "¿Qué puedo hacer si un agente de tránsito me multa injustamente?",
+    "¿Quién regula las normas de tránsito en Colombia?",
+    "¿Cuál es la multa por no portar la licencia de conducción?",
+    "¿Cuándo inmovilizan un vehículo?",
+]
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def bench_backend(name, texts, query_rounds):
+    """
+    Returns indexing throughput and query latency figures for one backend.
+    """
+    model = get_embedding_model(name, cache_dir=None)
+
+    start = time.perf_counter()
+    model.embed_documents(texts)
+    index_seconds = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(query_rounds):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            model.embed_query(question)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    return {
+        "chunks_per_s": len(texts) / index_seconds,
+        "index_s": index_seconds,
+        "query_p50_ms": statistics.median(latencies),
+        "query_p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+# -------------------------------------
+# Entry Point (Script Execution)
+# -------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["openai", "local"])
+    parser.add_argument("--file", default=DEFAULT_FILE)
+    parser.add_argument("--query-rounds", type=int, default=4)
+    args = parser.parse_args()
+
+    text = TextLoader(args.file, encoding="utf-8").load()[0].page_content
+    chunks = chunk_document(text, args.file)
+    texts = [doc.page_content for doc in chunks]
+
+    print(f"{len(texts)} chunks")
+    print(f"{'backend':<40} {'chunks/s':>9} {'index s':>8} "
+          f"{'q p50 ms':>9} {'q p95 ms':>9}")
+    for name in args.backends:
+        result = bench_backend(name, texts, args.query_rounds)
+        print(f"{name:<40} {result['chunks_per_s']:>9.1f} {result['index_s']:>8.2f} "
+              f"{result['query_p50_ms']:>9.1f} {result['query_p95_ms']:>9.1f}")
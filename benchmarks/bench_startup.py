@@ -0,0 +1,110 @@
+"""
+Startup benchmark: import time of the chatbot modules (python -X importtime)
+and first-use cost of the lazy singletons. Importing must not build the
+text splitter or the embedding client.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup [--max-import-ms 1500]
+    python -m benchmarks.bench_startup --stub    # fake embeddings, no API key
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+MODULES = ["src.document_loader", "src.graph_wrapper", "src.retriever_utils"]
+
+# Embedding backend of the probe in --stub mode (see embeddings.create_backend)
+STUB_EMBEDDING_BACKEND = "fake"
+
+# Python snippet run in a fresh interpreter for each measurement
+PROBE = """
+import time
+start = time.perf_counter()
+import {modules}
+import_ms = (time.perf_counter() - start) * 1000
+
+from src import document_loader
+assert document_loader._text_splitter is None, "text splitter built at import"
+assert document_loader._embedding_model is None, "embedding model built at import"
+
+start = time.perf_counter()
+document_loader.get_text_splitter()
+splitter_ms = (time.perf_counter() - start) * 1000
+
+start = time.perf_counter()
+document_loader.get_shared_embedding_model()
+embedding_ms = (time.perf_counter() - start) * 1000
+
+print(f"{{import_ms:.1f}} {{splitter_ms:.1f}} {{embedding_ms:.1f}}")
+"""
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def slowest_imports(modules, top):
+    """
+    Runs python -X importtime and returns the top imports by cumulative
+    time, as (cumulative_us, self_us, module) tuples.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modules}"],
+        capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), module.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def probe(modules, stub=False):
+    """
+    Returns (import_ms, splitter_ms, embedding_ms) measured in a fresh
+    process; with ``stub``, the embedding model is a fake one.
+    """
+    env = dict(os.environ)
+    if stub:
+        env["EMBEDDING_BACKEND"] = STUB_EMBEDDING_BACKEND
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(modules=modules)],
+        capture_output=True, text=True, check=True, env=env
+    )
+    return tuple(float(value) for value in result.stdout.split())
+
+# -------------------------------------
+# Entry Point (Script Execution)
+# -------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-import-ms", type=float, default=None,
+                        help="Exit with an error if importing takes longer.")
+    parser.add_argument("--stub", action="store_true",
+                        help="Use fake embeddings (no API key needed).")
+    args = parser.parse_args()
+
+    modules = ", ".join(MODULES)
+
+    print(f"Slowest imports ({modules}):")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, module in slowest_imports(modules, args.top):
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {module}")
+
+    import_ms, splitter_ms, embedding_ms = probe(modules, stub=args.stub)
+    print()
+    print(f"import:                {import_ms:8.1f} ms")
+    print(f"first text splitter:   {splitter_ms:8.1f} ms")
+    print(f"first embedding model: {embedding_ms:8.1f} ms")
+
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        sys.exit(f"Import time regression: {import_ms:.1f} ms > {args.max_import_ms} ms")
@@ -0,0 +1,102 @@
+"""
+Micro-benchmark of get_unique_union against the previous implementation.
+
+Run from the repository root:
+    python -m benchmarks.bench_unique_union
+"""
+import random
+import timeit
+
+from langchain.load import dumps, loads
+from langchain_core.documents import Document
+
+from src.retriever_utils import get_unique_union
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+NUM_QUERIES = 5
+POOL_SIZE = 400
+REPEATS = 5
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def legacy_get_unique_union(documents):
+    """
+    Previous implementation: JSON round trip per document plus a linear
+    scan over every document for each unique key.
+    """
+    flattened_docs = [
+        dumps(doc.page_content + doc.metadata.get("source_article", ""))
+        for sublist in documents
+        for doc in sublist
+    ]
+    unique_docs = list(set(flattened_docs))
+
+    loaded_unique_docs = []
+    for doc_str in unique_docs:
+        doc = loads(doc_str)
+        original_doc = next(
+            (
+                d for sublist in documents
+                for d in sublist
+                if d.page_content + d.metadata.get("source_article", "") == doc
+            ),
+            None
+        )
+        if original_doc:
+            loaded_unique_docs.append(original_doc)
+
+    return loaded_unique_docs
+
+
+def make_results(k, seed=0):
+    """
+    Simulates NUM_QUERIES retrievals of k documents each, drawn from a
+    shared pool so that results overlap like reformulated queries do.
+    """
+    rng = random.Random(seed)
+    pool = [
+        Document(
+            page_content=f"Contenido del fragmento {i} " * 40,
+            metadata={"source_article": str(i % 170 + 1)}
+        )
+        for i in range(POOL_SIZE)
+    ]
+    hot = pool[: max(k, 8)]
+    return [
+        rng.sample(hot, k // 2) + rng.sample(pool, k - k // 2)
+        for _ in range(NUM_QUERIES)
+    ]
+
+
+def bench(func, documents, number):
+    """
+    Returns the best average time per call, in microseconds.
+    """
+    timer = timeit.Timer(lambda: func(documents))
+    return min(timer.repeat(repeat=REPEATS, number=number)) / number * 1e6
+
+# -------------------------------------
+# Entry Point (Script Execution)
+# -------------------------------------
+
+if __name__ == "__main__":
+    print(f"{'k':>4} {'legacy (us)':>12} {'first-seen (us)':>16} "
+          f"{'rrf (us)':>10} {'speedup':>8}")
+    for k in (4, 50):
+        documents = make_results(k)
+        assert {id(d) for d in legacy_get_unique_union(documents)} == \
+            {id(d) for d in get_unique_union(documents)}
+
+        number = 200 if k <= 4 else 20
+        legacy = bench(legacy_get_unique_union, documents, number)
+        first_seen = bench(get_unique_union, documents, number)
+        fused = bench(
+            lambda docs: get_unique_union(docs, fusion=True), documents, number
+        )
+        print(f"{k:>4} {legacy:>12.1f} {first_seen:>16.1f} "
+              f"{fused:>10.1f} {legacy / first_seen:>7.1f}x")
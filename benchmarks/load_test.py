@@ -0,0 +1,110 @@
+"""
+Load test for the HTTP server: sends questions from many concurrent
+conversations and reports throughput and latency percentiles.
+
+Start a server first, e.g. with stub LLMs:
+    python -m src.server --stub --stub-latency 0.5
+then, from the repository root:
+    python -m benchmarks.load_test --concurrency 32 --requests 500
+"""
+import argparse
+import asyncio
+import json
+import time
+import urllib.error
+import urllib.request
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+QUESTIONS = [
+    "¿Puede una moto circular por la línea discontinua amarilla entre los carros?",
+    "¿Qué puedo hacer si un agente de tránsito me multa injustamente?",
+    "¿Quién regula las normas de tránsito en Colombia?",
+    "¿Cuál es la multa por no portar la licencia de conducción?",
+    "¿Qué dice el artículo 131?",
+    "¿Cuándo inmovilizan un vehículo?",
+]
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def post_chat(url, message, conversation_id, timeout):
+    """
+    Sends one chat request; returns (status, latency_seconds).
+    """
+    body = json.dumps({"message": message, "conversation_id": conversation_id})
+    request = urllib.request.Request(
+        url, data=body.encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST"
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, TimeoutError):
+        status = 0
+    return status, time.perf_counter() - start
+
+
+def percentile(sorted_values, fraction):
+    """
+    Returns the nearest-rank percentile of an ascending list.
+    """
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+async def run_load(url, total_requests, concurrency, conversations, timeout):
+    """
+    Runs total_requests requests with at most `concurrency` in flight,
+    spread over `conversations` conversation ids.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def worker(i):
+        async with semaphore:
+            message = QUESTIONS[i % len(QUESTIONS)]
+            conversation_id = f"load-{i % conversations}"
+            results.append(await asyncio.to_thread(
+                post_chat, url, message, conversation_id, timeout
+            ))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(total_requests)))
+    return results, time.perf_counter() - start
+
+# -------------------------------------
+# Entry Point (Script Execution)
+# -------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000/chat")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    results, elapsed = asyncio.run(run_load(
+        args.url, args.requests, args.concurrency, args.conversations, args.timeout
+    ))
+
+    ok = sorted(latency for status, latency in results if status == 200)
+    rejected = sum(1 for status, _ in results if status == 503)
+    failed = len(results) - len(ok) - rejected
+
+    print(f"requests:    {len(results)} ({len(ok)} ok, {rejected} rejected, {failed} failed)")
+    print(f"elapsed:     {elapsed:.2f} s")
+    print(f"throughput:  {len(ok) / elapsed:.2f} req/s")
+    for label, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+        print(f"latency {label}: {percentile(ok, fraction) * 1000:.1f} ms")
@@ -0,0 +1,347 @@
+"""
+Offline evaluation and latency benchmark: runs a labeled question set
+through build_graph and reports per-node latency, tokens per request,
+retrieval recall@k against the labeled articles, and throughput.
+
+LLM and embedding calls go through record/replay stubs (src/stubs.py), so
+after one recording run the benchmark is offline and deterministic.
+
+Run from the repository root:
+    python -m benchmarks.run_bench --mode record --out base.json   # needs OPENAI_API_KEY
+    python -m benchmarks.run_bench --mode replay --out new.json
+    python -m benchmarks.run_bench --mode stub --out stub.json     # no recordings needed
+    python -m benchmarks.run_bench --compare base.json new.json
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+DEFAULT_FILE = "./data/ley-769-de-2002-codigo-nacional-de-transito_preprocessed.txt"
+DEFAULT_QUESTIONS = os.path.join("benchmarks", "questions.jsonl")
+DEFAULT_CASSETTE_DIR = os.path.join("benchmarks", "cassettes")
+
+# Models recorded in record mode (same as the build_graph defaults)
+RETRIEVER_MODEL = "gpt-3.5-turbo"
+GENERATOR_MODEL = "gpt-4"
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Metrics compared by --compare, with the direction that counts as better
+COMPARED_METRICS = [
+    ("latency_mean_ms", "lower"),
+    ("latency_p50_ms", "lower"),
+    ("latency_p95_ms", "lower"),
+    ("tokens_mean", "lower"),
+    ("llm_calls_mean", "lower"),
+    ("recall_at_k", "higher"),
+    ("throughput_qps", "higher"),
+]
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+class TokenCounter(BaseCallbackHandler):
+    """
+    Counts LLM calls and tokens of one request. Uses the provider's
+    usage_metadata when present (real or replayed responses) and falls back
+    to tiktoken estimates (stub models).
+    """
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._estimated_inputs = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        from src.memory import count_tokens
+        self._estimated_inputs[run_id] = sum(count_tokens(batch) for batch in messages)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        from src.memory import count_tokens
+        self.llm_calls += 1
+        estimated_input = self._estimated_inputs.pop(run_id, 0)
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    self.input_tokens += usage.get("input_tokens", 0)
+                    self.output_tokens += usage.get("output_tokens", 0)
+                elif message is not None:
+                    self.input_tokens += estimated_input
+                    self.output_tokens += count_tokens([message])
+                estimated_input = 0
+
+
+def load_questions(path):
+    """
+    Reads the labeled question set (one JSON object per line with id,
+    question and the expected articles).
+    """
+    with open(path, "r", encoding="utf-8") as infile:
+        return [json.loads(line) for line in infile if line.strip()]
+
+
+def percentile(sorted_values, fraction):
+    """
+    Returns the nearest-rank percentile of an ascending list.
+    """
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def build_pipeline(file_path, mode, cassette_dir, simulate_latency, features):
+    """
+    Builds the graph under test with stub, recording or replaying models.
+
+    Returns:
+        Tuple (graph, cassettes) where cassettes must be saved after a
+        recording run.
+    """
+    from src.context_packing import DEFAULT_CONTEXT_BUDGET
+    from src.graph_wrapper import build_graph
+    from src.lexical_index import LexicalIndex
+    from src.router import LocalRouter
+    from src.stubs import (
+        Cassette,
+        RecordReplayChatModel,
+        RecordReplayEmbeddings,
+        StubChatModel,
+        build_stub_vector_store,
+    )
+
+    cassettes = []
+    if mode == "stub":
+        embedding_model = None
+        retriever_llm, generator_llm = StubChatModel(), StubChatModel()
+    else:
+        cassette_mode = "record" if mode == "record" else "replay"
+        chat_cassette = Cassette(os.path.join(cassette_dir, "chat.json"), cassette_mode)
+        embedding_cassette = Cassette(
+            os.path.join(cassette_dir, "embeddings.json"), cassette_mode
+        )
+        cassettes = [chat_cassette, embedding_cassette]
+
+        retriever_underlying = generator_underlying = underlying_embeddings = None
+        if mode == "record":
+            from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+            retriever_underlying = ChatOpenAI(model=RETRIEVER_MODEL, temperature=0)
+            generator_underlying = ChatOpenAI(model=GENERATOR_MODEL, temperature=0)
+            underlying_embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+
+        embedding_model = RecordReplayEmbeddings(
+            embedding_cassette, EMBEDDING_MODEL, underlying=underlying_embeddings
+        )
+        retriever_llm = RecordReplayChatModel(
+            cassette=chat_cassette, model_name=RETRIEVER_MODEL,
+            underlying=retriever_underlying, simulate_latency=simulate_latency
+        )
+        generator_llm = RecordReplayChatModel(
+            cassette=chat_cassette, model_name=GENERATOR_MODEL,
+            underlying=generator_underlying, simulate_latency=simulate_latency
+        )
+
+    vector_store = build_stub_vector_store(file_path, embedding_model=embedding_model)
+
+    lexical_index = None
+    if "lexical" in features or "router" in features:
+        lexical_index = LexicalIndex.from_vector_store(vector_store)
+    graph = build_graph(
+        vector_store,
+        retriever_llm=retriever_llm,
+        generator_llm=generator_llm,
+        lexical_index=lexical_index if "lexical" in features else None,
+        router=LocalRouter(lexical_index=lexical_index) if "router" in features else None,
+        context_budget=DEFAULT_CONTEXT_BUDGET if "pack" in features else None,
+    )
+    return graph, cassettes
+
+
+def run_question(graph, item, k):
+    """
+    Runs one question through the graph.
+
+    Returns:
+        Dict with the total and per-node latency, token counts, the
+        retrieved articles and recall@k.
+    """
+    counter = TokenCounter()
+    inputs = {"messages": [{"role": "user", "content": item["question"]}]}
+    node_ms = {}
+    retrieved = []
+    answer = ""
+
+    start = last = time.perf_counter()
+    for update in graph.stream(
+        inputs, {"callbacks": [counter]}, stream_mode="updates"
+    ):
+        now = time.perf_counter()
+        for node, values in update.items():
+            node_ms[node] = node_ms.get(node, 0.0) + (now - last) * 1000
+            for msg in (values or {}).get("messages", []):
+                if getattr(msg, "type", None) == "tool" and msg.artifact:
+                    for doc in msg.artifact.get("docs", []):
+                        article_num = doc.metadata.get("source_article")
+                        if article_num not in retrieved:
+                            retrieved.append(article_num)
+                elif getattr(msg, "type", None) == "ai" and not msg.tool_calls:
+                    answer = msg.content
+        last = now
+    latency_ms = (time.perf_counter() - start) * 1000
+
+    expected = set(item.get("articles", []))
+    recall = len(expected & set(retrieved[:k])) / len(expected) if expected else None
+    return {
+        "id": item["id"],
+        "latency_ms": latency_ms,
+        "node_ms": node_ms,
+        "llm_calls": counter.llm_calls,
+        "input_tokens": counter.input_tokens,
+        "output_tokens": counter.output_tokens,
+        "retrieved_articles": retrieved,
+        "recall": recall,
+        "answer": answer,
+    }
+
+
+def summarize(rows, wall_s, k):
+    """
+    Aggregates per-question rows into the run summary.
+    """
+    latencies = sorted(row["latency_ms"] for row in rows)
+    recalls = [row["recall"] for row in rows if row["recall"] is not None]
+
+    nodes = sorted({node for row in rows for node in row["node_ms"]})
+    node_summary = {}
+    for node in nodes:
+        values = sorted(row["node_ms"][node] for row in rows if node in row["node_ms"])
+        node_summary[node] = {
+            "calls": len(values),
+            "mean_ms": statistics.fmean(values),
+            "p95_ms": percentile(values, 0.95),
+        }
+
+    return {
+        "questions": len(rows),
+        "k": k,
+        "latency_mean_ms": statistics.fmean(latencies),
+        "latency_p50_ms": percentile(latencies, 0.50),
+        "latency_p95_ms": percentile(latencies, 0.95),
+        "tokens_mean": statistics.fmean(
+            row["input_tokens"] + row["output_tokens"] for row in rows
+        ),
+        "llm_calls_mean": statistics.fmean(row["llm_calls"] for row in rows),
+        "recall_at_k": statistics.fmean(recalls) if recalls else float("nan"),
+        "throughput_qps": len(rows) / wall_s,
+        "nodes": node_summary,
+    }
+
+
+def print_summary(summary):
+    print(f"questions:    {summary['questions']}")
+    print(f"latency:      mean {summary['latency_mean_ms']:.1f} ms, "
+          f"p50 {summary['latency_p50_ms']:.1f} ms, p95 {summary['latency_p95_ms']:.1f} ms")
+    print(f"tokens/req:   {summary['tokens_mean']:.0f} ({summary['llm_calls_mean']:.2f} LLM calls)")
+    print(f"recall@{summary['k']}:    {summary['recall_at_k']:.3f}")
+    print(f"throughput:   {summary['throughput_qps']:.2f} questions/s")
+    for node, stats in summary["nodes"].items():
+        print(f"  {node:<20} {stats['calls']:>4} runs  "
+              f"mean {stats['mean_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms")
+
+
+def compare_runs(base_path, new_path):
+    """
+    Prints the change of every summary metric between two result files,
+    plus the per-node mean latency and the questions whose recall changed.
+    """
+    with open(base_path, "r", encoding="utf-8") as infile:
+        base = json.load(infile)
+    with open(new_path, "r", encoding="utf-8") as infile:
+        new = json.load(infile)
+
+    print(f"{'metric':<24}{'base':>12}{'new':>12}{'change':>10}")
+    rows = [(name, base["summary"][name], new["summary"][name], better)
+            for name, better in COMPARED_METRICS]
+    nodes = sorted(set(base["summary"]["nodes"]) | set(new["summary"]["nodes"]))
+    for node in nodes:
+        rows.append((
+            f"{node} mean_ms",
+            base["summary"]["nodes"].get(node, {}).get("mean_ms", float("nan")),
+            new["summary"]["nodes"].get(node, {}).get("mean_ms", float("nan")),
+            "lower",
+        ))
+    for name, old, current, better in rows:
+        change = (current - old) / old * 100 if old else float("nan")
+        improved = (change < 0) if better == "lower" else (change > 0)
+        marker = "" if abs(change) < 1 or change != change else (" +" if improved else " -")
+        print(f"{name:<24}{old:>12.2f}{current:>12.2f}{change:>9.1f}%{marker}")
+
+    base_recall = {row["id"]: row["recall"] for row in base["rows"]}
+    for row in new["rows"]:
+        old = base_recall.get(row["id"])
+        if old is not None and row["recall"] is not None and old != row["recall"]:
+            print(f"recall changed for {row['id']}: {old:.2f} -> {row['recall']:.2f}")
+
+# -------------------------------------
+# Entry Point (Script Execution)
+# -------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--file", default=DEFAULT_FILE)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--mode", choices=["stub", "record", "replay"], default="replay")
+    parser.add_argument("--cassette-dir", default=DEFAULT_CASSETTE_DIR)
+    parser.add_argument("--simulate-latency", action="store_true",
+                        help="Replay calls with the latency measured when recording.")
+    parser.add_argument("--features", default="lexical,router,pack",
+                        help="Comma-separated optional stages: lexical, router, pack.")
+    parser.add_argument("--k", type=int, default=5, help="Articles counted for recall@k.")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--out", help="Write per-question rows and the summary as JSON.")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="Diff two result files instead of running.")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_runs(*args.compare)
+    else:
+        from dotenv import load_dotenv
+        load_dotenv(".env")
+
+        features = {name.strip() for name in args.features.split(",") if name.strip()}
+        graph, cassettes = build_pipeline(
+            args.file, args.mode, args.cassette_dir, args.simulate_latency, features
+        )
+        questions = load_questions(args.questions)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            rows = list(executor.map(lambda item: run_question(graph, item, args.k), questions))
+        wall_s = time.perf_counter() - start
+
+        for cassette in cassettes:
+            cassette.save()
+
+        summary = summarize(rows, wall_s, args.k)
+        print_summary(summary)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as outfile:
+                json.dump({
+                    "mode": args.mode,
+                    "features": sorted(features),
+                    "summary": summary,
+                    "rows": rows,
+                }, outfile, ensure_ascii=False, indent=2)
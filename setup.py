@@ -16,6 +16,12 @@ setup(
         "python-dotenv>=1.1.0,<2.0.0",
         "tiktoken>=0.9.0,<1.0.0",
         "chromadb>=1.0.0,<1.1.0",
+        "numpy>=1.26.0",
         "streamlit>=1.33.0,<2.0.0"
     ],
+    extras_require={
+        "local": ["sentence-transformers>=3.0.0"],
+        "server": ["fastapi>=0.110.0", "uvicorn>=0.29.0"],
+        "pdf": ["pypdf>=4.0.0"],
+    },
 )
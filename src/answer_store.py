@@ -0,0 +1,374 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import numpy as np
+
+from .lexical_index import find_article_references
+from .query_cache import normalize_question
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# SQLite database of precomputed answers
+ANSWER_DB = os.path.join("data", "answers.sqlite3")
+
+# Minimum cosine similarity for a near-duplicate match
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+# Questions answered in parallel by the batch builder
+DEFAULT_BATCH_CONCURRENCY = 4
+
+# Index version of a store not yet validated against any index
+_UNCHECKED = object()
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def article_key(metadata):
+    """
+    Returns the key identifying the article of a chunk across the corpus.
+    """
+    article_num = metadata.get("source_article", "")
+    doc_id = metadata.get("doc_id")
+    return f"{doc_id}#{article_num}" if doc_id else article_num
+
+
+def article_fingerprints(vector_store):
+    """
+    Returns a content hash of every article stored in a vector store, so
+    answers can be invalidated when an article they cite changes.
+    """
+    stored = vector_store.get(include=["documents", "metadatas"])
+    chunks = defaultdict(list)
+    for text, metadata in zip(stored["documents"], stored["metadatas"]):
+        metadata = metadata or {}
+        chunks[article_key(metadata)].append((metadata.get("chunk_index", 0), text))
+
+    return {
+        key: hashlib.sha256(
+            "\n".join(text for _, text in sorted(parts)).encode("utf-8")
+        ).hexdigest()
+        for key, parts in chunks.items()
+    }
+
+
+def cited_articles(answer, docs):
+    """
+    Returns the article keys an answer relies on: the context articles it
+    cites by number, or every context article if it cites none of them.
+    """
+    context = {}
+    for doc in docs:
+        context.setdefault(doc.metadata.get("source_article", ""), set()).add(
+            article_key(doc.metadata)
+        )
+    cited = set()
+    for article_num in find_article_references(answer):
+        cited.update(context.get(article_num, ()))
+    if not cited:
+        cited = set().union(*context.values())
+    return sorted(cited)
+
+# ----------------------------
+# Answer Store
+# ----------------------------
+
+class AnswerStore:
+    """
+    SQLite store of precomputed answers with their cited articles.
+
+    Lookups match the normalized question exactly or, when an embedding
+    model is given, the closest stored question within
+    ``similarity_threshold`` cosine similarity (kept in memory as a
+    normalized embedding matrix). Each entry records the content hash of
+    its cited articles; ``check_index_version`` drops entries whose
+    articles changed when the index version changes.
+    """
+
+    def __init__(
+        self,
+        path=ANSWER_DB,
+        embedding_model=None,
+        similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD
+    ):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.embedding_model = embedding_model
+        self.similarity_threshold = similarity_threshold
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._index_version = _UNCHECKED
+        self._counters = {"exact_hits": 0, "near_hits": 0, "misses": 0, "invalidated": 0}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "question_key TEXT PRIMARY KEY, question TEXT NOT NULL, "
+                "answer TEXT NOT NULL, articles TEXT NOT NULL, "
+                "embedding BLOB, created_at REAL NOT NULL)"
+            )
+        self._load_embeddings()
+
+    def _load_embeddings(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question_key, embedding FROM answers WHERE embedding IS NOT NULL"
+            ).fetchall()
+            self._keys = [key for key, _ in rows]
+            self._rows = {key: i for i, key in enumerate(self._keys)}
+            self._vectors = [np.frombuffer(blob, dtype=np.float32) for _, blob in rows]
+            self._matrix = None
+
+    def _add_embedding(self, key, embedding):
+        # Caller holds the lock; the matrix is restacked on the next lookup
+        if key in self._rows:
+            self._vectors[self._rows[key]] = embedding
+        else:
+            self._rows[key] = len(self._keys)
+            self._keys.append(key)
+            self._vectors.append(embedding)
+        self._matrix = None
+
+    def _embedding_matrix(self):
+        with self._lock:
+            if self._matrix is None and self._vectors:
+                self._matrix = np.stack(self._vectors)
+            return self._matrix, self._keys
+
+    def _embed(self, normalized_question):
+        embedding = np.asarray(
+            self.embedding_model.embed_query(normalized_question), dtype=np.float32
+        )
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def get(self, question):
+        """
+        Returns the stored entry (question, answer, articles and match kind)
+        for the question or a near-duplicate of it, or None.
+        """
+        key = normalize_question(question)
+        match = "exact"
+        row = self._fetch(key)
+
+        matrix, keys = self._embedding_matrix()
+        if row is None and self.embedding_model is not None and matrix is not None:
+            similarities = matrix @ self._embed(key)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                row = self._fetch(keys[best])
+                match = "near"
+
+        with self._lock:
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters[f"{match}_hits"] += 1
+        return {
+            "question": row[0],
+            "answer": row[1],
+            "articles": list(json.loads(row[2])),
+            "match": match,
+        }
+
+    def _fetch(self, key):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT question, answer, articles FROM answers WHERE question_key = ?",
+                (key,)
+            ).fetchone()
+
+    def put(self, question, answer, article_hashes):
+        """
+        Stores an answer with the content hashes of its cited articles
+        ({article key: hash}).
+        """
+        key = normalize_question(question)
+        embedding = None
+        if self.embedding_model is not None:
+            embedding = self._embed(key)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                (key, question, answer, json.dumps(article_hashes, sort_keys=True),
+                 embedding.tobytes() if embedding is not None else None, time.time())
+            )
+            if embedding is not None:
+                self._add_embedding(key, embedding)
+
+    def invalidate_changed(self, fingerprints):
+        """
+        Deletes the entries citing an article whose content hash differs
+        from (or is missing in) ``fingerprints``.
+
+        Returns:
+            Number of deleted entries.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT question_key, articles FROM answers").fetchall()
+        stale = [
+            key for key, articles in rows
+            if any(fingerprints.get(article) != digest
+                   for article, digest in json.loads(articles).items())
+        ]
+        if stale:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "DELETE FROM answers WHERE question_key = ?", [(key,) for key in stale]
+                )
+                self._counters["invalidated"] += len(stale)
+            self._load_embeddings()
+        return len(stale)
+
+    def check_index_version(self, index_version, vector_store):
+        """
+        Re-validates the stored answers against the articles of the vector
+        store when its index version differs from the last one checked.
+        """
+        with self._lock:
+            if index_version == self._index_version:
+                return
+            self._index_version = index_version
+        self.invalidate_changed(article_fingerprints(vector_store))
+
+    def stats(self):
+        """
+        Returns hit/miss counters and the number of stored answers.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return stats
+
+# ----------------------------
+# Batch Generation
+# ----------------------------
+
+async def answer_with_docs(graph, question, config=None):
+    """
+    Runs a question through the graph and collects its final answer and
+    the documents retrieved for it from the node updates as they stream
+    (compact_memory prunes the tool messages from the final state).
+
+    Returns:
+        Tuple (answer, docs, timings): docs is empty if the question was
+        answered without retrieval, and timings are those of the last
+        retrieval.
+    """
+    answer, docs, timings = "", [], {}
+    async for update in graph.astream(
+        {"messages": [{"role": "user", "content": question}]},
+        config,
+        stream_mode="updates",
+    ):
+        for node_update in update.values():
+            if not isinstance(node_update, dict):
+                continue
+            for msg in node_update.get("messages", []):
+                if msg.type == "tool" and isinstance(getattr(msg, "artifact", None), dict):
+                    docs.extend(msg.artifact.get("docs", []))
+                    timings = msg.artifact.get("timings", {})
+                elif msg.type == "ai" and not msg.tool_calls:
+                    answer = msg.content
+    return answer, docs, timings
+
+
+async def build_answers(graph, store, questions, vector_store, concurrency=DEFAULT_BATCH_CONCURRENCY):
+    """
+    Answers the questions with the graph, at most ``concurrency`` at a
+    time, and stores every grounded answer with its cited articles.
+
+    Returns:
+        Dict with the stored, skipped (no retrieval or empty answer) and
+        failed questions.
+    """
+    fingerprints = article_fingerprints(vector_store)
+    semaphore = asyncio.Semaphore(concurrency)
+    result = {"stored": [], "skipped": [], "failed": []}
+
+    async def answer(question):
+        async with semaphore:
+            config = {"configurable": {"thread_id": f"batch-{uuid.uuid4().hex}"}}
+            try:
+                text, docs, _ = await answer_with_docs(graph, question, config)
+            except Exception as e:
+                result["failed"].append((question, str(e)))
+                return
+
+        if not text or not docs:
+            result["skipped"].append(question)
+            return
+        hashes = {
+            key: fingerprints[key]
+            for key in cited_articles(text, docs) if key in fingerprints
+        }
+        await asyncio.to_thread(store.put, question, text, hashes)
+        result["stored"].append(question)
+
+    await asyncio.gather(*(answer(question) for question in questions))
+    return result
+
+
+def load_question_list(path):
+    """
+    Reads questions from a text file (one per line) or a JSONL file with a
+    "question" field per line.
+    """
+    with open(path, "r", encoding="utf-8") as infile:
+        lines = [line.strip() for line in infile if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["question"] for line in lines]
+    return lines
+
+# -------------------------------------
+# Entry Point (Script Execution)
+# -------------------------------------
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(
+        description="Precompute answers to frequent questions."
+    )
+    parser.add_argument("questions", help="Text file (one question per line) or JSONL.")
+    parser.add_argument("--db", default=ANSWER_DB)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_BATCH_CONCURRENCY)
+    parser.add_argument("--corpus", default=None,
+                        help="Corpus manifest (default: data/corpus.json).")
+    parser.add_argument("--stub", action="store_true",
+                        help="Use stub LLMs and fake embeddings (no API key needed).")
+    args = parser.parse_args()
+
+    load_dotenv(".env")
+
+    from .server import DEFAULT_CORPUS, build_default_graph, build_default_index
+
+    index = build_default_index(stub=args.stub, corpus_path=args.corpus or DEFAULT_CORPUS)
+    graph = build_default_graph(stub=args.stub, index=index)
+    vector_store = index[0]
+    store = AnswerStore(args.db, embedding_model=vector_store.embeddings)
+
+    start = time.perf_counter()
+    summary = asyncio.run(build_answers(
+        graph, store, load_question_list(args.questions), vector_store, args.concurrency
+    ))
+    elapsed = time.perf_counter() - start
+
+    for question, error in summary["failed"]:
+        print(f"failed: {question}: {error}")
+    print(json.dumps({
+        "stored": len(summary["stored"]),
+        "skipped": len(summary["skipped"]),
+        "failed": len(summary["failed"]),
+        "elapsed_s": round(elapsed, 2),
+    }))
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+from .answer_store import answer_with_docs, cited_articles
+from .index_builder import DEFAULT_MAX_ATTEMPTS, retry_delay
+from .instrumentation import summarize_values
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Questions answered at once, and graph runs started per second (0: unlimited);
+# the command line reads BATCH_CONCURRENCY / BATCH_RATE after loading .env
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RATE = 2.0
+
+# Fields read from each input line
+DEFAULT_QUESTION_FIELD = "question"
+DEFAULT_ID_FIELD = "id"
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def iter_questions(path, question_field=DEFAULT_QUESTION_FIELD, id_field=DEFAULT_ID_FIELD):
+    """
+    Streams (item_id, question) pairs from a JSONL file. Items without an
+    id field are identified by their line number.
+    """
+    with open(path, "r", encoding="utf-8") as infile:
+        for line_number, line in enumerate(infile, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            item_id = record.get(id_field)
+            yield str(item_id if item_id is not None else line_number), record[question_field]
+
+
+def prepare_output(path):
+    """
+    Prepares an output file for resuming: keeps one line per id answered
+    without error and drops failed items (retried and written again) and a
+    last line cut off by an interruption.
+
+    Returns:
+        Set of the ids already answered.
+    """
+    done = set()
+    if not os.path.isfile(path):
+        return done
+    kept = []
+    with open(path, "r", encoding="utf-8") as infile:
+        for line in infile:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not record.get("error") and record["id"] not in done:
+                done.add(record["id"])
+                kept.append(line if line.endswith("\n") else line + "\n")
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as outfile:
+        outfile.writelines(kept)
+    os.replace(temp_path, path)
+    return done
+
+
+class RateLimiter:
+    """
+    Spaces out the start of requests to at most ``rate`` per second
+    (unlimited if rate is 0 or None).
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.perf_counter()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+# ----------------------------
+# Batch Runner
+# ----------------------------
+
+async def answer_question(graph, question, limiter, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Runs one question through the graph in a fresh conversation, retrying
+    failures with backoff (longer for rate limits).
+
+    Returns:
+        Dict with the answer, cited articles and timings.
+    """
+    for attempt in range(1, max_attempts + 1):
+        await limiter.wait()
+        config = {"configurable": {"thread_id": f"batch-{uuid.uuid4().hex}"}}
+        start = time.perf_counter()
+        try:
+            answer, docs, extraer_timings = await answer_with_docs(graph, question, config)
+            break
+        except Exception as e:
+            if attempt == max_attempts:
+                raise
+            delay = retry_delay(e, attempt)
+            logger.warning(
+                "Question failed (attempt %d/%d, retrying in %.1fs): %s",
+                attempt, max_attempts, delay, e
+            )
+            await asyncio.sleep(delay)
+    latency_ms = (time.perf_counter() - start) * 1000
+
+    timings = {"total_ms": latency_ms, "attempts": attempt}
+    if extraer_timings:
+        timings["extraer"] = extraer_timings
+    return {"answer": answer, "articles": cited_articles(answer, docs), "timings": timings}
+
+
+async def run_batch(
+    graph,
+    items,
+    output_path,
+    concurrency=DEFAULT_CONCURRENCY,
+    rate=DEFAULT_RATE,
+    resume=True
+):
+    """
+    Answers a stream of (item_id, question) pairs with the graph on a pool
+    of ``concurrency`` workers, starting at most ``rate`` runs per second,
+    and appends one JSON line per item to ``output_path`` as it finishes.
+    With ``resume``, items already answered in the output are skipped and
+    failed ones are retried, replacing their earlier line.
+
+    Returns:
+        Dict with the answered, failed and skipped counts, elapsed seconds,
+        throughput and latency percentiles of the answered items.
+    """
+    done = set()
+    if resume:
+        done = prepare_output(output_path)
+    elif os.path.isfile(output_path):
+        os.remove(output_path)
+
+    limiter = RateLimiter(rate)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    latencies = []
+    counts = {"answered": 0, "failed": 0, "skipped": 0}
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as outfile:
+
+        def write(record):
+            outfile.write(json.dumps(record, ensure_ascii=False) + "\n")
+            outfile.flush()
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                item_id, question = item
+                record = {"id": item_id, "question": question}
+                try:
+                    record.update(await answer_question(graph, question, limiter))
+                    latencies.append(record["timings"]["total_ms"])
+                    counts["answered"] += 1
+                except Exception as e:
+                    record["error"] = str(e)
+                    counts["failed"] += 1
+                write(record)
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            # Feed the questions lazily so huge inputs are never held in memory
+            for item_id, question in items:
+                if item_id in done:
+                    counts["skipped"] += 1
+                    continue
+                await queue.put((item_id, question))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+
+    elapsed = time.perf_counter() - start
+    summary = dict(counts, elapsed_s=round(elapsed, 2))
+    summary["throughput_qps"] = round(counts["answered"] / elapsed, 3) if elapsed else 0.0
+    if latencies:
+        stats = summarize_values(latencies)
+        summary.update({
+            f"latency_{name}_ms": round(stats[name], 1) for name in ("mean", "p50", "p95", "p99")
+        })
+    return summary
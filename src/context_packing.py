@@ -0,0 +1,178 @@
+from langchain_core.documents import Document
+
+from .lexical_index import LexicalIndex
+from .memory import get_token_encoder
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Token budget of the context pasted into the generation prompt
+DEFAULT_CONTEXT_BUDGET = 1500
+
+# Shortest suffix/prefix match treated as chunk overlap, in characters
+MIN_OVERLAP_CHARS = 20
+
+# Separator between non-contiguous chunks of the same article
+GAP_SEPARATOR = " [...] "
+
+# Default multilingual cross-encoder for the optional CPU reranker
+DEFAULT_CROSS_ENCODER = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+# ----------------------------
+# Rerankers
+# ----------------------------
+
+class LexicalReranker:
+    """
+    Scores chunks with BM25 computed over the candidate set, plus a small
+    prior that preserves the retrieval order on ties.
+    """
+
+    def score(self, question, docs):
+        index = LexicalIndex(docs)
+        bm25 = {id(doc): score for doc, score in index.search(question, k=len(docs))}
+        top = max(bm25.values(), default=0.0) or 1.0
+        return [
+            bm25.get(id(doc), 0.0) / top + 0.1 / (rank + 1)
+            for rank, doc in enumerate(docs)
+        ]
+
+
+class CrossEncoderReranker:
+    """
+    Scores (question, chunk) pairs with a sentence-transformers
+    cross-encoder running on CPU.
+    """
+
+    def __init__(self, model_name=DEFAULT_CROSS_ENCODER, batch_size=32):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "The cross-encoder reranker requires sentence-transformers: "
+                "pip install -e .[local]"
+            ) from e
+        self.batch_size = batch_size
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, question, docs):
+        pairs = [(question, doc.page_content) for doc in docs]
+        return [float(s) for s in self.model.predict(pairs, batch_size=self.batch_size)]
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def overlap_length(left, right):
+    """
+    Returns the length of the longest suffix of ``left`` that is a prefix
+    of ``right`` (0 if shorter than MIN_OVERLAP_CHARS).
+    """
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_chunks(texts):
+    """
+    Merges chunks of one article, given in text order, into a single text,
+    stitching chunks that overlap (as produced by the text splitter) and
+    marking gaps otherwise.
+    """
+    merged = []
+    for text in texts:
+        for i, current in enumerate(merged):
+            if text in current:
+                break
+            overlap = overlap_length(current, text)
+            if overlap:
+                merged[i] = current + text[overlap:]
+                break
+            overlap = overlap_length(text, current)
+            if overlap:
+                merged[i] = text + current[overlap:]
+                break
+        else:
+            merged.append(text)
+    return GAP_SEPARATOR.join(merged)
+
+# ----------------------------
+# Main Packing Function
+# ----------------------------
+
+def pack_context(question, docs, budget=DEFAULT_CONTEXT_BUDGET, reranker=None):
+    """
+    Reranks retrieved chunks, merges chunks of the same article and packs
+    the best articles into a token budget.
+
+    Args:
+        question (str): Question the context must answer.
+        docs (list): Retrieved (deduplicated) chunks.
+        budget (int): Maximum context tokens.
+        reranker: Object with a score(question, docs) method
+            (defaults to LexicalReranker).
+
+    Returns:
+        Tuple (packed_docs, stats) where stats reports the token and chunk
+        counts before and after packing.
+    """
+    encoder = get_token_encoder()
+    tokens_before = sum(len(encoder.encode(doc.page_content)) for doc in docs)
+    if not docs:
+        return [], {"tokens_before": 0, "tokens_after": 0, "tokens_saved": 0,
+                    "chunks_before": 0, "chunks_after": 0}
+
+    scores = (reranker or LexicalReranker()).score(question, docs)
+
+    # Group chunks by article (of each document, since the same number names
+    # different articles in other norms or versions); an article scores as
+    # its best chunk
+    articles = {}
+    for doc, score in zip(docs, scores):
+        key = (doc.metadata.get("doc_id"), doc.metadata.get("source_article", "N/A"))
+        entry = articles.setdefault(
+            key, {"score": score, "chunks": [], "metadata": dict(doc.metadata)}
+        )
+        entry["score"] = max(entry["score"], score)
+        entry["chunks"].append((score, doc.metadata.get("chunk_index", 0), doc.page_content))
+
+    packed = []
+    remaining = budget
+    for _, entry in sorted(
+        articles.items(), key=lambda item: item[1]["score"], reverse=True
+    ):
+        # Prefer the whole merged article; otherwise its best chunks that fit,
+        # merged in text order (chunk_index; retrieval order without one)
+        in_order = sorted(entry["chunks"], key=lambda chunk: chunk[1])
+        merged = merge_chunks([text for _, _, text in in_order])
+        merged_tokens = len(encoder.encode(merged))
+        if merged_tokens <= remaining:
+            selected = [merged]
+            remaining -= merged_tokens
+        else:
+            selected = []
+            for chunk in sorted(entry["chunks"], key=lambda chunk: chunk[0], reverse=True):
+                tokens = len(encoder.encode(chunk[2]))
+                if tokens <= remaining:
+                    selected.append(chunk)
+                    remaining -= tokens
+            selected = [text for _, _, text in sorted(selected, key=lambda chunk: chunk[1])]
+
+        if selected:
+            metadata = dict(entry["metadata"], merged_chunks=len(entry["chunks"]))
+            packed.append(Document(
+                page_content=merge_chunks(selected), metadata=metadata
+            ))
+        if remaining <= 0:
+            break
+
+    tokens_after = sum(len(encoder.encode(doc.page_content)) for doc in packed)
+    return packed, {
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": max(0, tokens_before - tokens_after),
+        "chunks_before": len(docs),
+        "chunks_after": len(packed),
+    }
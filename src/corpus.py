@@ -0,0 +1,281 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import date
+
+from langchain_community.document_loaders import TextLoader
+
+from .document_loader import (
+    DEFAULT_CHUNKER,
+    INDEX_ROOT,
+    chunk_document,
+    chunker_settings,
+    compute_index_key,
+    get_shared_embedding_model,
+    open_or_build_index,
+)
+from .lexical_index import fold_accents
+from .mmap_store import DEFAULT_MMAP_DTYPE, open_or_export
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Manifest listing the documents of the corpus
+CORPUS_MANIFEST = os.path.join("data", "corpus.json")
+
+# Validity bounds stored as YYYYMMDD integers (Chroma only compares numbers)
+OPEN_VALIDITY_END = 99991231
+
+# Words that introduce a norm, as written in questions
+NORM_TYPE_WORDS = {
+    "ley": r"ley",
+    "decreto": r"decreto",
+    "resolucion": r"resolucion",
+    "acuerdo": r"acuerdo",
+    "circular": r"circular",
+}
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def date_to_int(value):
+    """
+    Converts a date or ISO date string to a YYYYMMDD integer.
+    """
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def document_id(document):
+    """
+    Returns the id of one version of a norm, e.g. "ley-769-2002@original".
+    """
+    return f"{document['norm']}@{document.get('version', 'original')}"
+
+
+def norm_reference_pattern(document):
+    """
+    Returns a regex matching references to a norm in a folded question,
+    e.g. "ley 769", "ley 769 de 2002" or "resolucion no. 3027".
+    """
+    norm_type = fold_accents(document["type"])
+    type_word = NORM_TYPE_WORDS.get(norm_type, re.escape(norm_type))
+    return re.compile(
+        rf"\b{type_word}\s+(?:n[o°º]?\.?\s*)?{re.escape(str(document['number']))}\b"
+    )
+
+# ----------------------------
+# Corpus
+# ----------------------------
+
+class Corpus:
+    """
+    Set of norms (laws, decrees, resolutions) indexed together, each with
+    its version and validity dates.
+
+    Each document of the manifest has a ``norm`` id, ``type`` and
+    ``number`` (used to recognize references in questions), the ``path``
+    of its preprocessed text, and optionally ``title``, ``year``,
+    ``version``, ``valid_from`` and ``valid_to`` (ISO dates).
+
+    Every chunk is tagged with the norm, version, validity and document
+    id, so searches can be pre-filtered; ``scope`` resolves which documents
+    a question concerns from the manifest alone.
+    """
+
+    def __init__(self, documents, default_norm=None):
+        if not documents:
+            raise ValueError("A corpus needs at least one document")
+        self.documents = {document_id(document): document for document in documents}
+        self.default_norm = default_norm or documents[0]["norm"]
+        self._patterns = {
+            document["norm"]: norm_reference_pattern(document)
+            for document in documents
+            if "type" in document and "number" in document
+        }
+
+    @classmethod
+    def from_manifest(cls, path=CORPUS_MANIFEST):
+        """
+        Loads a corpus from its JSON manifest.
+        """
+        with open(path, "r", encoding="utf-8") as infile:
+            manifest = json.load(infile)
+        return cls(manifest["documents"], manifest.get("default_norm"))
+
+    @classmethod
+    def single(cls, file_path, norm="ley-769-2002", **metadata):
+        """
+        Wraps a single preprocessed document as a corpus.
+        """
+        return cls([dict(metadata, norm=norm, path=file_path)])
+
+    def document_metadata(self, doc_id):
+        """
+        Returns the metadata added to every chunk of a document.
+        """
+        document = self.documents[doc_id]
+        valid_from = document.get("valid_from")
+        valid_to = document.get("valid_to")
+        return {
+            "doc_id": doc_id,
+            "norm": document["norm"],
+            "doc_type": document.get("type", ""),
+            "version": document.get("version", "original"),
+            "valid_from": date_to_int(valid_from) if valid_from else 0,
+            "valid_to": date_to_int(valid_to) if valid_to else OPEN_VALIDITY_END,
+        }
+
+    def find_norms(self, question):
+        """
+        Returns the norms referenced in a question, in order of appearance.
+        """
+        folded = fold_accents(question)
+        found = []
+        for norm, pattern in self._patterns.items():
+            match = pattern.search(folded)
+            if match:
+                found.append((match.start(), norm))
+        return [norm for _, norm in sorted(found)]
+
+    def select(self, norms=None, versions=None, valid_on=None):
+        """
+        Returns the ids of the documents matching the given norms, versions
+        and validity date (None matches any).
+        """
+        day = date_to_int(valid_on) if valid_on is not None else None
+        selected = []
+        for doc_id in self.documents:
+            metadata = self.document_metadata(doc_id)
+            if norms is not None and metadata["norm"] not in norms:
+                continue
+            if versions is not None and metadata["version"] not in versions:
+                continue
+            if day is not None and not metadata["valid_from"] <= day <= metadata["valid_to"]:
+                continue
+            selected.append(doc_id)
+        return selected
+
+    def search_filter(self, doc_ids):
+        """
+        Returns the Chroma ``where`` filter restricting a search to the given
+        documents, or None when they are the whole corpus (or none, which
+        Chroma rejects as a filter).
+        """
+        if not doc_ids or set(doc_ids) == set(self.documents):
+            return None
+        return {"doc_id": {"$in": list(doc_ids)}}
+
+    def scope(self, question, valid_on=None):
+        """
+        Resolves the documents a question concerns: the norms it names (all
+        norms otherwise), in force on ``valid_on`` (today by default).
+        Article numbers are looked up in the first named norm, or in the
+        default norm. If no named norm is in force, every norm in force is
+        searched.
+
+        Returns:
+            Dict with doc_ids, article_doc_ids and the search filter.
+        """
+        valid_on = valid_on or date.today()
+        named = self.find_norms(question)
+        doc_ids = self.select(norms=named or None, valid_on=valid_on)
+        if not doc_ids:
+            # None of the named norms is in force: search every norm that is
+            logger.info("No version of %s in force on %s", named, valid_on)
+            doc_ids = self.select(valid_on=valid_on)
+        article_norm = named[0] if named else self.default_norm
+        return {
+            "doc_ids": doc_ids,
+            "article_doc_ids": self.select(norms=[article_norm], valid_on=valid_on),
+            "filter": self.search_filter(doc_ids),
+        }
+
+    def index_key(self, texts, embedding_model, chunker=DEFAULT_CHUNKER):
+        """
+        Content address of the corpus index: the keys of its documents and
+        their metadata.
+        """
+        digest = hashlib.sha256()
+        for doc_id in sorted(self.documents):
+            key = compute_index_key(texts[doc_id], embedding_model, chunker)
+            metadata = json.dumps(self.document_metadata(doc_id), sort_keys=True)
+            digest.update(key.encode("utf-8"))
+            digest.update(metadata.encode("utf-8"))
+        return digest.hexdigest()
+
+    def chunk(self, texts, chunker=DEFAULT_CHUNKER):
+        """
+        Chunks every document and tags the chunks with document metadata.
+        """
+        chunks = []
+        for doc_id, document in self.documents.items():
+            metadata = self.document_metadata(doc_id)
+            for chunk in chunk_document(texts[doc_id], document["path"], chunker):
+                chunk.metadata.update(metadata)
+                if "parent_id" in chunk.metadata:
+                    chunk.metadata["parent_id"] = f"{doc_id}#{chunk.metadata['parent_id']}"
+                chunks.append(chunk)
+        return chunks
+
+    def _load_texts(self):
+        return {
+            doc_id: TextLoader(document["path"], encoding="utf-8").load()[0].page_content
+            for doc_id, document in self.documents.items()
+        }
+
+    def build_vector_store(
+        self,
+        index_root=INDEX_ROOT,
+        embedding_model=None,
+        chunker=DEFAULT_CHUNKER,
+        texts=None
+    ):
+        """
+        Opens or builds the persisted index of the whole corpus (one
+        collection, content-addressed like load_and_process_document).
+        """
+        if embedding_model is None:
+            embedding_model = get_shared_embedding_model()
+        if texts is None:
+            texts = self._load_texts()
+        return open_or_build_index(
+            self.index_key(texts, embedding_model, chunker),
+            lambda: self.chunk(texts, chunker),
+            embedding_model,
+            index_root=index_root,
+            manifest_info={"documents": sorted(self.documents), **chunker_settings(chunker)},
+        )
+
+    def build_mmap_store(
+        self,
+        index_root=INDEX_ROOT,
+        embedding_model=None,
+        chunker=DEFAULT_CHUNKER,
+        dtype=DEFAULT_MMAP_DTYPE,
+        nlist=0
+    ):
+        """
+        Opens the read-only, memory-mapped export of the corpus index (see
+        mmap_store.py), exporting it from the Chroma index on first use.
+        Worker processes opening it share one page-cached copy.
+        """
+        if embedding_model is None:
+            embedding_model = get_shared_embedding_model()
+        texts = self._load_texts()
+        index_key = self.index_key(texts, embedding_model, chunker)
+        suffix = f"-ivf{nlist}" if nlist else ""
+        return open_or_export(
+            os.path.join(index_root, index_key[:16], f"mmap-{dtype}{suffix}"),
+            lambda: self.build_vector_store(index_root, embedding_model, chunker, texts),
+            embedding_model,
+            dtype=dtype,
+            nlist=nlist,
+        )
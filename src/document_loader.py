@@ -1,9 +1,21 @@
+import hashlib
+import json
+import os
 import re
+import shutil
+import threading
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import TextLoader
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
+
+from .embeddings import embedding_model_name, get_embedding_model
+from .index_builder import (
+    BUILD_CHECKPOINT,
+    add_documents_batched,
+    clear_checkpoint,
+)
+from .legal_structure import STRUCTURAL_CHUNK_TOKENS, split_structural
 
 # ----------------------------
 # Global Configuration
@@ -20,14 +32,57 @@ ARTICLE_PATTERN = re.compile(
     r"(?:ART[IÍ]CULO)\s+(\d+)", re.IGNORECASE
 )
 
-# Text splitter configuration for chunking
-TEXT_SPLITTER = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-    chunk_size=300,
-    chunk_overlap=50
-)
+# Chunker settings (also part of the index key, see compute_index_key)
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 50
+
+# Chunkers: "structural" (articles, parágrafos, numerales; see
+# legal_structure.py) or "recursive" (token windows per article section)
+STRUCTURAL_CHUNKER = "structural"
+RECURSIVE_CHUNKER = "recursive"
+DEFAULT_CHUNKER = STRUCTURAL_CHUNKER
+
+# Process-wide singletons, built on first use (see get_text_splitter and
+# get_shared_embedding_model) so importing this module has no side effects
+_text_splitter = None
+_embedding_model = None
+_singleton_lock = threading.Lock()
+
+# Root directory for persisted, content-addressed vector indexes
+INDEX_ROOT = os.path.join("data", "index")
+
+# Marker written once an index has been fully built
+INDEX_MANIFEST = "index.json"
+
+# ----------------------------
+# Lazy Singletons
+# ----------------------------
 
-# OpenAI embedding model instance
-EMBEDDING_MODEL = OpenAIEmbeddings()
+def get_text_splitter():
+    """
+    Returns the process-wide tiktoken-backed text splitter used for
+    chunking, building it on first use.
+    """
+    global _text_splitter
+    with _singleton_lock:
+        if _text_splitter is None:
+            _text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+                chunk_size=CHUNK_SIZE,
+                chunk_overlap=CHUNK_OVERLAP
+            )
+        return _text_splitter
+
+
+def get_shared_embedding_model():
+    """
+    Returns the process-wide embedding model (backend set by
+    EMBEDDING_BACKEND, cached on disk), building it on first use.
+    """
+    global _embedding_model
+    with _singleton_lock:
+        if _embedding_model is None:
+            _embedding_model = get_embedding_model()
+        return _embedding_model
 
 # ----------------------------
 # Helper Functions
@@ -70,17 +125,191 @@ def extract_article_sections(text):
 
     return article_sections
 
+
+def split_article_sections(article_sections, source):
+    """
+    Splits article sections into smaller documents with metadata.
+
+    Returns:
+        List of Document chunks tagged with source and source_article.
+    """
+    return [
+        doc
+        for section_text, article_num in article_sections
+        for doc in get_text_splitter().create_documents(
+            texts=[section_text],
+            metadatas=[{
+                "source": source,
+                "source_article": article_num
+            }]
+        )
+    ]
+
+
+def chunker_settings(chunker=DEFAULT_CHUNKER):
+    """
+    Returns the settings that determine the chunks produced by a chunker.
+    """
+    if chunker == STRUCTURAL_CHUNKER:
+        return {"chunker": chunker, "max_tokens": STRUCTURAL_CHUNK_TOKENS}
+    if chunker == RECURSIVE_CHUNKER:
+        return {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+    raise ValueError(f"Unknown chunker: {chunker}")
+
+
+def chunk_document(text, source, chunker=DEFAULT_CHUNKER):
+    """
+    Splits a preprocessed document into Document chunks with the given
+    chunker.
+    """
+    if chunker == STRUCTURAL_CHUNKER:
+        return split_structural(text, source)
+    if chunker == RECURSIVE_CHUNKER:
+        return split_article_sections(extract_article_sections(text), source)
+    raise ValueError(f"Unknown chunker: {chunker}")
+
+
+def compute_index_key(text, embedding_model, chunker=DEFAULT_CHUNKER):
+    """
+    Computes the content address of an index: a hash of the preprocessed
+    text, the chunker settings and the embedding model name. Any change in
+    one of those inputs yields a different key and therefore a rebuild.
+    """
+    digest = hashlib.sha256()
+    digest.update(text.encode("utf-8"))
+    settings = dict(chunker_settings(chunker))
+    settings["embedding_model"] = embedding_model_name(embedding_model)
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_index_version(vector_store):
+    """
+    Returns the index key of a vector store (the ``index_version`` attribute
+    or the collection metadata entry), or None for indexes built without one.
+    """
+    if hasattr(vector_store, "index_version"):
+        return vector_store.index_version
+    collection = getattr(vector_store, "_collection", None)
+    metadata = getattr(collection, "metadata", None) or {}
+    return metadata.get("index_version")
+
 # ----------------------------
 # Main Processing Function
 # ----------------------------
 
-def load_and_process_document(file_path):
+def open_or_build_index(
+    index_key,
+    build_chunks,
+    embedding_model,
+    index_root=INDEX_ROOT,
+    manifest_info=None,
+    batch_size=None,
+    workers=None
+):
+    """
+    Opens the persisted index with the given content address, or builds it
+    from the chunks returned by ``build_chunks()`` and marks it complete.
+
+    Chunks are embedded in batches on a bounded worker pool, with retries
+    on rate limits (see index_builder.py). Finished batches are
+    checkpointed, so an interrupted build resumes where it stopped.
+
+    Args:
+        index_key (str): Content address of the index.
+        build_chunks (callable): Returns the Document chunks to index; only
+            called when the index has to be built.
+        embedding_model: Embedding model of the index.
+        index_root (str): Directory holding persisted indexes, or None for
+            an in-memory index.
+        manifest_info (dict): Extra entries for the index manifest.
+        batch_size (int): Chunks embedded per request (default:
+            INDEX_BATCH_SIZE or 128).
+        workers (int): Embedding requests in flight at once (default:
+            INDEX_WORKERS or 4).
+
+    Returns:
+        Chroma vector store instance.
+    """
+    collection_name = f"cnt-{index_key[:16]}"
+    collection_metadata = {"index_version": index_key}
+
+    if index_root is None:
+        persist_directory = None
+    else:
+        persist_directory = os.path.join(index_root, index_key[:16])
+        manifest_path = os.path.join(persist_directory, INDEX_MANIFEST)
+
+        # Reuse a complete index built from the same inputs
+        if os.path.isfile(manifest_path):
+            return Chroma(
+                collection_name=collection_name,
+                embedding_function=embedding_model,
+                persist_directory=persist_directory,
+                collection_metadata=collection_metadata,
+            )
+
+        # Discard leftovers of an interrupted build that cannot be resumed
+        checkpoint_path = os.path.join(persist_directory, BUILD_CHECKPOINT)
+        if os.path.isdir(persist_directory) and not os.path.isfile(checkpoint_path):
+            shutil.rmtree(persist_directory)
+        os.makedirs(persist_directory, exist_ok=True)
+
+    splits = build_chunks()
+
+    # Build vector index
+    vector_store = Chroma(
+        collection_name=collection_name,
+        embedding_function=embedding_model,
+        persist_directory=persist_directory,
+        collection_metadata=collection_metadata,
+    )
+    build_stats = add_documents_batched(
+        vector_store,
+        splits,
+        embedding_model,
+        index_key,
+        persist_directory=persist_directory,
+        batch_size=batch_size,
+        workers=workers,
+    )
+
+    if persist_directory is not None:
+        with open(manifest_path, "w", encoding="utf-8") as manifest:
+            json.dump({
+                "index_version": index_key,
+                "embedding_model": embedding_model_name(embedding_model),
+                **(manifest_info or {}),
+                "num_chunks": len(splits),
+                "build_stats": build_stats,
+            }, manifest, indent=2)
+        clear_checkpoint(persist_directory)
+
+    return vector_store
+
+
+def load_and_process_document(
+    file_path,
+    index_root=INDEX_ROOT,
+    embedding_model=None,
+    chunker=DEFAULT_CHUNKER
+):
     """
     Loads a text document and processes it into a vector store
     by splitting into article-based chunks and generating embeddings.
 
+    The index is persisted under ``index_root`` in a directory named after
+    its content address (see compute_index_key). If a complete index for
+    the same inputs already exists it is opened directly; otherwise it is
+    rebuilt.
+
     Args:
         file_path (str): Path to the input text file.
+        index_root (str): Directory holding persisted indexes. Pass None
+            to build an in-memory index.
+        embedding_model: Embedding model to use (defaults to the shared one,
+            see get_shared_embedding_model).
+        chunker (str): "structural" (default) or "recursive".
 
     Returns:
         Chroma vector store instance for semantic search.
@@ -88,21 +317,13 @@ def load_and_process_document(file_path):
     # Load document content
     text = TextLoader(file_path, encoding="utf-8").load()[0].page_content
 
-    # Extract article-based sections
-    article_sections = extract_article_sections(text)
-
-    # Split sections into smaller documents with metadata
-    splits = [
-        doc
-        for section_text, article_num in article_sections
-        for doc in TEXT_SPLITTER.create_documents(
-            texts=[section_text],
-            metadatas=[{
-                "source": file_path,
-                "source_article": article_num
-            }]
-        )
-    ]
+    if embedding_model is None:
+        embedding_model = get_shared_embedding_model()
 
-    # Build and return vector index
-    return Chroma.from_documents(splits, EMBEDDING_MODEL)
+    return open_or_build_index(
+        compute_index_key(text, embedding_model, chunker),
+        lambda: chunk_document(text, file_path, chunker),
+        embedding_model,
+        index_root=index_root,
+        manifest_info={"source": file_path, **chunker_settings(chunker)},
+    )
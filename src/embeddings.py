@@ -0,0 +1,271 @@
+import asyncio
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_core.embeddings import Embeddings
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Backend used when none is given, e.g. "openai", "local" or
+# "local:<sentence-transformers model>"; overridden by EMBEDDING_BACKEND,
+# read when the model is created
+EMBEDDING_BACKEND_ENV = "EMBEDDING_BACKEND"
+DEFAULT_EMBEDDING_BACKEND = "openai"
+
+# Default local model (multilingual, runs on CPU)
+DEFAULT_LOCAL_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# Texts per encoding batch and encoding threads of the local backend
+# (overridden by LOCAL_EMBEDDING_BATCH_SIZE / LOCAL_EMBEDDING_WORKERS)
+DEFAULT_LOCAL_BATCH_SIZE = 64
+DEFAULT_LOCAL_WORKERS = 1
+
+# On-disk cache of embeddings keyed by text hash
+EMBEDDING_CACHE_DIR = os.path.join("data", "embedding_cache")
+
+# ----------------------------
+# Local Embedding Backend
+# ----------------------------
+
+class LocalEmbeddings(Embeddings):
+    """
+    Sentence-transformers embeddings computed locally on CPU.
+
+    Texts are encoded in vectorized batches of ``batch_size``; with
+    ``num_workers`` > 1 the batches are spread over a thread pool (the
+    underlying tensor ops release the GIL).
+    """
+
+    def __init__(
+        self,
+        model_name=DEFAULT_LOCAL_MODEL,
+        batch_size=DEFAULT_LOCAL_BATCH_SIZE,
+        num_workers=DEFAULT_LOCAL_WORKERS,
+        device="cpu"
+    ):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "The local embedding backend requires sentence-transformers: "
+                "pip install -e .[local]"
+            ) from e
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.model = SentenceTransformer(model_name, device=device)
+
+    def _encode(self, texts):
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        ).tolist()
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if self.num_workers <= 1 or len(texts) <= self.batch_size:
+            return self._encode(texts)
+
+        batches = [
+            texts[i:i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            return [
+                embedding
+                for batch in executor.map(self._encode, batches)
+                for embedding in batch
+            ]
+
+    def embed_query(self, text):
+        return self._encode([text])[0]
+
+# ----------------------------
+# Request Batching
+# ----------------------------
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Coalesces concurrent async embedding requests (e.g. from many HTTP
+    sessions) into batched calls to the underlying model.
+
+    Requests arriving within ``max_wait`` seconds of each other are sent
+    together, up to ``max_batch_size`` texts per call. Sync calls are
+    passed through unchanged.
+    """
+
+    def __init__(self, underlying_embeddings, max_batch_size=64, max_wait=0.005):
+        self.underlying_embeddings = underlying_embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending = []
+        self._flush_handle = None
+        # Running flushes, referenced so they are not garbage-collected
+        self._flush_tasks = set()
+        self._query_model = None
+
+    def embed_documents(self, texts):
+        return self.underlying_embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.underlying_embeddings.embed_query(text)
+
+    def for_queries(self):
+        """
+        Returns the batching model used for search queries, which skips the
+        on-disk cache of the underlying model (built once and shared, so
+        concurrent queries are still coalesced).
+        """
+        if not isinstance(self.underlying_embeddings, CacheBackedEmbeddings):
+            return self
+        if self._query_model is None:
+            self._query_model = BatchingEmbeddings(
+                self.underlying_embeddings.underlying_embeddings,
+                max_batch_size=self.max_batch_size,
+                max_wait=self.max_wait,
+            )
+        return self._query_model
+
+    async def aembed_documents(self, texts):
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._schedule_flush(loop, delay=0)
+        elif self._flush_handle is None:
+            self._schedule_flush(loop, delay=self.max_wait)
+
+        return list(await asyncio.gather(*futures))
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    def _schedule_flush(self, loop, delay):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush_handle = loop.call_later(delay, self._start_flush, loop)
+
+    def _start_flush(self, loop):
+        task = loop.create_task(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self):
+        self._flush_handle = None
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            try:
+                embeddings = await self.underlying_embeddings.aembed_documents(
+                    [text for text, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+# ----------------------------
+# Backend Factory
+# ----------------------------
+
+def create_backend(name, batch_size=None, num_workers=None):
+    """
+    Instantiates an embedding backend from its name:
+    "openai[:<model>]", "local[:<sentence-transformers model>]" or
+    "fake[:<size>]" (deterministic fake embeddings, for offline runs).
+
+    ``batch_size`` and ``num_workers`` configure the local backend's
+    batched, multi-threaded encoding (by default LOCAL_EMBEDDING_BATCH_SIZE
+    and LOCAL_EMBEDDING_WORKERS, or DEFAULT_LOCAL_BATCH_SIZE and
+    DEFAULT_LOCAL_WORKERS).
+    """
+    backend, _, model = name.partition(":")
+
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=model) if model else OpenAIEmbeddings()
+
+    if backend == "local":
+        return LocalEmbeddings(
+            model_name=model or DEFAULT_LOCAL_MODEL,
+            batch_size=batch_size or int(
+                os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", DEFAULT_LOCAL_BATCH_SIZE)
+            ),
+            num_workers=num_workers or int(
+                os.getenv("LOCAL_EMBEDDING_WORKERS", DEFAULT_LOCAL_WORKERS)
+            ),
+        )
+
+    if backend == "fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        return DeterministicFakeEmbedding(size=int(model or 256))
+
+    raise ValueError(f"Unknown embedding backend: {name}")
+
+
+def get_embedding_model(name=None, cache_dir=EMBEDDING_CACHE_DIR, **backend_options):
+    """
+    Returns the configured embedding model, wrapped in an on-disk cache
+    keyed by text hash (pass cache_dir=None to disable it). Extra keyword
+    arguments are passed to create_backend.
+    """
+    underlying = create_backend(
+        name or os.getenv(EMBEDDING_BACKEND_ENV, DEFAULT_EMBEDDING_BACKEND),
+        **backend_options
+    )
+    if cache_dir is None:
+        return underlying
+
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying,
+        LocalFileStore(cache_dir),
+        namespace=re.sub(r"[^a-zA-Z0-9_.-]", "_", embedding_model_name(underlying)),
+        query_embedding_cache=True,
+    )
+
+
+def query_embedding_model(embedding_model):
+    """
+    Returns the model used to embed search queries: the given one without
+    its on-disk cache, so LLM-generated reformulations, which rarely
+    repeat, never grow the (unevicted) document cache.
+    """
+    if isinstance(embedding_model, CacheBackedEmbeddings):
+        return embedding_model.underlying_embeddings
+    if isinstance(embedding_model, BatchingEmbeddings):
+        return embedding_model.for_queries()
+    return embedding_model
+
+
+def embedding_model_name(embedding_model):
+    """
+    Returns a stable name for an embedding model instance (looking through
+    cache wrappers), used to tell apart indexes and caches built with
+    different models.
+    """
+    while hasattr(embedding_model, "underlying_embeddings"):
+        embedding_model = embedding_model.underlying_embeddings
+    # model_name first: LocalEmbeddings.model is the loaded model object,
+    # whose repr does not name the checkpoint
+    for attr in ("model_name", "model", "size"):
+        name = getattr(embedding_model, attr, None)
+        if isinstance(name, (str, int)) and name:
+            return f"{type(embedding_model).__name__}:{name}"
+    return type(embedding_model).__name__
@@ -0,0 +1,350 @@
+import argparse
+import json
+import re
+import threading
+
+from .legal_structure import LITERAL_UNIT, NUMERAL_UNIT, parse_structure
+from .lexical_index import STOPWORDS, TOKEN_PATTERN, fold_accents, stem
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Opening line of a group of infractions sharing a fine, e.g. "A. Será
+# sancionado con multa equivalente a cuatro (4) salarios mínimos legales
+# diarios vigentes, el conductor de ... que incurra en ..."
+FINE_PATTERN = re.compile(
+    r"multa equivalente a\s+(?P<words>[^()]+?)\s*\((?P<amount>\d+)\)\s*"
+    r"salarios m[ií]nimos legales diarios vigentes,?\s*(?P<subject>.*?)"
+    r"(?:\s+que incurra en cualquiera de las siguientes infracciones)?:?\s*$",
+    re.IGNORECASE
+)
+
+# Lines that qualify the previous infraction instead of listing a new one
+NOTE_PREFIXES = (
+    "además", "adicionalmente", "al infractor", "así mismo", "en estos casos",
+    "en este caso", "en caso de", "en todos los casos", "las autoridades",
+    "ver ", "texto subrayado", "acuerdo", "inexequible", "exequible",
+)
+
+# Words that continue a "Conducir un vehículo:" lead-in line
+CONTINUATION_WORDS = ("sin", "con", "en", "por", "de", "a")
+
+# Function words kept when matching infractions: they flip their meaning
+# ("sin licencia" vs. "con la licencia vencida")
+MEANINGFUL_STOPWORDS = frozenset({"sin", "con", "no"})
+
+# Question words signalling a fine lookup
+FINE_INTENT_WORDS = (
+    "multa multas sanción sanciones sancionado cuánto cuánta cuesta valor "
+    "pagar paga infracción comparendo monto"
+)
+
+# Traffic vocabulary shared by most infractions, ignored when matching:
+# on its own it would pick an arbitrary one ("conducir un vehículo")
+GENERIC_WORDS = frozenset(
+    "vehiculo vehiculos automotor automotores conducir conduce conduzca "
+    "conduciendo conductor conductores conduccion transitar transite "
+    "transitando transito velocidad via vias".split()
+)
+
+# Share of the question's words an infraction must contain, and share of
+# the infraction's words the question must contain, to be served without
+# generation; the stem prefix length used to match word forms
+MIN_COVERAGE = 0.75
+MIN_ITEM_COVERAGE = 0.5
+MATCH_PREFIX_LENGTH = 5
+
+# A match is ambiguous when another infraction scores at least this share
+# of the best score
+MAX_RUNNER_UP_RATIO = 0.8
+
+# Default output of the command line
+FINES_TABLE = "data/fines.json"
+
+# Questions checked by the command line (--check) against the code's text:
+# the infraction each must match, or None if it must fall back to generation
+REGRESSION_CASES = (
+    ("¿Cuál es la multa por conducir con la licencia vencida?", "B02"),
+    ("Multa por placas adulteradas", "B04"),
+    ("¿Cuánto es la multa por estacionar en sitio prohibido?", "C02"),
+    ("Multa por no usar el cinturón de seguridad", "C06"),
+    ("Multa por exceso de velocidad", None),
+    ("¿Cuál es la multa por conducir un vehículo?", None),
+    ("¿Cuál es la multa por conducir sin licencia?", None),
+)
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def match_terms(text):
+    """
+    Returns the terms used to match questions with infractions: stems
+    (cut to MATCH_PREFIX_LENGTH, so "estacionar" matches "estacionado") of
+    the content words other than GENERIC_WORDS, and of sin/con/no.
+    """
+    terms = set()
+    for token in TOKEN_PATTERN.findall(fold_accents(text)):
+        if token in STOPWORDS and token not in MEANINGFUL_STOPWORDS:
+            continue
+        if token in GENERIC_WORDS:
+            continue
+        terms.add(stem(token)[:MATCH_PREFIX_LENGTH])
+    return terms
+
+
+INTENT_TERMS = frozenset(match_terms(FINE_INTENT_WORDS))
+
+
+def is_note(line):
+    return fold_accents(line).startswith(tuple(fold_accents(p) for p in NOTE_PREFIXES))
+
+
+def parse_group(segment_text, label):
+    """
+    Parses a literal or numeral that opens with a fine into its fine and
+    its infractions (one per line), numbered within the group.
+
+    Returns:
+        Dict with the group's fine, or None if the segment sets no fine.
+    """
+    lines = [line.strip() for line in segment_text.split("\n") if line.strip()]
+    match = FINE_PATTERN.search(lines[0]) if lines else None
+    if match is None:
+        return None
+
+    infractions = []
+    lead_in = ""
+    for line in lines[1:]:
+        if is_note(line):
+            lead_in = ""
+            if infractions:
+                infractions[-1]["notes"].append(line)
+            continue
+        if line.endswith(":"):
+            lead_in = line[:-1]
+            continue
+        if lead_in and line.split()[0].lower() in CONTINUATION_WORDS:
+            description = f"{lead_in} {line[0].lower()}{line[1:]}"
+        else:
+            lead_in = ""
+            description = line
+        infractions.append({
+            "code": f"{label.upper()}{len(infractions) + 1:02d}",
+            "description": description,
+            "notes": [],
+        })
+
+    return {
+        "label": label,
+        "amount_smldv": int(match.group("amount")),
+        "amount_text": f"{match.group('words').strip()} ({match.group('amount')})",
+        "subject": match.group("subject").strip(),
+        "infractions": infractions,
+    }
+
+
+def parse_fines(text, source=None, metadata=None):
+    """
+    Builds the infractions table of a preprocessed legal text: every
+    literal or numeral that sets a fine in salarios mínimos (article 131 of
+    the code) and the infractions listed under it.
+
+    Returns:
+        List of infraction dicts with code, description, notes, article,
+        literal, fine (amount_smldv, amount_text) and subject, plus the
+        given metadata (e.g. doc_id and norm).
+    """
+    table = []
+    for article in parse_structure(text):
+        for unit_type, label, segment_text in article["segments"]:
+            if unit_type not in (LITERAL_UNIT, NUMERAL_UNIT):
+                continue
+            group = parse_group(segment_text, label)
+            if group is None:
+                continue
+            for infraction in group["infractions"]:
+                table.append({
+                    **infraction,
+                    "article": article["number"],
+                    "literal": group["label"],
+                    "amount_smldv": group["amount_smldv"],
+                    "amount_text": group["amount_text"],
+                    "subject": group["subject"],
+                    "source": source,
+                    **(metadata or {}),
+                })
+    return table
+
+# ----------------------------
+# Fines Table
+# ----------------------------
+
+class FinesTable:
+    """
+    Table of infractions and their fines, answering fine lookups
+    ("¿cuál es la multa por ...?") extractively, with the article citation.
+
+    A question is answered only when it asks about a fine and one
+    infraction clearly matches it: it contains at least MIN_COVERAGE of
+    the question's words, the question contains at least
+    MIN_ITEM_COVERAGE of its words, and no other infraction comes close
+    (see MAX_RUNNER_UP_RATIO) or contains as many of the question's words.
+    Other questions fall back to the generation
+    pipeline.
+    """
+
+    def __init__(
+        self,
+        infractions,
+        min_coverage=MIN_COVERAGE,
+        min_item_coverage=MIN_ITEM_COVERAGE
+    ):
+        self.infractions = list(infractions)
+        self.min_coverage = min_coverage
+        self.min_item_coverage = min_item_coverage
+        self._terms = [match_terms(item["description"]) for item in self.infractions]
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+
+    @classmethod
+    def from_file(cls, file_path, **kwargs):
+        """
+        Parses the table from a preprocessed text file.
+        """
+        with open(file_path, "r", encoding="utf-8") as infile:
+            return cls(parse_fines(infile.read(), source=file_path), **kwargs)
+
+    @classmethod
+    def from_corpus(cls, corpus, **kwargs):
+        """
+        Parses the table from every document of a Corpus, tagging each
+        infraction with its doc_id and norm.
+        """
+        infractions = []
+        for doc_id, document in corpus.documents.items():
+            with open(document["path"], "r", encoding="utf-8") as infile:
+                infractions += parse_fines(
+                    infile.read(),
+                    source=document["path"],
+                    metadata={"doc_id": doc_id, "norm": document["norm"]},
+                )
+        return cls(infractions, **kwargs)
+
+    def match(self, question, doc_ids=None):
+        """
+        Returns the infraction a fine question asks about, or None when the
+        question is not a fine lookup or no infraction matches clearly.
+        """
+        terms = match_terms(question)
+        if not terms & INTENT_TERMS:
+            return None
+        terms -= INTENT_TERMS
+        if not terms:
+            return None
+
+        scored = []
+        for item, item_terms in zip(self.infractions, self._terms):
+            if doc_ids is not None and item.get("doc_id") not in doc_ids:
+                continue
+            matched = len(terms & item_terms)
+            if matched:
+                coverage = matched / len(terms)
+                item_coverage = matched / len(item_terms)
+                scored.append((coverage * item_coverage, coverage, item_coverage, item))
+        if not scored:
+            return None
+
+        scored.sort(key=lambda entry: entry[0], reverse=True)
+        best_score, coverage, item_coverage, best = scored[0]
+        if coverage < self.min_coverage or item_coverage < self.min_item_coverage:
+            return None
+        for score, other_coverage, _, item in scored[1:]:
+            if score < best_score * MAX_RUNNER_UP_RATIO and other_coverage < coverage:
+                continue
+            if (item["description"], item["amount_smldv"]) != \
+                    (best["description"], best["amount_smldv"]):
+                return None  # another infraction matches (almost) as well
+        return best
+
+    def answer(self, question, doc_ids=None):
+        """
+        Returns the extractive answer to a fine lookup, citing the article,
+        literal and code, or None to fall back to generation.
+        """
+        item = self.match(question, doc_ids)
+        with self._lock:
+            self._counters["hits" if item is not None else "misses"] += 1
+        if item is None:
+            return None
+        return format_fine_answer(item)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, size=len(self.infractions))
+
+    def save(self, path=FINES_TABLE):
+        with open(path, "w", encoding="utf-8") as outfile:
+            json.dump(self.infractions, outfile, ensure_ascii=False, indent=2)
+
+
+def subject_phrase(subject):
+    """
+    Returns "a <subject>", contracting "a el" to "al".
+    """
+    if subject[:3].lower() == "el ":
+        return f"al {subject[3:]}"
+    return f"a {subject}"
+
+
+def format_fine_answer(item):
+    """
+    Formats an infraction as an answer in the style of the generator
+    ("Basado en el artículo X, ..."). The notes under an infraction are
+    left out: they mix sanctions with editorial annotations of the source
+    ("Ver Acuerdo Distrital ...").
+    """
+    description = item["description"].rstrip(".")
+    return (
+        f"Basado en el artículo {item['article']} (literal {item['literal']}, "
+        f"infracción {item['code']}), {description[0].lower()}{description[1:]} "
+        f"se sanciona con multa equivalente a {item['amount_text']} salarios "
+        f"mínimos legales diarios vigentes. La sanción aplica "
+        f"{subject_phrase(item['subject'])}."
+    )
+
+# -------------------------------------
+# Entry Point (Script Execution)
+# -------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Extract the infractions and fines table of a legal text."
+    )
+    parser.add_argument(
+        "file", nargs="?",
+        default="data/ley-769-de-2002-codigo-nacional-de-transito_preprocessed.txt"
+    )
+    parser.add_argument("--out", default=FINES_TABLE)
+    parser.add_argument("--ask", help="Answer a question from the table.")
+    parser.add_argument(
+        "--check", action="store_true",
+        help="Check the matches of REGRESSION_CASES."
+    )
+    args = parser.parse_args()
+
+    table = FinesTable.from_file(args.file)
+    if args.check:
+        failures = 0
+        for question, expected in REGRESSION_CASES:
+            item = table.match(question)
+            code = item["code"] if item is not None else None
+            failures += code != expected
+            print(f"{'ok  ' if code == expected else 'FAIL'} {question} -> {code} (expected {expected})")
+        raise SystemExit(1 if failures else 0)
+    elif args.ask:
+        print(table.answer(args.ask) or "Sin coincidencia clara: se usaría generación.")
+    else:
+        table.save(args.out)
+        print(f"{len(table.infractions)} infracciones -> {args.out}")
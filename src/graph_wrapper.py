@@ -1,12 +1,30 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import defaultdict
+
 from langchain.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.tools import tool
-from langchain_core.messages import SystemMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import StructuredTool
+from langchain_core.messages import AIMessage, SystemMessage
 from langchain_openai import ChatOpenAI
-from langgraph.graph import StateGraph, MessagesState, END
+from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode, tools_condition
 
-from .retriever_utils import get_unique_union, format_context_with_articles
+from .context_packing import pack_context
+from .document_loader import get_index_version
+from .instrumentation import NOOP_TRACER
+from .lexical_index import find_article_references
+from .memory import ChatState, dedupe_messages, get_token_encoder, is_conversation_turn
+from .query_cache import normalize_question
+from .router import RESPOND, RETRIEVE
+from .retriever_utils import (
+    aretrieve_many,
+    format_context_with_articles,
+    get_unique_union,
+    retrieve_many,
+)
 
 import warnings
 from langchain_core._api import LangChainBetaWarning
@@ -16,6 +34,48 @@ from langchain_core._api import LangChainBetaWarning
 # -------------------------------------
 warnings.filterwarnings("ignore", category=LangChainBetaWarning)
 
+logger = logging.getLogger(__name__)
+
+# -------------------------------------
+# Global Configuration
+# -------------------------------------
+
+# Seconds (from the start of a turn) speculative retrieval waits for the
+# reformulated queries before answering with the original question only
+DEFAULT_SPECULATIVE_BUDGET = 2.0
+
+# Seconds after which an unclaimed speculative retrieval is discarded
+SPECULATION_TTL_SECONDS = 60
+
+# Prompts, kept byte-stable with the variable part last so providers can
+# reuse their cached prefix across requests
+REFORMULATION_TEMPLATE = (
+    "Eres una IA asistente experta en el Código Nacional de Tránsito de "
+    "Colombia. Tu tarea es generar cinco versiones alternativas y diversas "
+    "de la pregunta dada por el usuario, con el objetivo de maximizar la "
+    "recuperación de documentos relevantes de una base de datos de vectores. "
+    "Cada versión debe ser semántica y sintácticamente diferente, pero "
+    "mantener el sentido original de la pregunta. No inventes información ni "
+    "agregues detalles que no estén en la pregunta original. No incluyas "
+    "preguntas que no estén relacionadas con el Código Nacional de Tránsito "
+    "de Colombia. Escribe cada pregunta alternativa en una línea diferente, "
+    "sin enumerar ni listar. Pregunta original: {pregunta}"
+)
+
+GENERATION_INSTRUCTIONS = (
+    "Eres un asistente experto en el Código Nacional de Tránsito de Colombia. "
+    "Debes responder únicamente preguntas relacionadas con el Código Nacional "
+    "de Tránsito o con el contexto proporcionado. Si la pregunta no está "
+    "relacionada con el Código Nacional de Tránsito, responde: "
+    "\"La pregunta no está relacionada con el tema para el que fui entrenado "
+    "(Código Nacional de Tránsito de Colombia) y no puedo responderla.\" "
+    "Si la respuesta está en el contexto, da la respuesta más aproximada "
+    "posible, citando el artículo en el que te basaste al inicio de cada "
+    "parte relevante, diciendo \"Basado en el artículo X,...\". Si la respuesta "
+    "no está en el contexto, responde que no sabes. Da detalles siempre que "
+    "sea posible.\n\nContexto con artículos:\n\n"
+)
+
 # -------------------------------------
 # Main Graph Builder Function
 # -------------------------------------
@@ -23,14 +83,85 @@ warnings.filterwarnings("ignore", category=LangChainBetaWarning)
 def build_graph(
     vector_store,
     retriever_llm=None,
-    generator_llm=None
+    generator_llm=None,
+    cache=None,
+    lexical_index=None,
+    router=None,
+    checkpointer=None,
+    memory=None,
+    context_budget=None,
+    reranker=None,
+    tracer=None,
+    corpus=None,
+    answer_store=None,
+    speculative_budget=None,
+    fines_table=None
 ):
     """
     Builds and compiles a LangGraph-based conversational pipeline.
     Handles retrieval, tool invocation, and response generation
     for questions related to the Colombian National Traffic Code.
+
+    The compiled graph supports both ``invoke``/``stream`` and
+    ``ainvoke``/``astream``; the async path embeds the reformulated queries
+    in one batch and runs their searches concurrently. Per-stage timings of
+    each retrieval are returned in the tool message artifact.
+
+    If a QueryCache is given, reformulations and retrieved documents are
+    reused for repeated (or semantically equivalent) questions, and cached
+    answers to single-turn questions skip the pipeline entirely.
+
+    If a LexicalIndex is given, BM25 results are fused with the dense ones,
+    and questions that name an article number are answered from the article
+    lookup table without embedding or reformulating them.
+
+    If a LocalRouter is given, confident routing decisions are taken locally
+    and the tool-calling LLM router is only used as a fallback.
+
+    If a LangGraph checkpointer is given, conversation state is kept per
+    ``thread_id`` (passed in ``config["configurable"]``).
+
+    If a ConversationMemory is given, the history sent to the LLMs is kept
+    within its token budget, and a compact_memory node at the end of every
+    turn prunes finished tool exchanges and summarizes old turns.
+
+    If a ``context_budget`` (in tokens) is given, retrieved chunks are
+    reranked (LexicalReranker unless a ``reranker`` is given), merged per
+    article and packed into that budget before generation; the tokens saved
+    are reported in the tool artifact timings.
+
+    If a Corpus is given (see corpus.py), each question is scoped to the
+    norms it names that are in force today: dense and BM25 searches are
+    pre-filtered to those documents, and article numbers are looked up in
+    the named (or default) norm.
+
+    If an AnswerStore is given (see answer_store.py), single-turn questions
+    matching a precomputed answer (exactly or as a near-duplicate) are
+    answered from it without running the pipeline. Entries citing articles
+    that changed in the index are dropped when its version changes.
+
+    If a FinesTable is given (see fines.py), questions asking for the fine
+    of an infraction that clearly matches one of its entries are answered
+    extractively from it, citing the article, without retrieval or
+    generation. Other questions fall back to the pipeline.
+
+    If a ``speculative_budget`` (in seconds) is given, async runs start
+    retrieving the original question and reformulating it as soon as the
+    turn starts, concurrently with the routing LLM call. The reformulated
+    queries are merged in if they arrive within the budget (counted from
+    the start of the turn); otherwise retrieval proceeds with the original
+    question's results. Speculation is discarded if the question is not
+    routed to retrieval unchanged.
+
+    If a Tracer is given (see instrumentation.py), every node and retrieval
+    sub-stage is timed as a span, and token counts (with the share of the
+    input served from the provider's prompt cache and made up by the static
+    prompt prefix), cache hits and routing decisions are recorded as
+    metrics. Without one, instrumentation is a
+    no-op.
     """
-    retriever = vector_store.as_retriever()
+    if tracer is None:
+        tracer = NOOP_TRACER
 
     # Fallback to default LLMs if not provided
     if retriever_llm is None:
@@ -41,66 +172,503 @@ def build_graph(
     # -------------------------------------
     # Tool: Reformulate Query and Retrieve Context
     # -------------------------------------
-    @tool(response_format="content_and_artifact")
-    def extraer(pregunta):
+    reformulation_prompt = ChatPromptTemplate.from_template(REFORMULATION_TEMPLATE)
+
+    # Tokens of the static prompt prefixes, reported against each call's input
+    prefix_tokens = {}
+    if tracer.enabled:
+        encoder = get_token_encoder()
+        prefix_tokens = {
+            "reformulate": len(encoder.encode(REFORMULATION_TEMPLATE.split("{", 1)[0])),
+            "generate": len(encoder.encode(GENERATION_INSTRUCTIONS)),
+        }
+
+    def build_reformulation_prompt(pregunta):
+        return reformulation_prompt.format_messages(pregunta=pregunta)
+
+    def parse_queries(response):
+        return [q for q in response.content.split("\n") if q.strip()]
+
+    def reformulate(pregunta):
         """
-        Reformulates the user question into five diverse alternatives and retrieves
-        unique relevant documents from a vector store.
+        Generates the alternative versions of the question.
         """
-        template = (
-            "Eres una IA asistente experta en el Código Nacional de Tránsito de "
-            "Colombia. Tu tarea es generar cinco versiones alternativas y diversas "
-            "de la pregunta dada por el usuario, con el objetivo de maximizar la "
-            "recuperación de documentos relevantes de una base de datos de vectores. "
-            "Cada versión debe ser semántica y sintácticamente diferente, pero "
-            "mantener el sentido original de la pregunta. No inventes información ni "
-            "agregues detalles que no estén en la pregunta original. No incluyas "
-            "preguntas que no estén relacionadas con el Código Nacional de Tránsito "
-            "de Colombia. Escribe cada pregunta alternativa en una línea diferente, "
-            "sin enumerar ni listar. Pregunta original: {pregunta}"
+        prompt = build_reformulation_prompt(pregunta)
+        with tracer.span("extraer.reformulate"):
+            response = retriever_llm.invoke(prompt)
+        tracer.record_usage(
+            "reformulate", prompt, response, prefix_tokens.get("reformulate")
         )
-        prompt = ChatPromptTemplate.from_template(template)
+        return parse_queries(response)
 
-        generate_queries = (
-            prompt
-            | retriever_llm
-            | StrOutputParser()
-            | (lambda x: [q for q in x.split("\n") if q.strip()])
+    async def areformulate(pregunta):
+        prompt = build_reformulation_prompt(pregunta)
+        with tracer.span("extraer.reformulate"):
+            response = await retriever_llm.ainvoke(prompt)
+        tracer.record_usage(
+            "reformulate", prompt, response, prefix_tokens.get("reformulate")
         )
+        return parse_queries(response)
+
+    # -------------------------------------
+    # Query Cache Helpers
+    # -------------------------------------
+    def cache_get(question, field):
+        if cache is None:
+            return None
+        cache.check_index_version(get_index_version(vector_store))
+        value = cache.get(question, field)
+        tracer.record("cache.hit" if value is not None else "cache.miss", field=field)
+        return value
+
+    def answer_store_get(question):
+        answer_store.check_index_version(get_index_version(vector_store), vector_store)
+        entry = answer_store.get(question)
+        if entry is None:
+            tracer.record("answer_store.miss")
+        else:
+            tracer.record("answer_store.hit", match=entry["match"])
+        return entry
+
+    def fines_answer(question):
+        scope = corpus_scope(question)
+        answer = fines_table.answer(
+            question, doc_ids=scope["article_doc_ids"] if scope else None
+        )
+        tracer.record("fines.hit" if answer is not None else "fines.miss")
+        return answer
+
+    def cache_put(question, field, value):
+        if cache is not None:
+            cache.put(question, field, value)
+
+    def single_turn_question(state):
+        """
+        Returns the user question if the conversation has a single turn
+        (answers depending on earlier turns are never cached), else None.
+        """
+        if state.get("summary"):
+            return None
+        questions = [msg for msg in state["messages"] if msg.type == "human"]
+        return questions[0].content if len(questions) == 1 else None
+
+    def history(state):
+        """
+        Returns the conversation history to send to the LLMs.
+        """
+        if memory is None:
+            return state["messages"]
+        return memory.window(state["messages"], state.get("summary", ""))
+
+    # -------------------------------------
+    # Lexical Retrieval Helpers
+    # -------------------------------------
+    def corpus_scope(pregunta):
+        """
+        Returns the corpus scope of the question, or None without a corpus.
+        """
+        if corpus is None:
+            return None
+        return corpus.scope(pregunta)
 
+    def scoped_search_kwargs(scope):
+        if scope is None or scope["filter"] is None:
+            return None
+        return {"filter": scope["filter"]}
+
+    def lookup_referenced_articles(pregunta, scope=None):
+        """
+        Returns the chunks of the articles named in the question, if any.
+        """
+        if lexical_index is None:
+            return []
+        return lexical_index.lookup_articles(
+            find_article_references(pregunta),
+            corpus_ids=scope["article_doc_ids"] if scope else None
+        )
+
+    def add_lexical_results(results, pregunta, queries, scope=None):
+        """
+        Appends BM25 rankings of the question and its reformulations to the
+        dense rankings, so both are merged by reciprocal rank fusion.
+        """
+        if lexical_index is None:
+            return results
+        corpus_ids = scope["doc_ids"] if scope and scope["filter"] else None
+        with tracer.span("extraer.lexical"):
+            return results + [
+                lexical_index.search_documents(query, corpus_ids=corpus_ids)
+                for query in [pregunta] + queries
+            ]
+
+    def fuse_results(pregunta, results, timings):
+        """
+        Deduplicates the rankings with reciprocal rank fusion and caches the
+        resulting documents, unless some rankings are missing (``partial``
+        timings, see aextraer_speculative).
+        """
+        dedup_start = time.perf_counter()
+        with tracer.span("extraer.dedup"):
+            docs = get_unique_union(results, fusion=True)
+        timings["dedup_ms"] = (time.perf_counter() - dedup_start) * 1000
+        if not timings.get("partial"):
+            cache_put(pregunta, "docs", docs)
+        return docs
+
+    def record_search_timings(search_timings):
+        tracer.record("extraer.embed_ms", search_timings["embed_ms"])
+        tracer.record("extraer.search_ms", search_timings["search_ms"])
+
+    def finish_extraction(pregunta, docs, timings, start):
+        """
+        Packs the retrieved documents into the context budget (if set) and
+        builds the tool response with its timings and packing stats.
+        """
+        if context_budget is not None:
+            pack_start = time.perf_counter()
+            with tracer.span("extraer.pack"):
+                docs, packing = pack_context(
+                    pregunta, docs, budget=context_budget, reranker=reranker
+                )
+            timings["pack_ms"] = (time.perf_counter() - pack_start) * 1000
+            timings.update(packing)
+            tracer.record("context.tokens", packing["tokens_after"])
+            tracer.record("context.tokens_saved", packing["tokens_saved"])
+
+        tracer.record("extraer.docs", len(docs))
+
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+        logger.debug("extraer timings: %s", timings)
+        serialized = format_context_with_articles(docs)
+        return serialized, {"docs": docs, "timings": timings}
+
+    # -------------------------------------
+    # Speculative Retrieval (async only)
+    # -------------------------------------
+    speculations = defaultdict(list)
+
+    def start_speculation(pregunta):
+        """
+        Starts retrieving the original question and reformulating it in the
+        background, unless the question is answered by an article lookup
+        or cached documents. Returns the speculation, or None.
+        """
+        scope = corpus_scope(pregunta)
+        if lookup_referenced_articles(pregunta, scope) or cache_get(pregunta, "docs") is not None:
+            return None
+
+        queries = cache_get(pregunta, "queries")
+        speculation = {
+            "key": normalize_question(pregunta),
+            "started": time.perf_counter(),
+            "original": asyncio.create_task(aretrieve_many(
+                vector_store, [pregunta], search_kwargs=scoped_search_kwargs(scope)
+            )),
+            "queries": queries,
+            "reformulation": None if queries is not None else
+                asyncio.create_task(areformulate(pregunta)),
+        }
+
+        # Drop speculations whose tool call never came
+        now = time.perf_counter()
+        for key in list(speculations):
+            for entry in list(speculations[key]):
+                if now - entry["started"] > SPECULATION_TTL_SECONDS:
+                    discard_speculation(entry)
+
+        speculations[speculation["key"]].append(speculation)
+        tracer.record("speculative.started")
+        return speculation
+
+    def discard_speculation(speculation):
+        pending = speculations.get(speculation["key"], [])
+        if speculation in pending:
+            pending.remove(speculation)
+        if not pending:
+            speculations.pop(speculation["key"], None)
+        for field in ("original", "reformulation"):
+            task = speculation[field]
+            if task is not None and not task.done():
+                task.cancel()
+
+    def claim_speculation(pregunta):
+        """
+        Returns (and unregisters) a speculation started for the question.
+        """
+        pending = speculations.get(normalize_question(pregunta))
+        if not pending:
+            return None
+        speculation = pending.pop(0)
+        if not pending:
+            speculations.pop(speculation["key"], None)
+        return speculation
+
+    async def speculative_queries(pregunta, speculation):
+        """
+        Waits for the speculative reformulation until the budget runs out.
+
+        Returns:
+            The reformulated queries, or an empty list if cut off or failed.
+        """
+        if speculation["queries"] is not None:
+            return speculation["queries"]
+        task = speculation["reformulation"]
+        remaining = speculation["started"] + speculative_budget - time.perf_counter()
         try:
-            retrieval_chain = (
-                generate_queries
-                | retriever.map()
-                | get_unique_union
-            )
-            docs = retrieval_chain.invoke({"pregunta": pregunta})
-            serialized = format_context_with_articles(docs)
-            return serialized, docs
+            queries = await asyncio.wait_for(task, timeout=max(0.0, remaining))
+        except asyncio.TimeoutError:
+            tracer.record("speculative.cutoff")
+            return []
+        except Exception as e:
+            logger.warning("Speculative reformulation failed: %s", e)
+            return []
+        cache_put(pregunta, "queries", queries)
+        return queries
+
+    async def aextraer_speculative(pregunta, speculation, start):
+        """
+        Finishes a speculative retrieval: the original question's results,
+        plus those of the reformulations that arrived within the budget.
+        """
+        scope = corpus_scope(pregunta)
+        with tracer.span("extraer.speculative_wait"):
+            original_results, original_timings = await speculation["original"]
+            queries = await speculative_queries(pregunta, speculation)
+        timings = {
+            "speculative": True,
+            "reformulate_ms": (time.perf_counter() - start) * 1000,
+            "reformulations_used": bool(queries),
+            # Cut off or failed reformulations: neither the documents nor
+            # the answer are cached
+            "partial": not queries,
+        }
+
+        results = list(original_results)
+        search_timings = original_timings
+        if queries:
+            with tracer.span("extraer.retrieve", queries=len(queries)):
+                reformulated_results, search_timings = await aretrieve_many(
+                    vector_store, queries, search_kwargs=scoped_search_kwargs(scope)
+                )
+            results += reformulated_results
+        record_search_timings(search_timings)
+        results = add_lexical_results(results, pregunta, queries, scope)
+        timings.update(search_timings)
+
+        docs = fuse_results(pregunta, results, timings)
+        return finish_extraction(pregunta, docs, timings, start)
+
+    def extraer(pregunta: str):
+        """
+        Reformulates the user question into five diverse alternatives and retrieves
+        unique relevant documents from a vector store.
+        """
+        start = time.perf_counter()
+        try:
+            scope = corpus_scope(pregunta)
+            docs = lookup_referenced_articles(pregunta, scope)
+            if docs:
+                return finish_extraction(pregunta, docs, {"article_lookup": True}, start)
+
+            docs = cache_get(pregunta, "docs")
+            if docs is not None:
+                return finish_extraction(pregunta, docs, {"cache_hit": True}, start)
+
+            queries = cache_get(pregunta, "queries")
+            if queries is None:
+                queries = reformulate(pregunta)
+                cache_put(pregunta, "queries", queries)
+            timings = {"reformulate_ms": (time.perf_counter() - start) * 1000}
+
+            with tracer.span("extraer.retrieve", queries=len(queries)):
+                results, search_timings = retrieve_many(
+                    vector_store, queries, search_kwargs=scoped_search_kwargs(scope)
+                )
+            record_search_timings(search_timings)
+            results = add_lexical_results(results, pregunta, queries, scope)
+            timings.update(search_timings)
+
+            docs = fuse_results(pregunta, results, timings)
+            return finish_extraction(pregunta, docs, timings, start)
+
+        except Exception as e:
+            return f"Error extracting context: {e}", {"docs": [], "timings": {}}
+
+    async def aextraer(pregunta: str):
+        """
+        Async version of extraer: the reformulated queries are embedded in
+        one batched call and searched concurrently.
+        """
+        start = time.perf_counter()
+        speculation = claim_speculation(pregunta) if speculative_budget is not None else None
+        try:
+            if speculation is not None:
+                return await aextraer_speculative(pregunta, speculation, start)
+
+            scope = corpus_scope(pregunta)
+            docs = lookup_referenced_articles(pregunta, scope)
+            if docs:
+                return finish_extraction(pregunta, docs, {"article_lookup": True}, start)
+
+            docs = cache_get(pregunta, "docs")
+            if docs is not None:
+                return finish_extraction(pregunta, docs, {"cache_hit": True}, start)
+
+            queries = cache_get(pregunta, "queries")
+            if queries is None:
+                queries = await areformulate(pregunta)
+                cache_put(pregunta, "queries", queries)
+            timings = {"reformulate_ms": (time.perf_counter() - start) * 1000}
+
+            with tracer.span("extraer.retrieve", queries=len(queries)):
+                results, search_timings = await aretrieve_many(
+                    vector_store, queries, search_kwargs=scoped_search_kwargs(scope)
+                )
+            record_search_timings(search_timings)
+            results = add_lexical_results(results, pregunta, queries, scope)
+            timings.update(search_timings)
+
+            docs = fuse_results(pregunta, results, timings)
+            return finish_extraction(pregunta, docs, timings, start)
 
         except Exception as e:
-            return f"Error extracting context: {e}", []
+            if speculation is not None:
+                discard_speculation(speculation)
+            return f"Error extracting context: {e}", {"docs": [], "timings": {}}
+
+    extraer_tool = StructuredTool.from_function(
+        func=tracer.traced("tool.extraer")(extraer),
+        coroutine=tracer.traced("tool.extraer")(aextraer),
+        name="extraer",
+        response_format="content_and_artifact",
+    )
 
     # Register tool and bind to retriever LLM
-    tools = ToolNode([extraer])
-    retriever_llm_with_tools = retriever_llm.bind_tools([extraer])
+    tools = ToolNode([extraer_tool])
+    retriever_llm_with_tools = retriever_llm.bind_tools([extraer_tool])
+
+    # -------------------------------------
+    # Node: Cached Answer Lookup
+    # -------------------------------------
+    def check_cache(state):
+        """
+        Answers fine lookups from the fines table, and single-turn questions
+        from the precomputed answer store or the query cache when possible.
+        """
+        last_msg = state["messages"][-1]
+        if fines_table is not None and last_msg.type == "human":
+            with tracer.span("check_cache.fines"):
+                answer = fines_answer(last_msg.content)
+            if answer is not None:
+                return {"messages": [AIMessage(answer)]}
+
+        question = single_turn_question(state)
+        if question is None:
+            return {"messages": []}
+        if answer_store is not None:
+            with tracer.span("check_cache.answer_store"):
+                entry = answer_store_get(question)
+            if entry is not None:
+                return {"messages": [AIMessage(entry["answer"])]}
+        answer = cache_get(question, "answer")
+        if answer is None:
+            return {"messages": []}
+        return {"messages": [AIMessage(answer)]}
+
+    def route_after_cache(state):
+        """
+        Ends the turn on a cache hit, otherwise continues to routing.
+        """
+        return "turn_end" if state["messages"][-1].type == "ai" else "query_or_respond"
 
     # -------------------------------------
     # Node: Tool Invocation or Response
     # -------------------------------------
+    def fast_route(state):
+        """
+        Routes the latest question with the local router.
+
+        Returns:
+            The routed LLM to call (retriever_llm for a direct answer, or
+            retriever_llm_with_tools to defer to the LLM router), or a
+            ready-made tool call message when retrieval is certain.
+        """
+        last_msg = state["messages"][-1]
+        if router is None or last_msg.type != "human":
+            return retriever_llm_with_tools
+
+        decision = router.route(last_msg.content)
+        tracer.record("router.decision", decision=decision or "llm")
+        if decision == RETRIEVE:
+            return AIMessage(
+                content="",
+                tool_calls=[{
+                    "name": "extraer",
+                    "args": {"pregunta": last_msg.content},
+                    "id": f"call_{uuid.uuid4().hex}",
+                    "type": "tool_call",
+                }]
+            )
+        if decision == RESPOND:
+            return retriever_llm
+        return retriever_llm_with_tools
+
     def query_or_respond(state):
         """
         Determines whether to call the retrieval tool or respond directly.
         """
-        response = retriever_llm_with_tools.invoke(state["messages"])
+        route = fast_route(state)
+        if isinstance(route, AIMessage):
+            return {"messages": [route]}
+        prompt = history(state)
+        response = route.invoke(prompt)
+        tracer.record_usage("route", prompt, response)
+        return {"messages": [response]}
+
+    def routed_question(response):
+        """
+        Returns the question of the extraer tool call of a routing
+        response, or None if it does not retrieve.
+        """
+        for tool_call in getattr(response, "tool_calls", None) or []:
+            if tool_call["name"] == "extraer":
+                return tool_call["args"].get("pregunta")
+        return None
+
+    async def aquery_or_respond(state):
+        route = fast_route(state)
+
+        # Retrieve speculatively while the routing LLM runs
+        speculation = None
+        last_msg = state["messages"][-1]
+        if speculative_budget is not None and route is not retriever_llm \
+                and last_msg.type == "human":
+            speculation = start_speculation(last_msg.content)
+
+        if isinstance(route, AIMessage):
+            return {"messages": [route]}
+        prompt = history(state)
+        try:
+            response = await route.ainvoke(prompt)
+        except BaseException:
+            if speculation is not None:
+                discard_speculation(speculation)
+            raise
+        tracer.record_usage("route", prompt, response)
+
+        if speculation is not None:
+            question = routed_question(response)
+            if question is None or normalize_question(question) != speculation["key"]:
+                discard_speculation(speculation)
+                tracer.record("speculative.discarded")
         return {"messages": [response]}
 
     # -------------------------------------
     # Node: Generate Final Answer
     # -------------------------------------
-    def generate(state):
+    def build_generation_prompt(state):
         """
-        Generates a grounded answer based on retrieved documents and chat history.
+        Builds the generation prompt from retrieved documents and chat history.
         """
         # Collect recent tool messages (retrieved docs)
         recent_tool_messages = []
@@ -109,53 +677,163 @@ def build_graph(
                 recent_tool_messages.append(message)
             else:
                 break
-        tool_messages = recent_tool_messages[::-1]
+        tool_messages = dedupe_messages(recent_tool_messages[::-1])
 
         docs_content = "\n\n".join(doc.content for doc in tool_messages)
 
-        # Construct system message with context
-        system_msg = (
-            "Eres un asistente experto en el Código Nacional de Tránsito de Colombia. "
-            "Debes responder únicamente preguntas relacionadas con el Código Nacional "
-            "de Tránsito o con el contexto proporcionado. Si la pregunta no está "
-            "relacionada con el Código Nacional de Tránsito, responde: "
-            "\"La pregunta no está relacionada con el tema para el que fui entrenado "
-            "(Código Nacional de Tránsito de Colombia) y no puedo responderla.\" "
-            "Si la respuesta está en el contexto, da la respuesta más aproximada "
-            "posible, citando el artículo en el que te basaste al inicio de cada "
-            "parte relevante, diciendo \"Basado en el artículo X,...\". Si la respuesta "
-            "no está en el contexto, responde que no sabes. Da detalles siempre que "
-            "sea posible.\n\nContexto con artículos:\n\n"
-            f"{docs_content}"
-        )
+        # Static instructions first, then the retrieved context
+        system_msg = GENERATION_INSTRUCTIONS + docs_content
 
         # Filter relevant messages for final prompt
-        conversation = [
-            msg for msg in state["messages"]
-            if msg.type in ("human", "system")
-            or (msg.type == "ai" and not msg.tool_calls)
-        ]
-        prompt = [SystemMessage(system_msg)] + conversation
+        if memory is None:
+            conversation = [msg for msg in state["messages"] if is_conversation_turn(msg)]
+        else:
+            conversation = history(state)
+        return [SystemMessage(system_msg)] + conversation
+
+    def cache_answer(state, response):
+        question = single_turn_question(state)
+        if question is None:
+            return
+        for message in reversed(state["messages"]):
+            if message.type != "tool":
+                break
+            artifact = getattr(message, "artifact", None) or {}
+            if artifact.get("timings", {}).get("partial"):
+                return  # generated from a partial retrieval
+        cache_put(question, "answer", response.content)
 
+    def generate(state):
+        """
+        Generates a grounded answer based on retrieved documents and chat history.
+        """
+        prompt = build_generation_prompt(state)
         response = generator_llm.invoke(prompt)
+        tracer.record_usage("generate", prompt, response, prefix_tokens.get("generate"))
+        cache_answer(state, response)
+        return {"messages": [response]}
+
+    async def agenerate(state):
+        prompt = build_generation_prompt(state)
+        response = await generator_llm.ainvoke(prompt)
+        tracer.record_usage("generate", prompt, response, prefix_tokens.get("generate"))
+        cache_answer(state, response)
         return {"messages": [response]}
 
+    # -------------------------------------
+    # Node: Conversation Memory Compaction
+    # -------------------------------------
+    def compact_memory(state):
+        """
+        Prunes finished tool exchanges and summarizes turns beyond the budget.
+        """
+        return memory.compact(state["messages"], state.get("summary", ""))
+
+    async def acompact_memory(state):
+        return await memory.acompact(state["messages"], state.get("summary", ""))
+
     # -------------------------------------
     # Graph Construction
     # -------------------------------------
-    graph = StateGraph(MessagesState)
+    graph = StateGraph(ChatState)
+
+    def node(name, func, afunc=None):
+        """
+        Wraps a node function (and its async version) in a span.
+        """
+        traced = tracer.traced(f"node.{name}")
+        if afunc is None:
+            return RunnableLambda(traced(func))
+        return RunnableLambda(traced(func), afunc=traced(afunc))
+
+    graph.add_node(
+        "query_or_respond",
+        node("query_or_respond", query_or_respond, aquery_or_respond)
+    )
+    graph.add_node("tools", tools)
+    graph.add_node("generate", node("generate", generate, agenerate))
+
+    # End of turn: through memory compaction when enabled
+    turn_end = END
+    if memory is not None:
+        graph.add_node(
+            "compact_memory",
+            node("compact_memory", compact_memory, acompact_memory)
+        )
+        graph.add_edge("compact_memory", END)
+        turn_end = "compact_memory"
 
-    graph.add_node(query_or_respond)
-    graph.add_node(tools)
-    graph.add_node(generate)
+    if cache is not None or answer_store is not None or fines_table is not None:
+        graph.add_node("check_cache", node("check_cache", check_cache))
+        graph.set_entry_point("check_cache")
+        graph.add_conditional_edges(
+            "check_cache",
+            route_after_cache,
+            {"turn_end": turn_end, "query_or_respond": "query_or_respond"},
+        )
+    else:
+        graph.set_entry_point("query_or_respond")
 
-    graph.set_entry_point("query_or_respond")
     graph.add_conditional_edges(
         "query_or_respond",
         tools_condition,
-        {END: END, "tools": "tools"},
+        {END: turn_end, "tools": "tools"},
     )
     graph.add_edge("tools", "generate")
-    graph.add_edge("generate", END)
+    graph.add_edge("generate", turn_end)
+
+    return graph.compile(checkpointer=checkpointer)
+
+# -------------------------------------
+# Answer Streaming
+# -------------------------------------
+
+# Node whose LLM tokens make up the final answer
+ANSWER_NODE = "generate"
+
+
+def _answer_events(mode, payload):
+    """
+    Converts one (mode, payload) item of a multi-mode graph stream into
+    answer events (see stream_answer).
+    """
+    if mode == "messages":
+        chunk, metadata = payload
+        if metadata.get("langgraph_node") == ANSWER_NODE and chunk.content:
+            yield "token", chunk.content
+        return
+
+    yield "state", payload
+    last_msg = payload["messages"][-1]
+    if last_msg.type == "tool":
+        yield "tool", last_msg.content
+    elif last_msg.type == "ai" and not last_msg.tool_calls:
+        yield "answer", last_msg.content
+
+
+def stream_answer(graph, inputs, config=None):
+    """
+    Runs the graph and yields the answer as it is produced.
 
-    return graph.compile()
+    Yields:
+        ("token", text) for each token of the generated answer,
+        ("tool", content) for each retrieval tool result,
+        ("answer", content) with the complete final answer (also for
+        answers that were not generated token by token, e.g. cache hits), and
+        ("state", values) with the graph state after every step.
+    """
+    for mode, payload in graph.stream(
+        inputs, config, stream_mode=["messages", "values"]
+    ):
+        yield from _answer_events(mode, payload)
+
+
+async def astream_answer(graph, inputs, config=None):
+    """
+    Async version of stream_answer.
+    """
+    async for mode, payload in graph.astream(
+        inputs, config, stream_mode=["messages", "values"]
+    ):
+        for event in _answer_events(mode, payload):
+            yield event
@@ -1,8 +1,24 @@
 import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 from dotenv import load_dotenv
 from PIL import Image
 
+# -----------------------
+# Streamlit UI Enhancements
+# -----------------------
+
+# Configuración de la página para una mejor apariencia general
+# (debe ser la primera llamada a Streamlit)
+st.set_page_config(
+    page_title="Chatbot Código Nacional de Tránsito",
+    page_icon="🚗",
+    layout="centered", # o "wide" para más espacio
+    initial_sidebar_state="expanded" # La barra lateral expandida al inicio
+)
+
 # -----------------------
 # Load environment variables
 # -----------------------
@@ -14,40 +30,88 @@ os.environ["LANGCHAIN_API_KEY"] = os.getenv("LANGCHAIN_API_KEY", "")
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY", "")
 
 # -----------------------
-# Import chatbot components
+# Initialize chatbot (cached, in the background)
 # -----------------------
 
-# Asumiendo que estos módulos existen y funcionan como se espera
-from src.document_loader import load_and_process_document
-from src.graph_wrapper import build_graph
+def build_chatbot():
+    """
+    Load the vector store and initialize the LangGraph chatbot.
+    The chatbot modules are imported here so the page renders before
+    LangChain and the index are loaded.
+    """
+    from langchain_openai import ChatOpenAI
+
+    from src.answer_store import ANSWER_DB, AnswerStore
+    from src.context_packing import DEFAULT_CONTEXT_BUDGET
+    from src.corpus import Corpus
+    from src.document_loader import get_shared_embedding_model
+    from src.embeddings import query_embedding_model
+    from src.fines import FinesTable
+    from src.graph_wrapper import build_graph
+    from src.instrumentation import tracer_from_env
+    from src.lexical_index import LexicalIndex
+    from src.memory import ConversationMemory
+    from src.query_cache import QueryCache
+    from src.router import LocalRouter
+
+    corpus = Corpus.from_manifest()
+    # Share one memory-mapped index across worker processes when configured
+    mmap_dtype = os.getenv("MMAP_INDEX_DTYPE")
+    if mmap_dtype:
+        vector_store = corpus.build_mmap_store(dtype=mmap_dtype)
+    else:
+        vector_store = corpus.build_vector_store()
+    # User questions are embedded without the on-disk embedding cache
+    question_embeddings = query_embedding_model(get_shared_embedding_model())
+    cache = QueryCache(embedding_model=question_embeddings)
+    answer_store = None
+    if os.path.isfile(ANSWER_DB):
+        answer_store = AnswerStore(embedding_model=question_embeddings)
+    lexical_index = LexicalIndex.from_vector_store(vector_store)
+    router = LocalRouter(lexical_index=lexical_index)
+    graph = build_graph(
+        vector_store,
+        cache=cache,
+        lexical_index=lexical_index,
+        router=router,
+        memory=ConversationMemory(llm=ChatOpenAI(model="gpt-3.5-turbo", temperature=0)),
+        context_budget=DEFAULT_CONTEXT_BUDGET,
+        tracer=tracer_from_env(),
+        corpus=corpus,
+        answer_store=answer_store,
+        fines_table=FinesTable.from_corpus(corpus)
+    )
+    return graph
 
-# -----------------------
-# Initialize chatbot (cached)
-# -----------------------
 
 @st.cache_resource
 def get_chatbot():
     """
-    Load the vector store and initialize the LangGraph chatbot.
+    Starts warming up the chatbot in a background thread, once per process.
+
+    Returns:
+        Future resolving to the compiled graph.
     """
-    file_path = "./data/ley-769-de-2002-codigo-nacional-de-transito_preprocessed.txt"
-    vector_store = load_and_process_document(file_path)
-    graph = build_graph(vector_store)
-    return graph
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warmup")
+    return executor.submit(build_chatbot)
 
-graph = get_chatbot()
+chatbot_future = get_chatbot()
 
-# -----------------------
-# Streamlit UI Enhancements
-# -----------------------
 
-# Configuración de la página para una mejor apariencia general
-st.set_page_config(
-    page_title="Chatbot Código Nacional de Tránsito",
-    page_icon="🚗",
-    layout="centered", # o "wide" para más espacio
-    initial_sidebar_state="expanded" # La barra lateral expandida al inicio
-)
+@st.cache_resource
+def get_conversation_store():
+    """
+    Returns the process-wide store of conversations, keyed by session.
+    """
+    from src.memory import ConversationStore
+    return ConversationStore()
+
+conversation_store = get_conversation_store()
+
+# Identificador de la conversación, conservado en la URL entre recargas
+if "session_id" not in st.session_state:
+    st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.session_id
 
 
 # --- CSS personalizado para una experiencia "Woow" ---
@@ -152,6 +216,8 @@ with st.sidebar:
         "Este chatbot interactúa con la **Ley 769 de 2002: Código Nacional de Tránsito Terrestre** "
         "de Colombia para proporcionarte información relevante y precisa."
     )
+    if not chatbot_future.done():
+        st.info("Preparando el índice en segundo plano... ⏳")
     st.markdown("---")
     st.warning(
         "**Descargo de responsabilidad:** La información ofrecida por este asistente "
@@ -176,6 +242,13 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
     # Añadir un mensaje de bienvenida inicial del asistente
     st.session_state.messages.append({"role": "assistant", "content": "¡Hola! Soy tu asistente sobre el Código Nacional de Tránsito de Colombia. ¿Tienes alguna pregunta sobre normas, multas o procedimientos de tránsito? 🛣️"})
+    # Recuperar los turnos guardados de esta conversación
+    stored_messages, _ = conversation_store.load(st.session_state.session_id)
+    for msg in stored_messages:
+        if msg.type == "human":
+            st.session_state.messages.append({"role": "user", "content": msg.content})
+        elif msg.type == "ai" and not msg.tool_calls:
+            st.session_state.messages.append({"role": "assistant", "content": msg.content})
 
 
 # --- Mostrar todos los mensajes del historial de chat con avatares ---
@@ -202,6 +275,16 @@ if user_query:
         st.markdown(f'<img src="{avatar_urls["user"]}" class="user-avatar" style="display:inline;vertical-align:middle;">', unsafe_allow_html=True)
         st.markdown(user_query)
 
+    # Esperar a que el índice termine de cargar (solo en el primer uso)
+    if not chatbot_future.done():
+        with st.spinner("Preparando el índice del Código de Tránsito... 📚"):
+            chatbot_future.exception()
+    if chatbot_future.exception() is not None:
+        st.error(f"No fue posible inicializar el asistente: {chatbot_future.exception()}")
+        st.stop()
+    graph = chatbot_future.result()
+    from src.graph_wrapper import stream_answer
+
     # Procesar la respuesta de la IA
     with st.chat_message("assistant"):
         with st.spinner("Buscando en el Código de Tránsito... 🧠"):
@@ -209,16 +292,31 @@ if user_query:
             tool_messages_content = []
             # Animación de "escribiendo..."
             writing_placeholder = st.empty()
-            for step in graph.stream(
-                {"messages": [{"role": "user", "content": user_query}]},
-                stream_mode="values"
+            # Historial acotado de la conversación (ver src/memory.py)
+            history, summary = conversation_store.load(st.session_state.session_id)
+            final_state = None
+            for kind, content in stream_answer(
+                graph,
+                {
+                    "messages": history + [{"role": "user", "content": user_query}],
+                    "summary": summary,
+                }
             ):
-                last_msg = step["messages"][-1]
-                if last_msg.type == "ai":
-                    full_ai_response += last_msg.content
+                if kind == "token":
+                    full_ai_response += content
                     writing_placeholder.markdown(f'<img src="{avatar_urls["assistant"]}" class="assistant-avatar" style="display:inline;vertical-align:middle;"> <span style="font-size:1.1em;">{full_ai_response} <span style="color:#bbb;font-size:0.9em;">⏳</span></span>', unsafe_allow_html=True)
-                elif last_msg.type == "tool":
-                    tool_messages_content.append(last_msg.content)
+                elif kind == "answer":
+                    full_ai_response = content
+                elif kind == "tool":
+                    tool_messages_content.append(content)
+                elif kind == "state":
+                    final_state = content
+            if final_state is not None:
+                conversation_store.save(
+                    st.session_state.session_id,
+                    final_state["messages"],
+                    final_state.get("summary", "")
+                )
             writing_placeholder.empty()
             st.markdown(f'<img src="{avatar_urls["assistant"]}" class="assistant-avatar" style="display:inline;vertical-align:middle;">', unsafe_allow_html=True)
             st.markdown(full_ai_response)
@@ -0,0 +1,323 @@
+import argparse
+import hashlib
+import json
+import os
+
+from langchain_community.document_loaders import TextLoader
+from langchain_community.vectorstores import Chroma
+
+from .document_loader import (
+    DEFAULT_CHUNKER,
+    chunk_document,
+    compute_index_key,
+    get_shared_embedding_model,
+)
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Directory of the incrementally maintained index (stable across versions)
+INCREMENTAL_INDEX_DIR = os.path.join("data", "index", "incremental")
+
+# Prefix of the collection shared by every indexed version of the code; one
+# collection per embedding model and chunker (see layout_key)
+INCREMENTAL_COLLECTION = "cnt-incremental"
+
+# Per-version record of article hashes and chunk ids, one per collection
+ARTICLE_MANIFEST = "articles-{key}.json"
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def content_hash(text):
+    """
+    Returns the SHA-256 hex digest of the given text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def version_key(version):
+    """
+    Returns the metadata flag that marks a chunk as part of a version.
+    """
+    return f"v_{version}"
+
+
+def version_filter(version):
+    """
+    Returns a Chroma ``where`` filter restricting a search to one version,
+    e.g. ``vector_store.as_retriever(search_kwargs={"filter": ...})``.
+    """
+    return {version_key(version): True}
+
+
+def layout_key(embedding_model, chunker=DEFAULT_CHUNKER):
+    """
+    Returns the key of the embedding model and chunker of an incremental
+    index (the index key of document_loader without the text), so vectors
+    of different models or chunk layouts never share a collection.
+    """
+    return compute_index_key("", embedding_model, chunker)[:16]
+
+
+def group_article_chunks(chunks):
+    """
+    Groups the chunks of a document by article, in text order. Repeated
+    article numbers (e.g. cross-references matched as headers) get an
+    occurrence suffix.
+
+    Returns:
+        Dict of article key -> (article_number, list of Document chunks).
+    """
+    grouped = {}
+    occurrences = {}
+    previous = None
+    for doc in chunks:
+        article_num = doc.metadata.get("source_article", "")
+        if article_num != previous or doc.metadata.get("chunk_index") == 0:
+            count = occurrences.get(article_num, 0)
+            occurrences[article_num] = count + 1
+            key = article_num if count == 0 else f"{article_num}#{count}"
+            grouped[key] = (article_num, [])
+        grouped[key][1].append(doc)
+        previous = article_num
+    return grouped
+
+
+def article_hash(docs):
+    """
+    Returns the content hash of the chunks of an article, text and
+    metadata (other than the source file) included.
+    """
+    return content_hash(json.dumps(
+        [[doc.page_content, chunk_metadata(doc)] for doc in docs],
+        ensure_ascii=False, sort_keys=True
+    ))
+
+
+def chunk_metadata(doc):
+    """
+    Returns the metadata that identifies a chunk (all but its source file).
+    """
+    return {key: value for key, value in doc.metadata.items() if key != "source"}
+
+
+def article_chunk_ids(docs, article_num):
+    """
+    Derives chunk ids from the article number, chunk content and metadata,
+    so identical chunks are shared across versions.
+
+    Returns:
+        List of (chunk_id, Document) tuples.
+    """
+    chunks = {}
+    for doc in docs:
+        fingerprint = json.dumps(chunk_metadata(doc), ensure_ascii=False, sort_keys=True)
+        chunk_id = content_hash(f"{article_num}\n{doc.page_content}\n{fingerprint}")[:32]
+        chunks.setdefault(chunk_id, doc)
+    return list(chunks.items())
+
+
+def load_manifest(persist_directory, key):
+    """
+    Loads the article manifest of an incremental index, or an empty one.
+    """
+    path = os.path.join(persist_directory, ARTICLE_MANIFEST.format(key=key))
+    if not os.path.isfile(path):
+        return {"versions": {}}
+    with open(path, "r", encoding="utf-8") as infile:
+        return json.load(infile)
+
+
+def save_manifest(persist_directory, key, manifest):
+    """
+    Atomically writes the article manifest of an incremental index.
+    """
+    path = os.path.join(persist_directory, ARTICLE_MANIFEST.format(key=key))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as outfile:
+        json.dump(manifest, outfile, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def referenced_ids(manifest, exclude_version=None):
+    """
+    Returns the set of chunk ids referenced by any version in the manifest.
+    """
+    ids = set()
+    for version, articles in manifest["versions"].items():
+        if version == exclude_version:
+            continue
+        for entry in articles.values():
+            ids.update(entry["ids"])
+    return ids
+
+
+def set_version_flag(vector_store, ids, version, present):
+    """
+    Adds or removes a version flag on existing chunks without re-embedding.
+    """
+    if not ids:
+        return
+    existing = vector_store.get(ids=list(ids), include=["metadatas"])
+    metadatas = []
+    for metadata in existing["metadatas"]:
+        metadata = dict(metadata or {})
+        if present:
+            metadata[version_key(version)] = True
+        else:
+            metadata.pop(version_key(version), None)
+        metadatas.append(metadata)
+    vector_store._collection.update(ids=existing["ids"], metadatas=metadatas)
+
+# ----------------------------
+# Main Indexing Functions
+# ----------------------------
+
+def open_incremental_store(
+    persist_directory=INCREMENTAL_INDEX_DIR,
+    embedding_model=None,
+    chunker=DEFAULT_CHUNKER
+):
+    """
+    Opens (or creates) the persisted collection used for incremental
+    indexing with the given embedding model (the shared one by default)
+    and chunker.
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    if embedding_model is None:
+        embedding_model = get_shared_embedding_model()
+    return Chroma(
+        collection_name=f"{INCREMENTAL_COLLECTION}-{layout_key(embedding_model, chunker)}",
+        embedding_function=embedding_model,
+        persist_directory=persist_directory,
+    )
+
+
+def sync_document(
+    file_path,
+    version,
+    vector_store=None,
+    persist_directory=INCREMENTAL_INDEX_DIR,
+    chunker=DEFAULT_CHUNKER
+):
+    """
+    Brings one version of the legal text in sync with the incremental index.
+
+    The text is chunked with the same chunker as the served index, and its
+    articles are diffed against the stored manifest by content hash: only
+    chunks of new or amended articles are embedded, chunks already present
+    (e.g. shared with another version) are just tagged with the version, and
+    chunks no longer referenced by any version are deleted.
+
+    Args:
+        file_path (str): Path to the preprocessed text of this version.
+        version (str): Version label, e.g. "2002" or "ley-1383-2010".
+        vector_store: Store returned by open_incremental_store with the same
+            chunker (opened if None).
+        persist_directory (str): Directory of the incremental index.
+        chunker (str): Chunker name (see document_loader.chunk_document).
+
+    Returns:
+        Dict with counts of unchanged/changed/removed articles and
+        embedded/reused/deleted chunks.
+    """
+    if vector_store is None:
+        vector_store = open_incremental_store(persist_directory, chunker=chunker)
+    key = layout_key(vector_store.embeddings, chunker)
+
+    text = TextLoader(file_path, encoding="utf-8").load()[0].page_content
+    articles = group_article_chunks(chunk_document(text, file_path, chunker))
+
+    manifest = load_manifest(persist_directory, key)
+    old_articles = manifest["versions"].get(version, {})
+    new_articles = {}
+    stats = {
+        "unchanged_articles": 0,
+        "changed_articles": 0,
+        "removed_articles": 0,
+        "embedded_chunks": 0,
+        "reused_chunks": 0,
+        "deleted_chunks": 0,
+    }
+
+    pending = {}
+    for article_key, (article_num, docs) in articles.items():
+        section_hash = article_hash(docs)
+        old_entry = old_articles.get(article_key)
+        if old_entry and old_entry["hash"] == section_hash:
+            new_articles[article_key] = old_entry
+            stats["unchanged_articles"] += 1
+            continue
+
+        chunks = article_chunk_ids(docs, article_num)
+        new_articles[article_key] = {
+            "hash": section_hash,
+            "ids": [chunk_id for chunk_id, _ in chunks],
+        }
+        pending.update(chunks)
+        stats["changed_articles"] += 1
+
+    stats["removed_articles"] = len(set(old_articles) - set(new_articles))
+
+    # Embed only chunks the store has never seen; tag the rest
+    if pending:
+        known = set(vector_store.get(ids=list(pending), include=[])["ids"])
+        to_embed = [chunk_id for chunk_id in pending if chunk_id not in known]
+        for chunk_id in to_embed:
+            pending[chunk_id].metadata[version_key(version)] = True
+        if to_embed:
+            vector_store.add_documents(
+                [pending[chunk_id] for chunk_id in to_embed], ids=to_embed
+            )
+        set_version_flag(vector_store, known, version, present=True)
+        stats["embedded_chunks"] = len(to_embed)
+        stats["reused_chunks"] = len(known)
+
+    # Untag chunks dropped from this version, delete orphans
+    old_ids = {i for entry in old_articles.values() for i in entry["ids"]}
+    new_ids = {i for entry in new_articles.values() for i in entry["ids"]}
+    dropped = old_ids - new_ids
+    if dropped:
+        orphans = dropped - referenced_ids(manifest, exclude_version=version)
+        set_version_flag(vector_store, dropped - orphans, version, present=False)
+        if orphans:
+            vector_store.delete(ids=list(orphans))
+        stats["deleted_chunks"] = len(orphans)
+
+    manifest["versions"][version] = new_articles
+    save_manifest(persist_directory, key, manifest)
+
+    # Publish a new index version so dependent caches are invalidated
+    index_version = content_hash(key + json.dumps(manifest, sort_keys=True))
+    vector_store._collection.modify(metadata={"index_version": index_version})
+
+    return stats
+
+# -------------------------------------
+# Entry Point (Script Execution)
+# -------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Incrementally index a version of the legal text."
+    )
+    parser.add_argument("file_path", help="Preprocessed text of the version.")
+    parser.add_argument("--version", required=True, help="Version label.")
+    parser.add_argument(
+        "--index-dir", default=INCREMENTAL_INDEX_DIR,
+        help="Directory of the incremental index."
+    )
+    parser.add_argument(
+        "--chunker", default=DEFAULT_CHUNKER,
+        help="Chunker of the index (as in document_loader)."
+    )
+    args = parser.parse_args()
+
+    result = sync_document(
+        args.file_path, args.version, persist_directory=args.index_dir,
+        chunker=args.chunker
+    )
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .memory import get_token_encoder
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Chunks embedded per request, and embedding requests in flight at once
+# (overridden by INDEX_BATCH_SIZE / INDEX_WORKERS, read when a build starts)
+DEFAULT_BATCH_SIZE = 128
+DEFAULT_WORKERS = 4
+
+# Attempts per batch, and backoff bounds in seconds (doubled per attempt)
+DEFAULT_MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# Record of the finished batches of an index build, kept in its directory
+BUILD_CHECKPOINT = "build_progress.json"
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def is_rate_limit_error(error):
+    """
+    Returns True for HTTP 429 / rate limit errors of any embedding client.
+    """
+    status = getattr(error, "status_code", None) or getattr(
+        getattr(error, "response", None), "status_code", None
+    )
+    return status == 429 or "ratelimit" in type(error).__name__.lower()
+
+
+def retry_delay(error, attempt):
+    """
+    Returns the seconds to wait before retrying a failed batch: the
+    server's Retry-After when given, else exponential backoff with jitter
+    (doubled again for rate limits).
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return min(float(headers["retry-after"]), BACKOFF_MAX_SECONDS)
+    except (KeyError, TypeError, ValueError):
+        pass
+    delay = BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)
+    if is_rate_limit_error(error):
+        delay *= 2
+    return min(delay, BACKOFF_MAX_SECONDS) * random.uniform(0.5, 1.0)
+
+
+def embed_with_retry(embedding_model, texts, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Embeds a batch of texts, retrying failures with backoff.
+
+    Returns:
+        Tuple (embeddings, retries).
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return embedding_model.embed_documents(texts), attempt - 1
+        except Exception as e:
+            if attempt == max_attempts:
+                raise
+            delay = retry_delay(e, attempt)
+            logger.warning(
+                "Embedding batch failed (attempt %d/%d, retrying in %.1fs): %s",
+                attempt, max_attempts, delay, e
+            )
+            time.sleep(delay)
+
+
+def chunk_ids(num_chunks):
+    """
+    Returns the ids of the chunks of an index. An index directory only ever
+    holds one set of chunks (it is content-addressed), so positional ids
+    are stable across resumed builds.
+    """
+    return [f"chunk-{i:06d}" for i in range(num_chunks)]
+
+# ----------------------------
+# Build Checkpoint
+# ----------------------------
+
+def load_checkpoint(persist_directory, plan):
+    """
+    Returns the finished batch numbers of an interrupted build with the
+    same plan (index version, chunk count and batch size), or None if
+    there is no compatible checkpoint.
+    """
+    if persist_directory is None:
+        return None
+    path = os.path.join(persist_directory, BUILD_CHECKPOINT)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as infile:
+        checkpoint = json.load(infile)
+    if checkpoint.get("plan") != plan:
+        return None
+    return set(checkpoint["done"])
+
+
+def save_checkpoint(persist_directory, plan, done):
+    path = os.path.join(persist_directory, BUILD_CHECKPOINT)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as outfile:
+        json.dump({"plan": plan, "done": sorted(done)}, outfile)
+    os.replace(tmp_path, path)
+
+
+def clear_checkpoint(persist_directory):
+    if persist_directory is None:
+        return
+    path = os.path.join(persist_directory, BUILD_CHECKPOINT)
+    if os.path.isfile(path):
+        os.remove(path)
+
+# ----------------------------
+# Batched Index Build
+# ----------------------------
+
+def add_documents_batched(
+    vector_store,
+    splits,
+    embedding_model,
+    index_version,
+    persist_directory=None,
+    batch_size=None,
+    workers=None,
+    max_attempts=DEFAULT_MAX_ATTEMPTS
+):
+    """
+    Embeds the chunks in batches on a bounded pool of workers and writes
+    each finished batch to the vector store.
+
+    Failed batches are retried with backoff (honoring Retry-After on rate
+    limits). When ``persist_directory`` is given, finished batches are
+    checkpointed there, so an interrupted build of the same index resumes
+    with the missing batches only.
+
+    Returns:
+        Dict with the build statistics (chunks, tokens, batches, resumed
+        batches, retries, elapsed seconds, chunks/s and tokens/s).
+    """
+    batch_size = batch_size or int(os.getenv("INDEX_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+    workers = workers or int(os.getenv("INDEX_WORKERS", DEFAULT_WORKERS))
+    ids = chunk_ids(len(splits))
+    batches = [
+        range(start, min(start + batch_size, len(splits)))
+        for start in range(0, len(splits), batch_size)
+    ]
+    plan = {
+        "index_version": index_version,
+        "num_chunks": len(splits),
+        "batch_size": batch_size,
+    }
+    done = load_checkpoint(persist_directory, plan) or set()
+    pending = [number for number in range(len(batches)) if number not in done]
+    if done:
+        logger.info("Resuming index build: %d/%d batches done", len(done), len(batches))
+
+    encoder = get_token_encoder()
+    stats = {
+        "chunks": 0,
+        "tokens": 0,
+        "batches": len(batches),
+        "resumed_batches": len(done),
+        "retries": 0,
+    }
+    start = time.perf_counter()
+
+    def embed_batch(number):
+        texts = [splits[i].page_content for i in batches[number]]
+        embeddings, retries = embed_with_retry(embedding_model, texts, max_attempts)
+        return texts, embeddings, retries
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as executor:
+        in_flight = {}
+        queue = iter(pending)
+        while True:
+            # Keep at most ``workers`` batches in flight
+            for number in queue:
+                in_flight[executor.submit(embed_batch, number)] = number
+                if len(in_flight) >= workers:
+                    break
+            if not in_flight:
+                break
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                number = in_flight.pop(future)
+                texts, embeddings, retries = future.result()
+                batch = batches[number]
+                vector_store._collection.upsert(
+                    ids=[ids[i] for i in batch],
+                    embeddings=embeddings,
+                    documents=texts,
+                    metadatas=[splits[i].metadata or None for i in batch],
+                )
+                done.add(number)
+                if persist_directory is not None:
+                    save_checkpoint(persist_directory, plan, done)
+
+                stats["chunks"] += len(texts)
+                stats["tokens"] += sum(len(encoder.encode(text)) for text in texts)
+                stats["retries"] += retries
+                elapsed = time.perf_counter() - start
+                logger.info(
+                    "Embedded batch %d/%d (%.1f chunks/s, %.0f tokens/s)",
+                    len(done), len(batches),
+                    stats["chunks"] / elapsed, stats["tokens"] / elapsed
+                )
+
+    elapsed = time.perf_counter() - start
+    stats["elapsed_s"] = round(elapsed, 3)
+    stats["chunks_per_s"] = round(stats["chunks"] / elapsed, 2) if elapsed else 0.0
+    stats["tokens_per_s"] = round(stats["tokens"] / elapsed, 2) if elapsed else 0.0
+    return stats
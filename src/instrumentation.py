@@ -0,0 +1,339 @@
+import argparse
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from inspect import iscoroutinefunction
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Structured trace log enabled through the environment (see tracer_from_env)
+TRACE_LOG_ENV = "TRACE_LOG"
+
+# Observations kept per histogram for the in-process percentiles
+HISTOGRAM_WINDOW = 10000
+
+# Fields of every trace record; attributes with these names are prefixed
+RESERVED_FIELDS = ("type", "name", "value", "ts", "trace_id")
+RESERVED_PREFIX = "attr_"
+
+# Attributes the report breaks records down by: the LLM stage, the routing
+# decision, the cached field and the answer store match kind
+REPORT_DIMENSIONS = ("stage", "decision", "field", "match")
+
+# Trace and parent span of the code currently running
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_NULL_SPAN = nullcontext()
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def percentile(sorted_values, fraction):
+    """
+    Returns the nearest-rank percentile of an ascending list.
+    """
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summarize_values(values):
+    """
+    Returns count, sum, mean and p50/p95/p99 of a list of observations.
+    """
+    ordered = sorted(values)
+    total = sum(ordered)
+    return {
+        "count": len(ordered),
+        "sum": total,
+        "mean": total / len(ordered) if ordered else float("nan"),
+        "p50": percentile(ordered, 0.50),
+        "p95": percentile(ordered, 0.95),
+        "p99": percentile(ordered, 0.99),
+    }
+
+# ----------------------------
+# Sinks
+# ----------------------------
+
+class JsonlSink:
+    """
+    Appends trace records to a local JSON Lines file.
+    """
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+# ----------------------------
+# Tracers
+# ----------------------------
+
+class Tracer:
+    """
+    Records spans (timed stages) and metric observations (token counts,
+    cache hits, ...) of the graph.
+
+    Every record is written to ``sink`` (e.g. a JsonlSink) if given, and
+    aggregated in memory into histograms served by ``snapshot`` (see the
+    /metrics endpoint of the HTTP server). Spans opened inside ``trace``
+    share its trace id, so one request can be followed across nodes.
+    """
+
+    enabled = True
+
+    def __init__(self, sink=None, window=HISTOGRAM_WINDOW):
+        self.sink = sink
+        self.window = window
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(lambda: deque(maxlen=self.window))
+        self._totals = defaultdict(lambda: [0, 0.0])
+
+    def _observe(self, kind, name, value, attrs):
+        key = f"{kind}:{name}"
+        with self._lock:
+            self._histograms[key].append(value)
+            totals = self._totals[key]
+            totals[0] += 1
+            totals[1] += value
+        if self.sink is not None:
+            record = {
+                "type": kind,
+                "name": name,
+                "value": value,
+                "ts": time.time(),
+                "trace_id": _current_trace.get(),
+            }
+            for attr, attr_value in attrs.items():
+                if attr in RESERVED_FIELDS:
+                    attr = RESERVED_PREFIX + attr
+                record[attr] = attr_value
+            self.sink.write(record)
+
+    @contextmanager
+    def trace(self, name="request", **attrs):
+        """
+        Opens the root span of a request with a new trace id.
+        """
+        token = _current_trace.set(uuid.uuid4().hex[:16])
+        try:
+            with self.span(name, **attrs):
+                yield
+        finally:
+            _current_trace.reset(token)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """
+        Times the enclosed block as a span (milliseconds).
+        """
+        parent = _current_span.get()
+        token = _current_span.set(name)
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            if parent is not None:
+                attrs["parent"] = parent
+            if error is not None:
+                attrs["error"] = error
+            self._observe("span", name, (time.perf_counter() - start) * 1000, attrs)
+
+    def record(self, name, value=1, **attrs):
+        """
+        Records one observation of a metric.
+        """
+        self._observe("metric", name, value, attrs)
+
+    def record_usage(self, stage, prompt, response, prefix_tokens=None):
+        """
+        Records the input and output tokens of an LLM call, from the
+        response usage_metadata or, when the provider does not report it
+        (e.g. streamed responses), estimated with tiktoken.
+
+        Also records the input tokens the provider served from its prompt
+        cache and their share of the input, and, given the tokens of the
+        call's static prompt prefix, the share of the input it makes up.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            input_tokens = usage.get("input_tokens", 0)
+            self.record("tokens.input", input_tokens, stage=stage)
+            self.record("tokens.output", usage.get("output_tokens", 0), stage=stage)
+            cached = (usage.get("input_token_details") or {}).get("cache_read")
+            if cached is not None and input_tokens:
+                self.record("tokens.cached", cached, stage=stage)
+                self.record("tokens.cached_ratio", cached / input_tokens, stage=stage)
+        else:
+            from .memory import count_tokens
+            input_tokens = count_tokens(prompt)
+            self.record("tokens.input", input_tokens, stage=stage, estimated=True)
+            self.record("tokens.output", count_tokens([response]), stage=stage, estimated=True)
+
+        if prefix_tokens is not None and input_tokens:
+            self.record("tokens.prefix_ratio", min(1.0, prefix_tokens / input_tokens), stage=stage)
+
+    def traced(self, name):
+        """
+        Decorator that wraps a sync or async function in a span.
+        """
+        def decorator(func):
+            if iscoroutinefunction(func):
+                @wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """
+        Returns the in-memory aggregates: per span and metric name, the
+        total count and sum, and percentiles over the recent window.
+        """
+        with self._lock:
+            items = [(key, list(values), tuple(self._totals[key]))
+                     for key, values in self._histograms.items()]
+        snapshot = {}
+        for key, values, (count, total) in sorted(items):
+            stats = summarize_values(values)
+            stats["count"], stats["sum"] = count, total
+            snapshot[key] = stats
+        return snapshot
+
+
+class NoopTracer:
+    """
+    Tracer used when instrumentation is disabled: every call is a no-op,
+    so the instrumented code paths cost a few attribute lookups.
+    """
+
+    enabled = False
+
+    def trace(self, name="request", **attrs):
+        return _NULL_SPAN
+
+    def span(self, name, **attrs):
+        return _NULL_SPAN
+
+    def record(self, name, value=1, **attrs):
+        pass
+
+    def record_usage(self, stage, prompt, response, prefix_tokens=None):
+        pass
+
+    def traced(self, name):
+        return lambda func: func
+
+    def snapshot(self):
+        return {}
+
+
+NOOP_TRACER = NoopTracer()
+
+
+def tracer_from_env():
+    """
+    Returns a Tracer writing to the JSON Lines file named by the TRACE_LOG
+    environment variable, or NOOP_TRACER if it is not set.
+    """
+    path = os.getenv(TRACE_LOG_ENV)
+    if not path:
+        return NOOP_TRACER
+    return Tracer(JsonlSink(path))
+
+# ----------------------------
+# Report
+# ----------------------------
+
+def load_records(paths):
+    """
+    Reads trace records from one or more JSON Lines files.
+    """
+    records = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as infile:
+            records.extend(json.loads(line) for line in infile if line.strip())
+    return records
+
+
+def build_report(records):
+    """
+    Aggregates trace records into per-stage statistics.
+
+    Returns:
+        Dict mapping "<type>:<name>" (and "<type>:<name>[<values>]" for
+        records carrying REPORT_DIMENSIONS attributes, e.g.
+        "metric:router.decision[retrieve]" or "metric:cache.hit[docs]") to
+        count, sum, mean and percentiles.
+    """
+    groups = defaultdict(list)
+    for record in records:
+        key = f"{record['type']}:{record['name']}"
+        groups[key].append(record["value"])
+        dimensions = [str(record[dim]) for dim in REPORT_DIMENSIONS if dim in record]
+        if dimensions:
+            groups[f"{key}[{','.join(dimensions)}]"].append(record["value"])
+    return {key: summarize_values(values) for key, values in sorted(groups.items())}
+
+
+def print_report(report):
+    print(f"{'stage':<40}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'sum':>12}")
+    for key, stats in report.items():
+        print(
+            f"{key:<40}{stats['count']:>8}{stats['mean']:>10.1f}{stats['p50']:>10.1f}"
+            f"{stats['p95']:>10.1f}{stats['p99']:>10.1f}{stats['sum']:>12.0f}"
+        )
+
+# -------------------------------------
+# Entry Point (Script Execution)
+# -------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Aggregate trace logs into per-stage percentiles "
+                    "(span values in ms)."
+    )
+    parser.add_argument("logs", nargs="+", help="JSON Lines trace logs (TRACE_LOG).")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    report = build_report(load_records(args.logs))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -0,0 +1,279 @@
+import re
+import threading
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Structural markers, matched at the start of a line of the preprocessed text
+TITLE_PATTERN = re.compile(r"^T[IÍ]TULO\s*([IVXLC]+)\.?\s*$", re.IGNORECASE)
+CHAPTER_PATTERN = re.compile(r"^CAP[IÍ]TULO\s*([IVXLC]+)\.?\s*$", re.IGNORECASE)
+ARTICLE_LINE_PATTERN = re.compile(r"^ART[IÍ]CULO\s+(\d+)\s*[°ºo]?\.?\s*")
+PARAGRAFO_PATTERN = re.compile(
+    r"^PAR[AÁ]GRAFO(?:\s+(\d+|[A-ZÁÉÍÓÚ]+))?\s*[°ºo]?\.", re.IGNORECASE
+)
+NUMERAL_PATTERN = re.compile(r"^(\d{1,2})\.\s")
+LITERAL_PATTERN = re.compile(r"^(?:([A-Z])\.|([a-z])\))\s")
+
+# Upper-case heading at the start of an article (e.g. "MULTAS.")
+HEADING_PATTERN = re.compile(r"^([^a-záéíóúñ]{3,}?)\.(?:\s|$)")
+
+# Maximum tokens of a structural chunk; shorter articles are one chunk
+STRUCTURAL_CHUNK_TOKENS = 400
+
+# Unit types
+ARTICLE_UNIT = "artículo"
+BODY_UNIT = "cuerpo"
+PARAGRAFO_UNIT = "parágrafo"
+NUMERAL_UNIT = "numeral"
+LITERAL_UNIT = "literal"
+
+# Splitter for single units longer than the chunk budget, built on first use
+_unit_splitter = None
+_splitter_lock = threading.Lock()
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def get_unit_splitter():
+    """
+    Returns the splitter used for units that exceed STRUCTURAL_CHUNK_TOKENS
+    (no overlap, since the pieces are stitched back in order).
+    """
+    global _unit_splitter
+    with _splitter_lock:
+        if _unit_splitter is None:
+            _unit_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+                chunk_size=STRUCTURAL_CHUNK_TOKENS,
+                chunk_overlap=0
+            )
+        return _unit_splitter
+
+
+def parent_id(article_num):
+    """
+    Returns the id that links the chunks of an article to their parent.
+    """
+    return f"art-{article_num}"
+
+
+def classify_line(line):
+    """
+    Returns (unit_type, label) if a body line opens a parágrafo, numeral or
+    literal, else None.
+    """
+    match = PARAGRAFO_PATTERN.match(line)
+    if match:
+        return PARAGRAFO_UNIT, (match.group(1) or "único").lower()
+    match = NUMERAL_PATTERN.match(line)
+    if match:
+        return NUMERAL_UNIT, match.group(1)
+    match = LITERAL_PATTERN.match(line)
+    if match:
+        return LITERAL_UNIT, match.group(1) or match.group(2)
+    return None
+
+
+def unit_label(segments):
+    """
+    Describes the units of a chunk, e.g. "numerales 1-4" or "parágrafo 2".
+    """
+    types = {unit_type for unit_type, _, _ in segments}
+    if len(types) == 1 and len(segments) > 1:
+        unit_type = segments[0][0]
+        plural = {"numeral": "numerales", "literal": "literales",
+                  "parágrafo": "parágrafos", "cuerpo": "cuerpo"}[unit_type]
+        return f"{plural} {segments[0][1]}-{segments[-1][1]}"
+    first_type, first_label, _ = segments[0]
+    label = first_type if first_type == BODY_UNIT else f"{first_type} {first_label}"
+    return label if len(segments) == 1 else f"{label} y siguientes"
+
+# ----------------------------
+# Structural Parser
+# ----------------------------
+
+def parse_structure(text):
+    """
+    Parses the preprocessed code in one pass over its lines into articles
+    with their title, chapter and heading, and the article body split into
+    units (body, parágrafos, numerales, literales).
+
+    Returns:
+        List of dicts with keys number, heading, title, chapter and
+        segments, a list of (unit_type, label, text) tuples.
+    """
+    articles = []
+    title = chapter = ""
+    pending = None  # "title" or "chapter" while waiting for its name line
+    article = None
+
+    for raw_line in text.split("\n"):
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        match = TITLE_PATTERN.match(line)
+        if match:
+            title, chapter, pending = f"TÍTULO {match.group(1).upper()}", "", "title"
+            continue
+        match = CHAPTER_PATTERN.match(line)
+        if match:
+            chapter, pending = f"CAPÍTULO {match.group(1).upper()}", "chapter"
+            continue
+
+        match = ARTICLE_LINE_PATTERN.match(line)
+        if match:
+            pending = None
+            body = line[match.end():]
+            heading_match = HEADING_PATTERN.match(body)
+            article = {
+                "number": match.group(1),
+                "heading": heading_match.group(1).strip() if heading_match else "",
+                "title": title,
+                "chapter": chapter,
+                "segments": [[BODY_UNIT, "", body]],
+            }
+            articles.append(article)
+            continue
+
+        if pending is not None:
+            # Name line following a TÍTULO / CAPÍTULO marker
+            if pending == "title":
+                title = f"{title} - {line.rstrip('.')}"
+            else:
+                chapter = f"{chapter} - {line.rstrip('.')}"
+            pending = None
+            continue
+
+        if article is None:
+            continue  # preamble before the first article
+
+        unit = classify_line(line)
+        if unit is not None:
+            article["segments"].append([unit[0], unit[1], line])
+        else:
+            # Continuation of the current unit (wrapped line or list item)
+            article["segments"][-1][2] += "\n" + line
+
+    for article in articles:
+        article["segments"] = [
+            tuple(segment) for segment in article["segments"] if segment[2].strip()
+        ]
+    return articles
+
+
+def build_structural_chunks(articles, source, max_tokens=STRUCTURAL_CHUNK_TOKENS):
+    """
+    Turns parsed articles into chunks without overlap: an article that fits
+    in ``max_tokens`` is a single chunk; longer ones are packed from
+    consecutive units, and a unit longer than the budget is split.
+
+    Every chunk carries its title, chapter, article heading and units, and
+    is linked to its article by ``parent_id`` and ``chunk_index``.
+
+    Returns:
+        List of Document chunks.
+    """
+    from .memory import get_token_encoder
+
+    encoder = get_token_encoder()
+    docs = []
+
+    for article in articles:
+        segments = article["segments"]
+        if not segments:
+            continue
+        sizes = [len(encoder.encode(text)) for _, _, text in segments]
+
+        groups = []
+        if sum(sizes) <= max_tokens:
+            groups.append((ARTICLE_UNIT, "\n".join(text for _, _, text in segments)))
+        else:
+            current, current_tokens = [], 0
+            for segment, size in zip(segments, sizes):
+                if current and current_tokens + size > max_tokens:
+                    groups.append((unit_label(current), "\n".join(s[2] for s in current)))
+                    current, current_tokens = [], 0
+                if size > max_tokens:
+                    pieces = get_unit_splitter().split_text(segment[2])
+                    label = unit_label([segment])
+                    groups.extend(
+                        (f"{label} (parte {i})", piece)
+                        for i, piece in enumerate(pieces, start=1)
+                    )
+                    continue
+                current.append(segment)
+                current_tokens += size
+            if current:
+                groups.append((unit_label(current), "\n".join(s[2] for s in current)))
+
+        for index, (unit, content) in enumerate(groups):
+            docs.append(Document(
+                page_content=content,
+                metadata={
+                    "source": source,
+                    "source_article": article["number"],
+                    "title": article["title"],
+                    "chapter": article["chapter"],
+                    "heading": article["heading"],
+                    "unit": unit,
+                    "parent_id": parent_id(article["number"]),
+                    "chunk_index": index,
+                    "chunk_count": len(groups),
+                }
+            ))
+    return docs
+
+
+def split_structural(text, source):
+    """
+    Parses and chunks a preprocessed document (see parse_structure and
+    build_structural_chunks).
+    """
+    return build_structural_chunks(parse_structure(text), source)
+
+# ----------------------------
+# Parent Expansion
+# ----------------------------
+
+def expand_to_articles(vector_store, docs):
+    """
+    Replaces retrieved sub-unit chunks with the full text of their
+    articles, fetched from the vector store by ``parent_id``. Articles keep
+    the order of their first retrieved chunk; documents without a parent
+    are returned unchanged.
+
+    Returns:
+        List of Documents, one per article.
+    """
+    expanded = []
+    seen = set()
+    for doc in docs:
+        parent = doc.metadata.get("parent_id")
+        if parent is None:
+            expanded.append(doc)
+            continue
+        if parent in seen:
+            continue
+        seen.add(parent)
+
+        if doc.metadata.get("chunk_count") == 1:
+            expanded.append(doc)
+            continue
+        stored = vector_store.get(
+            where={"parent_id": parent}, include=["documents", "metadatas"]
+        )
+        chunks = sorted(
+            zip(stored["documents"], stored["metadatas"]),
+            key=lambda item: item[1].get("chunk_index", 0)
+        )
+        metadata = dict(doc.metadata, unit=ARTICLE_UNIT, chunk_index=0, chunk_count=1)
+        expanded.append(Document(
+            page_content="\n".join(text for text, _ in chunks),
+            metadata=metadata
+        ))
+    return expanded
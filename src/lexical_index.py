@@ -0,0 +1,187 @@
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from langchain_core.documents import Document
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Regex to find explicit article references (e.g., "artículo 131", "art. 2")
+ARTICLE_REFERENCE_PATTERN = re.compile(
+    r"\bart(?:[ií]culos?|s?\.)?\s*(\d+)(?:\s*(?:,|y|e)\s*(\d+))*",
+    re.IGNORECASE
+)
+
+# Regex to split folded text into word tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9ñ]+")
+
+# Common Spanish function words ignored by the index
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes como con contra cual
+cuales cuando de del desde donde durante e el ella ellas ellos en entre era es
+esa esas ese eso esos esta estas este esto estos fue fueron ha han hasta hay la
+las le les lo los mas me mi mis mucho muy ni no nos o otra otras otro otros para
+pero poco por porque puede que quien se sea segun ser si sin sobre son su sus tal
+tambien te tiene tienen toda todas todo todos tu un una unas uno unos y ya
+""".split())
+
+# Spanish inflectional/derivational suffixes, longest first
+SUFFIXES = (
+    "amientos", "imientos", "aciones", "uciones", "amiento", "imiento",
+    "ciones", "adoras", "adores", "mente", "acion", "ucion", "ancia", "encia",
+    "adora", "ador", "ante", "ables", "ibles", "able", "ible", "idad", "ivas",
+    "ivos", "iva", "ivo", "osos", "osas", "oso", "osa", "ando", "iendo", "ado",
+    "ido", "ada", "ida", "ar", "er", "ir", "es", "as", "os", "a", "o", "e", "s",
+)
+
+# Shortest stem left after suffix stripping
+MIN_STEM_LENGTH = 4
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def fold_accents(text):
+    """
+    Lowercases the text and removes accents, keeping the letter ñ.
+    """
+    text = text.lower().replace("ñ", "\0")
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return text.replace("\0", "ñ")
+
+
+def stem(word):
+    """
+    Light Spanish stemmer: strips the longest known suffix that leaves at
+    least MIN_STEM_LENGTH characters.
+    """
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    """
+    Splits text into accent-folded, stemmed tokens without stopwords.
+    """
+    return [
+        stem(token)
+        for token in TOKEN_PATTERN.findall(fold_accents(text))
+        if token not in STOPWORDS
+    ]
+
+
+def find_article_references(text):
+    """
+    Returns the article numbers explicitly referenced in a question,
+    e.g. "¿qué dice el artículo 131?" -> ["131"].
+    """
+    references = []
+    for match in ARTICLE_REFERENCE_PATTERN.finditer(text):
+        references.extend(re.findall(r"\d+", match.group(0)))
+    return list(dict.fromkeys(references))
+
+# ----------------------------
+# Lexical Index
+# ----------------------------
+
+class LexicalIndex:
+    """
+    In-process BM25 inverted index over article chunks, with a direct
+    article-number lookup table.
+    """
+
+    def __init__(self, documents):
+        self.documents = list(documents)
+        self.postings = defaultdict(dict)
+        self.doc_lengths = []
+        self.articles = defaultdict(list)
+        self.corpus_documents = defaultdict(set)
+
+        for doc_id, doc in enumerate(self.documents):
+            term_counts = Counter(tokenize(doc.page_content))
+            for term, count in term_counts.items():
+                self.postings[term][doc_id] = count
+            self.doc_lengths.append(sum(term_counts.values()))
+
+            article_num = doc.metadata.get("source_article")
+            if article_num:
+                self.articles[article_num].append(doc)
+            if doc.metadata.get("doc_id"):
+                self.corpus_documents[doc.metadata["doc_id"]].add(doc_id)
+
+        total_length = sum(self.doc_lengths)
+        self.avg_doc_length = total_length / len(self.documents) if self.documents else 0.0
+        self.idf = {
+            term: math.log(1 + (len(self.documents) - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    @classmethod
+    def from_vector_store(cls, vector_store):
+        """
+        Builds the index from every chunk stored in a Chroma vector store,
+        so lexical and dense results share the same documents.
+        """
+        stored = vector_store.get(include=["documents", "metadatas"])
+        return cls(
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(stored["documents"], stored["metadatas"])
+        )
+
+    def search(self, query, k=4, corpus_ids=None):
+        """
+        Ranks chunks against the query with BM25, optionally only those of
+        the given corpus documents (``doc_id`` metadata, see corpus.py).
+
+        Returns:
+            List of up to k (document, score) tuples, best first.
+        """
+        allowed = None
+        if corpus_ids is not None:
+            allowed = set().union(*(self.corpus_documents[i] for i in corpus_ids))
+
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term].items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = 1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / self.avg_doc_length
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.documents[doc_id], score) for doc_id, score in best]
+
+    def search_documents(self, query, k=4, corpus_ids=None):
+        """
+        Same as search, returning only the documents.
+        """
+        return [doc for doc, _ in self.search(query, k, corpus_ids)]
+
+    def lookup_articles(self, article_numbers, corpus_ids=None):
+        """
+        Returns every chunk of the given articles, in article order (and in
+        text order within an article for structural chunks), optionally only
+        from the given corpus documents.
+        """
+        return [
+            doc
+            for article_num in article_numbers
+            for doc in sorted(
+                self.articles.get(article_num, []),
+                key=lambda doc: doc.metadata.get("chunk_index", 0)
+            )
+            if corpus_ids is None or doc.metadata.get("doc_id") in corpus_ids
+        ]
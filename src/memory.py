@@ -0,0 +1,263 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import tiktoken
+from langchain_core.messages import (
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    messages_from_dict,
+    messages_to_dict,
+)
+from langgraph.graph import MessagesState
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Token budget of the conversation history sent to the LLMs
+DEFAULT_HISTORY_TOKENS = 1500
+
+# Approximate length of the rolling summary
+DEFAULT_SUMMARY_TOKENS = 250
+
+# Encoding used to count tokens (same family as the text splitter)
+TOKEN_ENCODING = "cl100k_base"
+
+# SQLite database holding conversations per session
+CONVERSATION_DB = os.path.join("data", "conversations.sqlite3")
+
+SUMMARY_PROMPT = (
+    "Resume de forma concisa la siguiente conversación entre un usuario y un "
+    "asistente sobre el Código Nacional de Tránsito de Colombia, conservando "
+    "las preguntas del usuario, los artículos citados y las conclusiones. "
+    "Usa como máximo {max_tokens} tokens.\n\n"
+    "Resumen previo:\n{summary}\n\nConversación:\n{conversation}"
+)
+
+_encoder = None
+
+# ----------------------------
+# Graph State
+# ----------------------------
+
+class ChatState(MessagesState):
+    """
+    Graph state: the message list plus a rolling summary of the turns
+    that were dropped from it.
+    """
+    summary: str
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def get_token_encoder():
+    """
+    Returns the tiktoken encoder used to count tokens, built on first use.
+    """
+    global _encoder
+    if _encoder is None:
+        _encoder = tiktoken.get_encoding(TOKEN_ENCODING)
+    return _encoder
+
+
+def count_tokens(messages):
+    """
+    Counts the tokens of the content of a list of messages.
+    """
+    encoder = get_token_encoder()
+    return sum(len(encoder.encode(str(msg.content))) for msg in messages)
+
+
+def is_conversation_turn(msg):
+    """
+    True for messages that make up the visible conversation (questions and
+    final answers), as opposed to tool calls and tool results.
+    """
+    return msg.type in ("human", "system") or (msg.type == "ai" and not msg.tool_calls)
+
+
+def dedupe_messages(messages):
+    """
+    Drops tool messages whose content repeats a later tool message (the
+    same context retrieved twice), keeping the latest occurrence. Other
+    messages are kept, so questions and answers still alternate.
+    """
+    seen = set()
+    kept = []
+    for msg in reversed(messages):
+        if msg.type == "tool":
+            content = str(msg.content)
+            if content in seen:
+                continue
+            seen.add(content)
+        kept.append(msg)
+    return kept[::-1]
+
+# ----------------------------
+# Conversation Memory
+# ----------------------------
+
+class ConversationMemory:
+    """
+    Keeps the prompt history of a conversation within a token budget.
+
+    ``window`` selects the history sent to the LLMs: the rolling summary
+    followed by the newest turns that fit in ``max_tokens``. ``compact``
+    (run at the end of every turn) removes tool exchanges of finished turns
+    from the state, and folds turns that no longer fit into the summary.
+    """
+
+    def __init__(
+        self,
+        llm=None,
+        max_tokens=DEFAULT_HISTORY_TOKENS,
+        summary_max_tokens=DEFAULT_SUMMARY_TOKENS
+    ):
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+
+    def window(self, messages, summary=""):
+        """
+        Returns the token-budgeted history to send to an LLM. The latest
+        user message is always included.
+        """
+        turns = [msg for msg in messages if is_conversation_turn(msg)]
+        encoder = get_token_encoder()
+
+        selected = []
+        budget = self.max_tokens
+        for msg in reversed(turns):
+            tokens = len(encoder.encode(str(msg.content)))
+            if selected and tokens > budget:
+                break
+            selected.append(msg)
+            budget -= tokens
+        selected.reverse()
+
+        if summary:
+            selected.insert(0, SystemMessage(
+                f"Resumen de la conversación anterior: {summary}"
+            ))
+        return selected
+
+    def _plan_compaction(self, messages):
+        """
+        Returns (stale, overflow): tool exchanges of finished turns, and the
+        oldest turns that exceed the token budget. The latest question and
+        answer are always kept, however long.
+        """
+        stale = [msg for msg in messages if not is_conversation_turn(msg)]
+        turns = [msg for msg in messages if is_conversation_turn(msg)]
+
+        overflow = []
+        if count_tokens(turns) > self.max_tokens:
+            encoder = get_token_encoder()
+            budget = self.max_tokens // 2
+            keep_from = len(turns)
+            for i in range(len(turns) - 1, -1, -1):
+                budget -= len(encoder.encode(str(turns[i].content)))
+                if budget < 0:
+                    break
+                keep_from = i
+            # Never fold the latest question and its answer into the summary
+            last_question = max(
+                (i for i, msg in enumerate(turns) if msg.type == "human"), default=keep_from
+            )
+            overflow = turns[:min(keep_from, last_question)]
+        return stale, overflow
+
+    def _summary_prompt(self, overflow, summary):
+        conversation = "\n".join(
+            f"{'Usuario' if msg.type == 'human' else 'Asistente'}: {msg.content}"
+            for msg in overflow
+        )
+        return [HumanMessage(SUMMARY_PROMPT.format(
+            max_tokens=self.summary_max_tokens,
+            summary=summary or "(ninguno)",
+            conversation=conversation,
+        ))]
+
+    def _update(self, stale, overflow, new_summary):
+        update = {
+            "messages": [RemoveMessage(id=msg.id) for msg in stale + overflow if msg.id]
+        }
+        if new_summary is not None:
+            update["summary"] = new_summary
+        return update
+
+    def compact(self, messages, summary=""):
+        """
+        Returns the state update that compacts a finished turn.
+        """
+        stale, overflow = self._plan_compaction(messages)
+        new_summary = None
+        if overflow and self.llm is not None:
+            new_summary = self.llm.invoke(self._summary_prompt(overflow, summary)).content
+        elif overflow:
+            overflow = []
+        return self._update(stale, overflow, new_summary)
+
+    async def acompact(self, messages, summary=""):
+        """
+        Async version of compact.
+        """
+        stale, overflow = self._plan_compaction(messages)
+        new_summary = None
+        if overflow and self.llm is not None:
+            response = await self.llm.ainvoke(self._summary_prompt(overflow, summary))
+            new_summary = response.content
+        elif overflow:
+            overflow = []
+        return self._update(stale, overflow, new_summary)
+
+# ----------------------------
+# Conversation Store
+# ----------------------------
+
+class ConversationStore:
+    """
+    Persists conversations (messages and rolling summary) in SQLite,
+    keyed by session id.
+    """
+
+    def __init__(self, path=CONVERSATION_DB):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "session_id TEXT PRIMARY KEY, messages TEXT NOT NULL, "
+                "summary TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def load(self, session_id):
+        """
+        Returns (messages, summary) for a session, empty if unknown.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT messages, summary FROM conversations WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+        if row is None:
+            return [], ""
+        return messages_from_dict(json.loads(row[0])), row[1]
+
+    def save(self, session_id, messages, summary=""):
+        """
+        Stores the messages and summary of a session.
+        """
+        payload = json.dumps(messages_to_dict(messages), ensure_ascii=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?)",
+                (session_id, payload, summary, time.time())
+            )
@@ -0,0 +1,459 @@
+import argparse
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from .document_loader import get_index_version
+from .embeddings import embedding_model_name
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Bump when the on-disk layout changes
+MMAP_FORMAT_VERSION = 1
+
+# Storage types of the embedding matrix
+MMAP_DTYPES = ("float32", "float16", "int8")
+DEFAULT_MMAP_DTYPE = "float16"
+
+# Files of an exported index directory
+MMAP_MANIFEST = "index.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+SCALES_FILE = "scales.npy"
+CENTROIDS_FILE = "centroids.npy"
+OFFSETS_FILE = "offsets.npy"
+SIDE_TABLE_FILE = "chunks.json"
+
+# Rows scored at a time, bounding the float32 copy of quantized rows
+SEARCH_BLOCK_ROWS = 16384
+
+# Approximate search: k-means iterations at export, clusters probed per query
+KMEANS_ITERATIONS = 10
+DEFAULT_NPROBE = 8
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize(matrix, dtype):
+    """
+    Converts normalized float32 embeddings to the storage type.
+
+    Returns:
+        Tuple (stored matrix, per-row scales or None). int8 rows are scaled
+        so their largest component maps to 127.
+    """
+    if dtype == "float32":
+        return matrix.astype(np.float32), None
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    raise ValueError(f"Unknown dtype {dtype!r}, expected one of {MMAP_DTYPES}")
+
+
+def kmeans(matrix, num_clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Spherical k-means over normalized rows.
+
+    Returns:
+        Tuple (normalized centroids, cluster of every row).
+    """
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), num_clusters, replace=False)]
+    for _ in range(iterations):
+        assignments = np.argmax(matrix @ centroids.T, axis=1)
+        for cluster in range(num_clusters):
+            members = matrix[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids, np.argmax(matrix @ centroids.T, axis=1)
+
+
+def to_columns(metadatas):
+    """
+    Stores metadata dicts column-wise (key -> one value per row, None when
+    absent), which keeps the side table compact and filters cheap.
+    """
+    keys = sorted({key for metadata in metadatas for key in metadata})
+    return {key: [metadata.get(key) for metadata in metadatas] for key in keys}
+
+
+def matches(value, condition):
+    """
+    Evaluates one Chroma ``where`` condition on a metadata value.
+    """
+    if not isinstance(condition, dict):
+        return value == condition
+    for operator, operand in condition.items():
+        if operator == "$eq":
+            ok = value == operand
+        elif operator == "$ne":
+            ok = value != operand
+        elif operator == "$in":
+            ok = value in operand
+        elif operator == "$nin":
+            ok = value not in operand
+        elif value is None:
+            ok = False
+        elif operator == "$gt":
+            ok = value > operand
+        elif operator == "$gte":
+            ok = value >= operand
+        elif operator == "$lt":
+            ok = value < operand
+        elif operator == "$lte":
+            ok = value <= operand
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        if not ok:
+            return False
+    return True
+
+# ----------------------------
+# Memory-Mapped Vector Store
+# ----------------------------
+
+class MmapVectorStore(VectorStore):
+    """
+    Read-only vector store over an exported index directory.
+
+    The embedding matrix is a contiguous .npy file (float32, float16 or
+    int8 with per-row scales) opened with ``mmap_mode="r"``, so every
+    worker process on a host shares one page-cached copy. Chunk texts and
+    metadata live in a column-wise JSON side table.
+
+    Search is exact cosine top-k, vectorized over blocks of rows. Indexes
+    exported with ``nlist`` clusters also support approximate search,
+    scanning only the ``nprobe`` clusters closest to the query.
+
+    Supports the parts of the Chroma interface used by the pipeline:
+    ``embeddings``, ``similarity_search(_by_vector)`` with a ``filter``
+    (Chroma ``where`` syntax), ``get`` and ``as_retriever``.
+    """
+
+    def __init__(self, path, embedding_model, nprobe=DEFAULT_NPROBE):
+        with open(os.path.join(path, MMAP_MANIFEST), "r", encoding="utf-8") as infile:
+            self.manifest = json.load(infile)
+        if self.manifest["format_version"] != MMAP_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format in {path}")
+
+        self.path = path
+        self.index_version = self.manifest.get("index_version")
+        self.nprobe = nprobe
+        self._embedding_model = embedding_model
+
+        self._matrix = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        self._scales = None
+        if self.manifest["dtype"] == "int8":
+            self._scales = np.load(os.path.join(path, SCALES_FILE), mmap_mode="r")
+        self._centroids = None
+        if self.manifest.get("nlist"):
+            self._centroids = np.load(os.path.join(path, CENTROIDS_FILE))
+            self._offsets = np.load(os.path.join(path, OFFSETS_FILE))
+
+        with open(os.path.join(path, SIDE_TABLE_FILE), "r", encoding="utf-8") as infile:
+            table = json.load(infile)
+        self._ids = table["ids"]
+        self._texts = table["documents"]
+        self._columns = table["metadata"]
+        self._masks = {}
+
+    @property
+    def embeddings(self):
+        return self._embedding_model
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError(
+            "MmapVectorStore is read-only; build a Chroma index and export it"
+        )
+
+    def __len__(self):
+        return len(self._ids)
+
+    # ----------------------------
+    # Rows and Filters
+    # ----------------------------
+
+    def _metadata(self, row):
+        return {
+            key: column[row]
+            for key, column in self._columns.items()
+            if column[row] is not None
+        }
+
+    def _document(self, row):
+        return Document(
+            id=self._ids[row], page_content=self._texts[row], metadata=self._metadata(row)
+        )
+
+    def _mask(self, where):
+        """
+        Returns the boolean row mask of a ``where`` filter (cached: the
+        pipeline reuses a handful of filters).
+        """
+        key = json.dumps(where, sort_keys=True)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._evaluate(where)
+            self._masks[key] = mask
+        return mask
+
+    def _evaluate(self, where):
+        mask = np.ones(len(self), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._evaluate(clause)
+            elif key == "$or":
+                any_mask = np.zeros(len(self), dtype=bool)
+                for clause in condition:
+                    any_mask |= self._evaluate(clause)
+                mask &= any_mask
+            else:
+                column = self._columns.get(key, [None] * len(self))
+                mask &= np.fromiter(
+                    (matches(value, condition) for value in column),
+                    dtype=bool, count=len(self)
+                )
+        return mask
+
+    def _dequantize(self, rows):
+        """
+        Returns the float32 embeddings of the given rows (a slice or an
+        index array).
+        """
+        block = np.asarray(self._matrix[rows], dtype=np.float32)
+        if self._scales is not None:
+            block *= self._scales[rows][:, None]
+        return block
+
+    # ----------------------------
+    # Search
+    # ----------------------------
+
+    def _score(self, query, rows=None):
+        """
+        Cosine similarity of the query with the given rows (all by
+        default), computed block by block.
+        """
+        count = len(self) if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, count)
+            # Contiguous slices read the mapped file without a gather copy
+            block = slice(start, stop) if rows is None else rows[start:stop]
+            scores[start:stop] = self._dequantize(block) @ query
+        return scores
+
+    def _candidate_rows(self, query, mask, k, approximate):
+        """
+        Returns the rows to score: the probed clusters for approximate
+        search (when they hold at least k matching rows), else every
+        matching row (None for all rows).
+        """
+        if approximate and self._centroids is not None:
+            probe = min(self.nprobe, len(self._centroids))
+            clusters = np.argpartition(-(self._centroids @ query), probe - 1)[:probe]
+            rows = np.concatenate([
+                np.arange(self._offsets[c], self._offsets[c + 1]) for c in clusters
+            ])
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(rows) >= k:
+                return rows
+        if mask is None:
+            return None
+        return np.flatnonzero(mask)
+
+    def similarity_search_with_score_by_vector(
+        self, embedding, k=4, filter=None, approximate=None, **kwargs
+    ):
+        """
+        Returns the k most similar chunks and their cosine similarity,
+        best first. ``approximate`` defaults to True when the index was
+        exported with clusters.
+        """
+        if approximate is None:
+            approximate = self._centroids is not None
+        query = np.array(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+
+        mask = self._mask(filter) if filter else None
+        rows = self._candidate_rows(query, mask, k, approximate)
+        scores = self._score(query, rows)
+        if not len(scores):
+            return []
+
+        top = min(k, len(scores))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        if rows is not None:
+            return [(self._document(int(rows[i])), float(scores[i])) for i in best]
+        return [(self._document(int(i)), float(scores[i])) for i in best]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [
+            doc for doc, _ in
+            self.similarity_search_with_score_by_vector(embedding, k, filter, **kwargs)
+        ]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_with_score_by_vector(
+            self._embedding_model.embed_query(query), k, filter, **kwargs
+        )
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [
+            doc for doc, _ in self.similarity_search_with_score(query, k, filter, **kwargs)
+        ]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), **kwargs):
+        """
+        Returns stored chunks in the format of Chroma's ``get``.
+        """
+        if ids is not None:
+            wanted = set(ids)
+            rows = [row for row, chunk_id in enumerate(self._ids) if chunk_id in wanted]
+        else:
+            rows = range(len(self))
+        if where:
+            mask = self._mask(where)
+            rows = [row for row in rows if mask[row]]
+        rows = list(rows)
+
+        result = {"ids": [self._ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [self._texts[row] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadata(row) for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = (
+                self._dequantize(np.asarray(rows, dtype=np.int64)) if rows
+                else np.empty((0, self.manifest["dim"]), dtype=np.float32)
+            )
+        return result
+
+# ----------------------------
+# Export
+# ----------------------------
+
+def export_vector_store(vector_store, path, dtype=DEFAULT_MMAP_DTYPE, nlist=0):
+    """
+    Exports every chunk of a Chroma vector store to a read-only index
+    directory (see MmapVectorStore). With ``nlist`` > 0, rows are grouped
+    into that many k-means clusters for approximate search.
+
+    The directory is written under a temporary name and renamed into
+    place, so concurrent workers exporting the same index never see a
+    partial one.
+
+    Returns:
+        The path of the index directory.
+    """
+    stored = vector_store.get(include=["embeddings", "documents", "metadatas"])
+    matrix = normalize_rows(np.asarray(stored["embeddings"], dtype=np.float32))
+    ids = list(stored["ids"])
+    texts = list(stored["documents"])
+    metadatas = [metadata or {} for metadata in stored["metadatas"]]
+
+    nlist = min(nlist, len(matrix))
+    centroids = offsets = None
+    if nlist:
+        centroids, assignments = kmeans(matrix, nlist)
+        order = np.argsort(assignments, kind="stable")
+        matrix = matrix[order]
+        ids = [ids[i] for i in order]
+        texts = [texts[i] for i in order]
+        metadatas = [metadatas[i] for i in order]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))])
+
+    stored_matrix, scales = quantize(matrix, dtype)
+
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, EMBEDDINGS_FILE), stored_matrix)
+    if scales is not None:
+        np.save(os.path.join(tmp_path, SCALES_FILE), scales)
+    if nlist:
+        np.save(os.path.join(tmp_path, CENTROIDS_FILE), centroids.astype(np.float32))
+        np.save(os.path.join(tmp_path, OFFSETS_FILE), offsets.astype(np.int64))
+    with open(os.path.join(tmp_path, SIDE_TABLE_FILE), "w", encoding="utf-8") as outfile:
+        json.dump(
+            {"ids": ids, "documents": texts, "metadata": to_columns(metadatas)},
+            outfile, ensure_ascii=False, separators=(",", ":")
+        )
+    with open(os.path.join(tmp_path, MMAP_MANIFEST), "w", encoding="utf-8") as outfile:
+        json.dump({
+            "format_version": MMAP_FORMAT_VERSION,
+            "index_version": get_index_version(vector_store),
+            "embedding_model": embedding_model_name(vector_store.embeddings),
+            "dtype": dtype,
+            "dim": int(matrix.shape[1]) if len(matrix) else 0,
+            "count": len(ids),
+            "nlist": nlist,
+        }, outfile, indent=2)
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another worker exported it first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isfile(os.path.join(path, MMAP_MANIFEST)):
+            raise
+    return path
+
+
+def open_or_export(path, build_vector_store, embedding_model, dtype=DEFAULT_MMAP_DTYPE, nlist=0):
+    """
+    Opens the exported index at ``path``, exporting it first from the
+    Chroma store returned by ``build_vector_store()`` if it does not exist.
+    """
+    if not os.path.isfile(os.path.join(path, MMAP_MANIFEST)):
+        export_vector_store(build_vector_store(), path, dtype, nlist)
+    return MmapVectorStore(path, embedding_model)
+
+# -------------------------------------
+# Entry Point (Script Execution)
+# -------------------------------------
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from .corpus import CORPUS_MANIFEST, Corpus
+
+    parser = argparse.ArgumentParser(
+        description="Export the corpus index to a memory-mapped read-only index."
+    )
+    parser.add_argument("--corpus", default=CORPUS_MANIFEST)
+    parser.add_argument("--dtype", choices=MMAP_DTYPES, default=DEFAULT_MMAP_DTYPE)
+    parser.add_argument("--nlist", type=int, default=0,
+                        help="Clusters for approximate search (0: exact only).")
+    args = parser.parse_args()
+
+    load_dotenv(".env")
+
+    store = Corpus.from_manifest(args.corpus).build_mmap_store(
+        dtype=args.dtype, nlist=args.nlist
+    )
+    print(json.dumps({"path": store.path, **store.manifest}))
@@ -1,4 +1,41 @@
+import argparse
+import hashlib
+import json
+import logging
 import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------
+# Global Configuration
+# -------------------------------------
+
+# Supported input formats
+SOURCE_EXTENSIONS = (".txt", ".pdf")
+PREPROCESSED_SUFFIX = "_preprocessed.txt"
+
+# Record of the input hash of every preprocessed file, kept in the output dir
+PREPROCESS_MANIFEST = "preprocess_manifest.json"
+
+# Bump when the preprocessing rules change so every file is reprocessed
+PREPROCESS_VERSION = 1
+
+# Bytes read at a time when hashing inputs
+HASH_BLOCK_SIZE = 1 << 20
+
+# Page numbers printed alone on a line ("12", "Página 3", "Pág. 3 de 40")
+PAGE_NUMBER_PATTERN = re.compile(
+    r"^(?:p[aá]g(?:ina)?\.?\s*)?\d+(?:\s*(?:de|/)\s*\d+)?$", re.IGNORECASE
+)
+
+# Lines at each edge of a page checked for running headers/footers, and the
+# share of sampled pages a line must repeat on to be treated as one
+EDGE_LINES = 2
+BOILERPLATE_MIN_SHARE = 0.5
+BOILERPLATE_SAMPLE_PAGES = 20
 
 # -------------------------------------
 # Helper Functions
@@ -25,24 +62,131 @@ def join_lines(current_line, next_line):
         next_line.replace('"', '')[:1].isupper()
     )
 
+def with_lookahead(lines):
+    """
+    Yields (current_line, next_line) pairs of stripped lines, streaming the
+    input with a one-line lookahead; next_line is '' for the last line.
+    """
+    iterator = iter(lines)
+    try:
+        current_line = next(iterator).strip()
+    except StopIteration:
+        return
+    for line in iterator:
+        next_line = line.strip()
+        yield current_line, next_line
+        current_line = next_line
+    yield current_line, ''
+
+def preprocess_lines(lines):
+    """
+    Streams the lines of a text, joining or separating them based on
+    formatting rules to improve the structure and flow of the content.
+    """
+    for current_line, next_line in with_lookahead(lines):
+        # Decide whether to join lines or add a line break
+        if join_lines(current_line, next_line):
+            yield current_line + '\n'
+        else:
+            yield current_line + ' '
+
 def preprocess_text_lines(lines):
     """
     Iterates through the lines of a text and joins or separates them based
     on formatting rules, improving the structure and flow of the content.
     """
-    processed_lines = []
+    return list(preprocess_lines(lines))
 
-    for i, current_line in enumerate(lines):
-        current_line = current_line.strip()
-        next_line = lines[i + 1].strip() if i + 1 < len(lines) else ''
+def file_hash(path):
+    """
+    Returns the SHA-256 hex digest of a file, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
-        # Decide whether to join lines or add a line break
-        if join_lines(current_line, next_line):
-            processed_lines.append(current_line + '\n')
-        else:
-            processed_lines.append(current_line + ' ')
+def output_path_for(input_path, output_dir):
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, f"{base_name}{PREPROCESSED_SUFFIX}")
+
+# -------------------------------------
+# PDF Extraction
+# -------------------------------------
+
+def boilerplate_key(line):
+    """
+    Normalizes a page-edge line so running headers that only differ in the
+    page number compare equal.
+    """
+    return re.sub(r"\d+", "#", line.strip().lower())
+
+def find_boilerplate(pages):
+    """
+    Returns the keys of lines that repeat at the top or bottom of at least
+    BOILERPLATE_MIN_SHARE of the given pages (running headers/footers).
+    """
+    counts = Counter()
+    for lines in pages:
+        if len(lines) <= 2 * EDGE_LINES:
+            continue  # too short to tell edges from body
+        edges = {boilerplate_key(line) for line in lines[:EDGE_LINES] + lines[-EDGE_LINES:]}
+        counts.update(key for key in edges if key)
+    threshold = max(2, BOILERPLATE_MIN_SHARE * len(pages))
+    return {key for key, count in counts.items() if count >= threshold}
 
-    return processed_lines
+def clean_page(lines, boilerplate):
+    """
+    Yields the lines of a page without page numbers and without running
+    headers/footers at its edges.
+    """
+    last = len(lines) - 1
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if PAGE_NUMBER_PATTERN.match(stripped):
+            continue
+        at_edge = i < EDGE_LINES or i > last - EDGE_LINES
+        if at_edge and boilerplate_key(stripped) in boilerplate:
+            continue
+        yield line
+
+def iter_pdf_lines(input_path):
+    """
+    Streams the text lines of a PDF page by page, stripping page numbers and
+    running headers/footers detected on the first pages.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise ImportError(
+            "PDF ingestion requires pypdf: pip install -e .[pdf]"
+        ) from e
+
+    pages = (page.extract_text() or '' for page in PdfReader(input_path).pages)
+
+    # Detect boilerplate on a sample of pages, then stream the rest
+    sample = []
+    for text in pages:
+        sample.append(text.splitlines())
+        if len(sample) >= BOILERPLATE_SAMPLE_PAGES:
+            break
+    boilerplate = find_boilerplate(sample)
+
+    for lines in sample:
+        yield from clean_page(lines, boilerplate)
+    for text in pages:
+        yield from clean_page(text.splitlines(), boilerplate)
+
+def iter_source_lines(input_path):
+    """
+    Streams the raw lines of a .txt or .pdf source document.
+    """
+    if input_path.lower().endswith(".pdf"):
+        yield from iter_pdf_lines(input_path)
+        return
+    with open(input_path, 'r', encoding='utf-8') as infile:
+        yield from infile
 
 # -------------------------------------
 # Main Preprocessing Function
@@ -50,29 +194,139 @@ def preprocess_text_lines(lines):
 
 def preprocess_file(input_path, output_dir="data"):
     """
-    Loads a text file, preprocesses its content to clean formatting issues
-    (like unwanted line breaks), and writes the result to a new file.
+    Streams a text or PDF file through the preprocessing rules to clean
+    formatting issues (like unwanted line breaks) and writes the result
+    incrementally to a new file.
+
+    Returns:
+        Path of the preprocessed file.
     """
     if not os.path.isfile(input_path):
         raise FileNotFoundError(f"Input file not found: {input_path}")
 
     os.makedirs(output_dir, exist_ok=True)
+    output_path = output_path_for(input_path, output_dir)
 
-    base_name = os.path.splitext(os.path.basename(input_path))[0]
-    output_path = os.path.join(output_dir, f"{base_name}_preprocessed.txt")
+    # Write to a temporary file so a failed run never leaves partial output
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as outfile:
+        outfile.writelines(preprocess_lines(iter_source_lines(input_path)))
+    os.replace(tmp_path, output_path)
 
-    with open(input_path, 'r', encoding='utf-8') as infile:
-        lines = infile.readlines()
+    return output_path
+
+# -------------------------------------
+# Directory Processing
+# -------------------------------------
+
+def find_sources(input_dir):
+    """
+    Lists the source documents of a directory tree. When a .txt and a .pdf
+    share a name, the .txt (already extracted or curated) is used.
+    """
+    sources = {}
+    for root, _, files in os.walk(input_dir):
+        for name in sorted(files):
+            stem, extension = os.path.splitext(name)
+            if extension.lower() not in SOURCE_EXTENSIONS or name.endswith(PREPROCESSED_SUFFIX):
+                continue
+            key = os.path.join(root, stem)
+            if key in sources and extension.lower() != ".txt":
+                continue
+            sources[key] = os.path.join(root, name)
+    return sorted(sources.values())
+
+def load_preprocess_manifest(output_dir):
+    path = os.path.join(output_dir, PREPROCESS_MANIFEST)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as infile:
+        return json.load(infile)
 
-    cleaned_text = ''.join(preprocess_text_lines(lines))
+def save_preprocess_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, PREPROCESS_MANIFEST)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as outfile:
+        json.dump(manifest, outfile, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
 
-    with open(output_path, 'w', encoding='utf-8') as outfile:
-        outfile.write(cleaned_text)
+def source_fingerprint(input_path):
+    return f"{PREPROCESS_VERSION}:{file_hash(input_path)}"
+
+def preprocess_directory(input_dir, output_dir="data", workers=None, force=False):
+    """
+    Preprocesses every .txt and .pdf document under input_dir in a process
+    pool. Files whose content (and the preprocessing version) did not change
+    since the last run, and whose output still exists, are skipped.
+
+    Returns:
+        Dict with the processed, skipped and failed input paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_preprocess_manifest(output_dir)
+    result = {"processed": [], "skipped": [], "failed": []}
+
+    pending = {}
+    for input_path in find_sources(input_dir):
+        fingerprint = source_fingerprint(input_path)
+        entry = manifest.get(input_path)
+        if (
+            not force
+            and entry is not None
+            and entry["fingerprint"] == fingerprint
+            and os.path.isfile(entry["output"])
+        ):
+            result["skipped"].append(input_path)
+            continue
+        pending[input_path] = fingerprint
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            path: executor.submit(preprocess_file, path, output_dir)
+            for path in pending
+        }
+        for input_path, future in futures.items():
+            try:
+                output_path = future.result()
+            except Exception as e:
+                logger.error("Failed to preprocess %s: %s", input_path, e)
+                result["failed"].append(input_path)
+                continue
+            manifest[input_path] = {
+                "fingerprint": pending[input_path],
+                "output": output_path,
+            }
+            result["processed"].append(input_path)
+
+    save_preprocess_manifest(output_dir, manifest)
+    return result
 
 # -------------------------------------
 # Entry Point (Script Execution)
 # -------------------------------------
 
 if __name__ == "__main__":
-    input_path = "data/ley-769-de-2002-codigo-nacional-de-transito.txt"
-    preprocess_file(input_path)
+    parser = argparse.ArgumentParser(
+        description="Preprocess legal texts (.txt or .pdf) for indexing."
+    )
+    parser.add_argument(
+        "inputs", nargs="*",
+        default=["data/ley-769-de-2002-codigo-nacional-de-transito.txt"],
+        help="Files or directories of documents to preprocess."
+    )
+    parser.add_argument("--output-dir", default="data")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes used for directories (default: CPU count).")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess directory files even if unchanged.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for input_path in args.inputs:
+        if os.path.isdir(input_path):
+            summary = preprocess_directory(
+                input_path, args.output_dir, args.workers, args.force
+            )
+            print(json.dumps({key: len(paths) for key, paths in summary.items()}))
+        else:
+            print(preprocess_file(input_path, args.output_dir))
@@ -0,0 +1,235 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Default bounds of the cache
+DEFAULT_MAX_SIZE = 1024
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+# Minimum cosine similarity for a semantic hit
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+# Recent question embeddings kept, so the lookups of one question (queries,
+# docs, answer) and its put embed it once
+EMBEDDING_MEMO_SIZE = 64
+
+# Characters dropped when normalizing questions
+PUNCTUATION_PATTERN = re.compile(r"[¿?¡!.,;:\"'()]+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def normalize_question(text):
+    """
+    Normalizes a question for exact-match lookup: lowercase, accents folded,
+    punctuation removed and whitespace collapsed.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = PUNCTUATION_PATTERN.sub(" ", text)
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+# ----------------------------
+# Query Cache
+# ----------------------------
+
+class QueryCache:
+    """
+    Two-level cache of per-question pipeline results.
+
+    The first level is an exact-match LRU keyed on the normalized question.
+    The second level (enabled when an embedding model is given) reuses the
+    entry of a previous question whose embedding lies within
+    ``similarity_threshold`` cosine similarity of the new one.
+
+    Entries hold any of ``queries`` (reformulations), ``docs`` (retrieved
+    documents) and ``answer`` (final answer). They expire after ``ttl``
+    seconds, the least recently used ones are evicted beyond ``max_size``,
+    and everything is dropped when the index version changes.
+    """
+
+    def __init__(
+        self,
+        embedding_model=None,
+        max_size=DEFAULT_MAX_SIZE,
+        ttl=DEFAULT_TTL_SECONDS,
+        similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+        cache_answers=True
+    ):
+        self.embedding_model = embedding_model
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.cache_answers = cache_answers
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._index_version = None
+        self._embeddings = OrderedDict()
+        self._counters = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def check_index_version(self, index_version):
+        """
+        Clears the cache if the index version differs from the one the
+        cached entries were computed against.
+        """
+        with self._lock:
+            if index_version != self._index_version:
+                if self._entries:
+                    self._counters["invalidations"] += 1
+                self._entries.clear()
+                self._index_version = index_version
+
+    def get(self, question, field):
+        """
+        Returns the cached value of ``field`` for the question (or a
+        semantically equivalent one), or None on a miss.
+        """
+        key = normalize_question(question)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(entry, now) \
+                    and field in entry["fields"]:
+                self._entries.move_to_end(key)
+                self._counters["exact_hits"] += 1
+                return entry["fields"][field]
+
+        if self.embedding_model is not None:
+            value = self._semantic_get(key, field, now)
+            if value is not None:
+                return value
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def put(self, question, field, value):
+        """
+        Stores ``value`` under ``field`` for the question.
+        """
+        if field == "answer" and not self.cache_answers:
+            return
+
+        key = normalize_question(question)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not self._is_fresh(entry, now):
+                entry = {"created": now, "embedding": None, "fields": {}}
+                self._entries[key] = entry
+            entry["fields"][field] = value
+            self._entries.move_to_end(key)
+            needs_embedding = (
+                self.embedding_model is not None and entry["embedding"] is None
+            )
+
+        if needs_embedding:
+            embedding = self._question_embedding(key)
+            with self._lock:
+                entry["embedding"] = embedding
+
+        self._evict(now)
+
+    def stats(self):
+        """
+        Returns hit/miss/eviction counters and the current size.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """
+        Drops every cached entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def _is_fresh(self, entry, now):
+        return self.ttl is None or now - entry["created"] <= self.ttl
+
+    def _embed(self, normalized_question):
+        embedding = np.asarray(
+            self.embedding_model.embed_query(normalized_question),
+            dtype=np.float32
+        )
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _question_embedding(self, key):
+        with self._lock:
+            embedding = self._embeddings.get(key)
+            if embedding is not None:
+                self._embeddings.move_to_end(key)
+                return embedding
+
+        embedding = self._embed(key)
+        with self._lock:
+            self._embeddings[key] = embedding
+            self._embeddings.move_to_end(key)
+            while len(self._embeddings) > EMBEDDING_MEMO_SIZE:
+                self._embeddings.popitem(last=False)
+        return embedding
+
+    def _semantic_get(self, key, field, now):
+        with self._lock:
+            candidates = [
+                (candidate_key, entry)
+                for candidate_key, entry in self._entries.items()
+                if entry["embedding"] is not None
+                and field in entry["fields"]
+                and self._is_fresh(entry, now)
+            ]
+        if not candidates:
+            return None
+
+        query = self._question_embedding(key)
+        matrix = np.stack([entry["embedding"] for _, entry in candidates])
+        similarities = matrix @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        candidate_key, entry = candidates[best]
+        with self._lock:
+            if candidate_key in self._entries:
+                self._entries.move_to_end(candidate_key)
+            self._counters["semantic_hits"] += 1
+        return entry["fields"][field]
+
+    def _evict(self, now):
+        with self._lock:
+            expired = [
+                key for key, entry in self._entries.items()
+                if not self._is_fresh(entry, now)
+            ]
+            for key in expired:
+                del self._entries[key]
+            evicted = len(expired)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                evicted += 1
+            self._counters["evictions"] += evicted
@@ -1,53 +1,180 @@
-from langchain.load import dumps, loads
+import asyncio
+import re
+import time
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Rank offset used by reciprocal rank fusion (Cormack et al., 2009)
+RRF_K = 60
+
+# Runs of spaces/tabs and of blank lines collapsed in the context sent to the LLM
+INLINE_SPACE_PATTERN = re.compile(r"[ \t\u00a0]+")
+BLANK_LINES_PATTERN = re.compile(r"\n\s*\n+")
 
 # ----------------------------
 # Helper Functions
 # ----------------------------
 
-def get_unique_union(documents: list[list]):
+def document_key(doc):
+    """
+    Returns the uniqueness key of a retrieved document: its document id
+    (see corpus.py), article number and page content (hashed by the
+    dict/set that uses the key), so identical articles of two norms or
+    versions are both kept.
+    """
+    return (
+        doc.metadata.get("doc_id"),
+        doc.metadata.get("source_article", ""),
+        doc.page_content,
+    )
+
+
+def reciprocal_rank_fusion(documents: list[list], k=RRF_K):
+    """
+    Merges several ranked lists of documents with reciprocal rank fusion.
+    Each document scores sum(1 / (k + rank)) over the lists it appears in.
+
+    Returns:
+        List of unique documents ordered by fused score (ties keep
+        first-seen order).
+    """
+    scores = {}
+    unique_docs = {}
+    for sublist in documents:
+        for rank, doc in enumerate(sublist, start=1):
+            key = document_key(doc)
+            if key not in unique_docs:
+                unique_docs[key] = doc
+                scores[key] = 0.0
+            scores[key] += 1.0 / (k + rank)
+
+    ordered_keys = sorted(unique_docs, key=scores.__getitem__, reverse=True)
+    return [unique_docs[key] for key in ordered_keys]
+
+
+def get_unique_union(documents: list[list], fusion=False):
     """
     Returns a list of unique documents from a nested list structure,
-    using the combination of page content and article number as the uniqueness key.
+    using the document id, article number and page content as the uniqueness key.
+
+    Documents keep their first-seen order, or are ranked with reciprocal
+    rank fusion across the query lists when ``fusion`` is True.
     """
-    # Flatten the nested list and serialize each document using content + article number
-    flattened_docs = [
-        dumps(doc.page_content + doc.metadata.get("source_article", ""))
-        for sublist in documents
-        for doc in sublist
-    ]
+    if fusion:
+        return reciprocal_rank_fusion(documents)
 
-    # Remove duplicates by converting to a set
-    unique_docs = list(set(flattened_docs))
+    unique_docs = {}
+    for sublist in documents:
+        for doc in sublist:
+            unique_docs.setdefault(document_key(doc), doc)
 
-    loaded_unique_docs = []
-    for doc_str in unique_docs:
-        doc = loads(doc_str)
-        # Find original document to preserve metadata
-        original_doc = next(
-            (
-                d for sublist in documents
-                for d in sublist
-                if d.page_content + d.metadata.get("source_article", "") == doc
-            ),
-            None
-        )
-        if original_doc:
-            loaded_unique_docs.append(original_doc)
+    return list(unique_docs.values())
 
-    return loaded_unique_docs
+
+def normalize_whitespace(text):
+    """
+    Collapses repeated spaces and blank lines, and strips every line.
+    """
+    text = INLINE_SPACE_PATTERN.sub(" ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return BLANK_LINES_PATTERN.sub("\n", text).strip()
 
 
 def format_context_with_articles(docs):
     """
-    Formats a list of documents by prepending the article number
-    to each document’s content for clearer display.
+    Formats a list of documents compactly, grouping the chunks of each
+    article under a single "[Artículo N]" header (in order of first
+    appearance) and normalizing their whitespace. Chunks without an article
+    number are kept apart, each under its own header.
 
     Returns:
         A single formatted string combining all documents.
     """
-    formatted_contexts = []
-    for doc in docs:
-        article_num = doc.metadata.get("source_article", "N/A")
-        formatted_contexts.append(f"[Artículo {article_num}] {doc.page_content}")
+    # Name the norm (and version) of each article when the context mixes
+    # several norms (or versions)
+    norms = {doc.metadata.get("norm") for doc in docs} - {None}
+    versions = {doc.metadata.get("version") for doc in docs} - {None}
+
+    articles = {}
+    for position, doc in enumerate(docs):
+        text = normalize_whitespace(doc.page_content)
+        if not text:
+            continue
+        article_num = doc.metadata.get("source_article")
+        label = f"Artículo {article_num or 'N/A'}"
+        if len(norms) > 1 and doc.metadata.get("norm"):
+            label += f", {doc.metadata['norm']}"
+        if len(versions) > 1 and doc.metadata.get("version"):
+            label += f" ({doc.metadata['version']})"
+        key = (doc.metadata.get("doc_id"), label) if article_num else position
+        articles.setdefault(key, (label, []))[1].append(text)
+
+    return "\n\n".join(
+        f"[{label}] " + "\n".join(texts) for label, texts in articles.values()
+    )
+
+# ----------------------------
+# Multi-Query Retrieval
+# ----------------------------
+
+def query_embedder(vector_store):
+    """
+    Returns the model embedding the queries of a vector store, without the
+    on-disk embedding cache (imported here so this module stays free of
+    LangChain imports).
+    """
+    from .embeddings import query_embedding_model
+    return query_embedding_model(vector_store.embeddings)
+
+
+def retrieve_many(vector_store, queries, k=4, search_kwargs=None):
+    """
+    Retrieves documents for several queries, embedding all of them in a
+    single batched call (bypassing the on-disk embedding cache) before
+    running the similarity searches.
+
+    Returns:
+        Tuple (results, timings): one list of documents per query, and the
+        time in milliseconds spent embedding and searching.
+    """
+    search_kwargs = search_kwargs or {}
+
+    start = time.perf_counter()
+    query_embeddings = query_embedder(vector_store).embed_documents(queries)
+    embedded = time.perf_counter()
+
+    results = [
+        vector_store.similarity_search_by_vector(embedding, k=k, **search_kwargs)
+        for embedding in query_embeddings
+    ]
+    searched = time.perf_counter()
+
+    return results, {
+        "embed_ms": (embedded - start) * 1000,
+        "search_ms": (searched - embedded) * 1000,
+    }
+
+
+async def aretrieve_many(vector_store, queries, k=4, search_kwargs=None):
+    """
+    Async version of retrieve_many: one batched embedding call, then the
+    similarity searches fanned out concurrently.
+    """
+    search_kwargs = search_kwargs or {}
+
+    start = time.perf_counter()
+    query_embeddings = await query_embedder(vector_store).aembed_documents(queries)
+    embedded = time.perf_counter()
+
+    results = await asyncio.gather(*(
+        vector_store.asimilarity_search_by_vector(embedding, k=k, **search_kwargs)
+        for embedding in query_embeddings
+    ))
+    searched = time.perf_counter()
 
-    return "\n\n".join(formatted_contexts)
+    return list(results), {
+        "embed_ms": (embedded - start) * 1000,
+        "search_ms": (searched - embedded) * 1000,
+    }
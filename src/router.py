@@ -0,0 +1,152 @@
+import re
+import threading
+
+import numpy as np
+
+from .lexical_index import find_article_references, fold_accents, tokenize
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Routing decisions
+RETRIEVE = "retrieve"
+RESPOND = "respond"
+
+# Minimum confidence to skip the LLM router
+DEFAULT_CONFIDENCE_THRESHOLD = 0.75
+
+# Stems of terms that only make sense in a traffic-law question
+DOMAIN_STEMS = frozenset(tokenize(
+    "tránsito transito multa multas comparendo infracción sanción licencia "
+    "conducción conductor conducir vehículo vehículos carro moto motocicleta "
+    "bicicleta peatón placa placas soat seguro revisión tecnomecánica "
+    "inmovilización inmovilizar grúa patios parqueadero estacionar velocidad "
+    "semáforo señal señales carril vía vías calzada andén adelantar agente "
+    "policía alcoholemia embriaguez pase runt simit matrícula pasajeros "
+    "transporte accidente choque casco cinturón"
+))
+
+# Greetings and small talk that never need retrieval
+SMALL_TALK_PATTERN = re.compile(
+    r"^\s*(hola|buenas|buenos dias|buenas tardes|buenas noches|gracias|"
+    r"muchas gracias|chao|adios|hasta luego|quien eres|que eres|como estas|"
+    r"que puedes hacer|ok|vale|perfecto)\b",
+)
+
+# BM25 score at which lexical evidence counts as 0.5 confidence
+LEXICAL_HALF_SCORE = 6.0
+
+# Centroid similarity mapped to zero confidence (embeddings of any Spanish
+# text are already fairly similar to the corpus centroid)
+EMBEDDING_SIMILARITY_FLOOR = 0.5
+
+# ----------------------------
+# Local Router
+# ----------------------------
+
+class LocalRouter:
+    """
+    Deterministic retrieve-vs-respond router that runs locally.
+
+    Confidence comes from explicit article references, domain keywords,
+    BM25 evidence from a LexicalIndex and, optionally, the cosine
+    similarity between the question embedding and the corpus centroid.
+    Below ``confidence_threshold`` the decision is left to the LLM router.
+    """
+
+    def __init__(
+        self,
+        lexical_index=None,
+        embedding_model=None,
+        corpus_centroid=None,
+        confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD
+    ):
+        self.lexical_index = lexical_index
+        self.embedding_model = embedding_model
+        self.corpus_centroid = corpus_centroid
+        self.confidence_threshold = confidence_threshold
+
+        self._lock = threading.Lock()
+        self._counters = {"fast_retrieve": 0, "fast_respond": 0, "llm": 0}
+
+    @classmethod
+    def from_vector_store(cls, vector_store, lexical_index=None, **kwargs):
+        """
+        Builds a router whose embedding signal compares questions with the
+        centroid of the chunk embeddings stored in a Chroma vector store.
+        """
+        stored = vector_store.get(include=["embeddings"])
+        embeddings = np.asarray(stored["embeddings"], dtype=np.float32)
+        centroid = None
+        if len(embeddings):
+            centroid = embeddings.mean(axis=0)
+            centroid /= np.linalg.norm(centroid) or 1.0
+        return cls(
+            lexical_index=lexical_index,
+            embedding_model=vector_store.embeddings,
+            corpus_centroid=centroid,
+            **kwargs
+        )
+
+    def retrieve_confidence(self, question):
+        """
+        Returns the confidence (0 to 1) that the question needs retrieval.
+        """
+        if find_article_references(question):
+            return 1.0
+
+        tokens = set(tokenize(question))
+        confidence = 0.9 if tokens & DOMAIN_STEMS else 0.0
+
+        if self.lexical_index is not None and confidence < self.confidence_threshold:
+            hits = self.lexical_index.search(question, k=1)
+            if hits:
+                score = hits[0][1]
+                confidence = max(confidence, score / (score + LEXICAL_HALF_SCORE))
+
+        if (
+            self.embedding_model is not None
+            and self.corpus_centroid is not None
+            and confidence < self.confidence_threshold
+        ):
+            embedding = np.asarray(self.embedding_model.embed_query(question))
+            similarity = float(embedding @ self.corpus_centroid) / (
+                np.linalg.norm(embedding) or 1.0
+            )
+            confidence = max(confidence, (similarity - EMBEDDING_SIMILARITY_FLOOR)
+                             / (1 - EMBEDDING_SIMILARITY_FLOOR))
+
+        return confidence
+
+    def route(self, question):
+        """
+        Decides how to handle a question.
+
+        Returns:
+            RETRIEVE or RESPOND when confident, or None to defer to the
+            LLM router.
+        """
+        if SMALL_TALK_PATTERN.match(fold_accents(question).lstrip("¿¡ ")) \
+                and not set(tokenize(question)) & DOMAIN_STEMS:
+            decision = RESPOND
+        elif self.retrieve_confidence(question) >= self.confidence_threshold:
+            decision = RETRIEVE
+        else:
+            decision = None
+
+        counter = {RETRIEVE: "fast_retrieve", RESPOND: "fast_respond"}.get(decision, "llm")
+        with self._lock:
+            self._counters[counter] += 1
+        return decision
+
+    def stats(self):
+        """
+        Returns how often each routing path was taken.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        total = sum(stats.values())
+        for path in list(stats):
+            stats[f"{path}_rate"] = stats[path] / total if total else 0.0
+        return stats
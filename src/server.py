@@ -0,0 +1,416 @@
+import argparse
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from langgraph.checkpoint.memory import MemorySaver
+
+from .graph_wrapper import astream_answer
+from .instrumentation import JsonlSink, Tracer, tracer_from_env
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+DEFAULT_FILE = "./data/ley-769-de-2002-codigo-nacional-de-transito_preprocessed.txt"
+DEFAULT_CORPUS = os.path.join("data", "corpus.json")
+
+# In-flight graph runs per process, and runs allowed to wait for a slot
+# (overridden by MAX_CONCURRENCY / MAX_PENDING, read when the app is created)
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_PENDING = 64
+
+# Conversations kept in memory, and seconds after which an idle one is dropped
+DEFAULT_MAX_CONVERSATIONS = 10000
+CONVERSATION_TTL_SECONDS = 6 * 60 * 60
+
+# Seconds a client is asked to wait when the server is saturated
+RETRY_AFTER_SECONDS = 1
+
+# ----------------------------
+# Request / Response Models
+# ----------------------------
+
+class ChatRequest(BaseModel):
+    message: str
+    conversation_id: Optional[str] = None
+
+
+class ChatResponse(BaseModel):
+    conversation_id: str
+    answer: str
+    sources: list[str]
+    latency_ms: float
+
+# ----------------------------
+# Helper Functions
+# ----------------------------
+
+def env_int(name, default):
+    """
+    Reads an integer setting from the environment at call time, so values
+    loaded from .env after the imports are honored.
+    """
+    return int(os.getenv(name, default))
+
+# ----------------------------
+# Conversation Checkpointer
+# ----------------------------
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    In-memory checkpointer that forgets conversations idle for more than
+    ``idle_seconds`` and, beyond ``max_threads``, the least recently used
+    ones, so a long-running server does not keep every conversation.
+    """
+
+    def __init__(
+        self,
+        max_threads=DEFAULT_MAX_CONVERSATIONS,
+        idle_seconds=CONVERSATION_TTL_SECONDS
+    ):
+        super().__init__()
+        self.max_threads = max_threads
+        self.idle_seconds = idle_seconds
+        self.evicted = 0
+        self._last_used = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _touch(self, thread_id):
+        """
+        Marks a conversation as used and returns the ones to forget.
+        """
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            self._last_used[thread_id] = now
+            self._last_used.move_to_end(thread_id)
+            while len(self._last_used) > 1:
+                oldest, last_used = next(iter(self._last_used.items()))
+                if len(self._last_used) <= self.max_threads \
+                        and now - last_used <= self.idle_seconds:
+                    break
+                del self._last_used[oldest]
+                expired.append(oldest)
+            self.evicted += len(expired)
+        return expired
+
+    def _forget(self, thread_id):
+        self.storage.pop(thread_id, None)
+        for key in [key for key in self.writes if key[0] == thread_id]:
+            self.writes.pop(key, None)
+        blobs = getattr(self, "blobs", None)
+        if blobs is not None:
+            for key in [key for key in blobs if key[0] == thread_id]:
+                blobs.pop(key, None)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        for thread_id in self._touch(config["configurable"]["thread_id"]):
+            self._forget(thread_id)
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def stats(self):
+        with self._lock:
+            return {"conversations": len(self._last_used), "evicted": self.evicted}
+
+# ----------------------------
+# Concurrency Limiter
+# ----------------------------
+
+class ConcurrencyLimiter:
+    """
+    Bounds in-flight graph runs (and therefore concurrent LLM calls).
+    Runs beyond ``max_concurrency`` wait for a slot; once ``max_pending``
+    runs are waiting, new ones are rejected (backpressure).
+    """
+
+    def __init__(self, max_concurrency, max_pending):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self.pending = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Servidor ocupado, intenta de nuevo.",
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+        self.pending += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.pending -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+# ----------------------------
+# Application Factory
+# ----------------------------
+
+def build_default_index(
+    file_path=DEFAULT_FILE,
+    stub=False,
+    corpus_path=DEFAULT_CORPUS,
+    mmap_dtype=None
+):
+    """
+    Opens or builds the index served by default: the corpus manifest with
+    OpenAI embeddings, or a single file with fake embeddings in stub mode.
+    With ``mmap_dtype`` ("float32", "float16" or "int8"), the corpus is
+    served from its read-only memory-mapped export (see mmap_store.py).
+
+    Returns:
+        Tuple (vector_store, corpus); corpus is None in stub mode.
+    """
+    if stub:
+        from .stubs import build_stub_vector_store
+        return build_stub_vector_store(file_path), None
+
+    from .corpus import Corpus
+    from .document_loader import get_shared_embedding_model
+    from .embeddings import BatchingEmbeddings
+    corpus = Corpus.from_manifest(corpus_path)
+    embedding_model = BatchingEmbeddings(get_shared_embedding_model())
+    if mmap_dtype:
+        vector_store = corpus.build_mmap_store(embedding_model=embedding_model, dtype=mmap_dtype)
+    else:
+        vector_store = corpus.build_vector_store(embedding_model=embedding_model)
+    return vector_store, corpus
+
+
+def build_default_graph(
+    file_path=DEFAULT_FILE,
+    stub=False,
+    stub_latency=0.0,
+    tracer=None,
+    corpus_path=DEFAULT_CORPUS,
+    answer_store=None,
+    index=None,
+    speculative_budget=None,
+    fines=True
+):
+    """
+    Builds the process-wide index and graph: the real OpenAI-backed
+    pipeline over the corpus manifest, or an offline one over a single
+    file with stub LLMs and fake embeddings. ``index`` reuses a
+    (vector_store, corpus) pair from build_default_index. With ``fines``,
+    fine lookups are answered from the infractions table of the indexed
+    texts.
+    """
+    from .context_packing import DEFAULT_CONTEXT_BUDGET
+    from .fines import FinesTable
+    from .graph_wrapper import build_graph
+    from .lexical_index import LexicalIndex
+    from .memory import ConversationMemory
+    from .router import LocalRouter
+
+    if index is None:
+        index = build_default_index(file_path, stub, corpus_path)
+    vector_store, corpus = index
+
+    if stub:
+        from .stubs import StubChatModel
+        llm_kwargs = {
+            "retriever_llm": StubChatModel(latency=stub_latency),
+            "generator_llm": StubChatModel(latency=stub_latency),
+        }
+        summary_llm = StubChatModel(latency=stub_latency)
+    else:
+        llm_kwargs = {}
+        from langchain_openai import ChatOpenAI
+        summary_llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+
+    fines_table = None
+    if fines:
+        fines_table = FinesTable.from_corpus(corpus) if corpus is not None \
+            else FinesTable.from_file(file_path)
+
+    lexical_index = LexicalIndex.from_vector_store(vector_store)
+    return build_graph(
+        vector_store,
+        lexical_index=lexical_index,
+        router=LocalRouter(lexical_index=lexical_index),
+        checkpointer=BoundedMemorySaver(
+            max_threads=env_int("MAX_CONVERSATIONS", DEFAULT_MAX_CONVERSATIONS)
+        ),
+        memory=ConversationMemory(llm=summary_llm),
+        context_budget=DEFAULT_CONTEXT_BUDGET,
+        tracer=tracer,
+        corpus=corpus,
+        answer_store=answer_store,
+        speculative_budget=speculative_budget,
+        fines_table=fines_table,
+        **llm_kwargs
+    )
+
+
+def create_app(
+    graph_factory=None,
+    max_concurrency=None,
+    max_pending=None,
+    tracer=None
+):
+    """
+    Creates the HTTP API. The graph is built once per process at startup
+    and shared by every conversation; per-conversation state lives in the
+    graph checkpointer, keyed by conversation_id (idle conversations are
+    eventually dropped, see BoundedMemorySaver).
+
+    ``max_concurrency`` and ``max_pending`` default to the MAX_CONCURRENCY
+    and MAX_PENDING environment variables, or DEFAULT_MAX_CONCURRENCY and
+    DEFAULT_MAX_PENDING.
+
+    ``tracer`` (by default configured from the TRACE_LOG environment
+    variable) times every request; its aggregates are served at /metrics.
+    """
+    if max_concurrency is None:
+        max_concurrency = env_int("MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)
+    if max_pending is None:
+        max_pending = env_int("MAX_PENDING", DEFAULT_MAX_PENDING)
+    if tracer is None:
+        tracer = tracer_from_env()
+    if graph_factory is None:
+        graph_factory = lambda: build_default_graph(tracer=tracer)
+    state = {}
+
+    @asynccontextmanager
+    async def lifespan(app):
+        state["graph"] = await asyncio.to_thread(graph_factory)
+        state["limiter"] = ConcurrencyLimiter(max_concurrency, max_pending)
+        yield
+
+    app = FastAPI(title="Chatbot Código Nacional de Tránsito", lifespan=lifespan)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def stats():
+        return state["limiter"].stats()
+
+    @app.get("/metrics")
+    async def metrics():
+        return {"enabled": tracer.enabled, "metrics": tracer.snapshot()}
+
+    @app.post("/chat", response_model=ChatResponse)
+    async def chat(request: ChatRequest):
+        conversation_id = request.conversation_id or uuid.uuid4().hex
+        config = {"configurable": {"thread_id": conversation_id}}
+        inputs = {"messages": [{"role": "user", "content": request.message}]}
+
+        async with state["limiter"].slot():
+            start = time.perf_counter()
+            answer, sources = "", []
+            with tracer.trace("request"):
+                async for kind, content in astream_answer(state["graph"], inputs, config):
+                    if kind == "answer":
+                        answer = content
+                    elif kind == "tool":
+                        sources.append(content)
+
+        return ChatResponse(
+            conversation_id=conversation_id,
+            answer=answer,
+            sources=sources,
+            latency_ms=(time.perf_counter() - start) * 1000,
+        )
+
+    return app
+
+# -------------------------------------
+# Entry Point (Script Execution)
+# -------------------------------------
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the chatbot over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--file", default=DEFAULT_FILE,
+                        help="Document indexed in --stub mode.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS,
+                        help="Corpus manifest indexed by the real pipeline.")
+    parser.add_argument("--max-concurrency", type=int,
+                        help=f"In-flight graph runs (default: $MAX_CONCURRENCY "
+                             f"or {DEFAULT_MAX_CONCURRENCY}).")
+    parser.add_argument("--max-pending", type=int,
+                        help=f"Runs waiting for a slot before rejecting (default: "
+                             f"$MAX_PENDING or {DEFAULT_MAX_PENDING}).")
+    parser.add_argument("--stub", action="store_true",
+                        help="Use stub LLMs and fake embeddings (no API key needed).")
+    parser.add_argument("--stub-latency", type=float, default=0.0,
+                        help="Simulated seconds per stub LLM call.")
+    parser.add_argument("--trace-log",
+                        help="Write spans and metrics to this JSON Lines file "
+                             "(default: $TRACE_LOG, disabled if unset).")
+    parser.add_argument("--mmap-dtype", choices=("float32", "float16", "int8"),
+                        help="Serve the corpus from its memory-mapped export, "
+                             "stored with this precision.")
+    parser.add_argument("--speculative-budget", type=float, nargs="?", const=2.0,
+                        help="Retrieve speculatively while routing, waiting at most "
+                             "this many seconds for the reformulations (default 2.0).")
+    parser.add_argument("--answer-store",
+                        help="Serve confident matches from this precomputed answer "
+                             "store (see python -m src.answer_store).")
+    parser.add_argument("--no-fines", action="store_true",
+                        help="Always generate answers to fine lookups instead of "
+                             "serving them from the infractions table.")
+    args = parser.parse_args()
+
+    load_dotenv(".env")
+
+    tracer = Tracer(JsonlSink(args.trace_log)) if args.trace_log else tracer_from_env()
+
+    def graph_factory():
+        index = build_default_index(args.file, args.stub, args.corpus, args.mmap_dtype)
+        answer_store = None
+        if args.answer_store:
+            from .answer_store import AnswerStore
+            from .embeddings import query_embedding_model
+            answer_store = AnswerStore(
+                args.answer_store,
+                embedding_model=query_embedding_model(index[0].embeddings)
+            )
+        return build_default_graph(
+            args.file, args.stub, args.stub_latency, tracer, args.corpus,
+            answer_store=answer_store, index=index,
+            speculative_budget=args.speculative_budget,
+            fines=not args.no_fines
+        )
+
+    app = create_app(
+        graph_factory,
+        max_concurrency=args.max_concurrency,
+        max_pending=args.max_pending,
+        tracer=tracer,
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
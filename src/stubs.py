@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any
+
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# ----------------------------
+# Global Configuration
+# ----------------------------
+
+# Dimension of the stub embeddings
+STUB_EMBEDDING_SIZE = 256
+
+# Marker of the reformulation prompt built by extraer
+REFORMULATION_MARKER = "Pregunta original:"
+
+# ----------------------------
+# Stub Chat Model
+# ----------------------------
+
+class StubChatModel(BaseChatModel):
+    """
+    Offline stand-in for the OpenAI chat models used by build_graph.
+
+    With tools bound it calls the first tool with the latest question; for
+    the reformulation prompt it returns five variants of the question; for
+    the generation prompt it cites the first article found in the context.
+    ``latency`` seconds of simulated model time are added to every call.
+    """
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "stub-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        names = [getattr(tool, "name", str(tool)) for tool in tools]
+        return self.bind(tool_names=names, **kwargs)
+
+    def _respond(self, messages, tool_names=None):
+        last_msg = messages[-1]
+        content = last_msg.content if isinstance(last_msg.content, str) else ""
+
+        if tool_names and last_msg.type == "human":
+            return AIMessage(
+                content="",
+                tool_calls=[{
+                    "name": tool_names[0],
+                    "args": {"pregunta": content},
+                    "id": f"call_{uuid.uuid4().hex}",
+                    "type": "tool_call",
+                }]
+            )
+
+        if REFORMULATION_MARKER in content:
+            question = content.split(REFORMULATION_MARKER, 1)[1].strip()
+            return AIMessage("\n".join(
+                f"{question} (variante {i})" for i in range(1, 6)
+            ))
+
+        system = messages[0].content if messages[0].type == "system" else ""
+        article = "N/A"
+        if "[Artículo " in system:
+            article = system.split("[Artículo ", 1)[1].split("]", 1)[0]
+        return AIMessage(
+            f"Basado en el artículo {article}, esta es una respuesta simulada."
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, tool_names=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        message = self._respond(messages, tool_names)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tool_names=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message = self._respond(messages, tool_names)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+# ----------------------------
+# Record / Replay
+# ----------------------------
+
+class Cassette:
+    """
+    JSON file of recorded model responses keyed by a hash of the request.
+
+    In "record" mode missing responses are fetched from the real model and
+    stored; in "replay" mode only recorded responses are served.
+    """
+
+    def __init__(self, path, mode="replay"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as infile:
+                self._entries = json.load(infile)
+
+    @staticmethod
+    def key(*parts):
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+
+    def vector_size(self):
+        """
+        Returns the dimension of the embedding vectors recorded, or None if
+        the cassette holds none.
+        """
+        with self._lock:
+            for value in self._entries.values():
+                if isinstance(value, list) and value and isinstance(value[0], (int, float)):
+                    return len(value)
+        return None
+
+    def save(self):
+        """
+        Atomically writes the recorded responses (record mode only).
+        """
+        if self.mode != "record":
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as outfile:
+                json.dump(self._entries, outfile, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+def message_fingerprint(msg):
+    """
+    Returns the parts of a message that identify a request, leaving out
+    random ids so recordings replay across runs.
+    """
+    return {
+        "type": msg.type,
+        "content": msg.content,
+        "tool_calls": [
+            {"name": call["name"], "args": call["args"]}
+            for call in getattr(msg, "tool_calls", None) or []
+        ],
+    }
+
+
+class RecordReplayChatModel(BaseChatModel):
+    """
+    Chat model that replays responses recorded from ``underlying``.
+
+    Requests are keyed by model name, message contents and bound tool
+    names. With ``simulate_latency`` a replayed call sleeps for the latency
+    measured when it was recorded. Unrecorded requests are sent to
+    ``fallback`` if given, otherwise they raise KeyError.
+    """
+
+    cassette: Any
+    model_name: str
+    underlying: Any = None
+    fallback: Any = None
+    simulate_latency: bool = False
+
+    @property
+    def _llm_type(self):
+        return "record-replay-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(bound_tools=list(tools), **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, bound_tools=None, **kwargs):
+        tool_names = [getattr(tool, "name", str(tool)) for tool in bound_tools or []]
+        key = Cassette.key(
+            "chat", self.model_name, tool_names,
+            [message_fingerprint(msg) for msg in messages]
+        )
+
+        recorded = self.cassette.get(key)
+        if recorded is None:
+            if self.cassette.mode == "record":
+                model = self.underlying
+                if bound_tools:
+                    model = model.bind_tools(bound_tools)
+                start = time.perf_counter()
+                message = model.invoke(messages)
+                recorded = {
+                    "message": message_to_dict(message),
+                    "latency_s": time.perf_counter() - start,
+                }
+                self.cassette.put(key, recorded)
+            elif self.fallback is not None:
+                model = self.fallback
+                if bound_tools:
+                    model = model.bind_tools(bound_tools)
+                message = model.invoke(messages)
+                return ChatResult(generations=[ChatGeneration(message=message)])
+            else:
+                raise KeyError(f"No recorded response for request {key[:12]}")
+        elif self.simulate_latency:
+            time.sleep(recorded["latency_s"])
+
+        message = messages_from_dict([recorded["message"]])[0]
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await asyncio.to_thread(
+            self._generate, messages, stop, None, **kwargs
+        )
+
+
+class RecordReplayEmbeddings(Embeddings):
+    """
+    Embeddings that replay vectors recorded from ``underlying``, keyed by
+    model name and text. Unrecorded texts are embedded by ``fallback``
+    (deterministic fake embeddings of the recorded size by default) when
+    replaying.
+    """
+
+    def __init__(self, cassette, model_name, underlying=None, fallback=None):
+        self.cassette = cassette
+        self.model_name = model_name
+        self.underlying = underlying
+        self.fallback = fallback
+        self._size = None
+
+    def embed_fallback(self, texts):
+        """
+        Embeds unrecorded texts, failing clearly if the fallback vectors
+        cannot be mixed with the recorded ones.
+        """
+        if self._size is None:
+            self._size = self.cassette.vector_size()
+        size = self._size
+        if self.fallback is None:
+            self.fallback = DeterministicFakeEmbedding(size=size or STUB_EMBEDDING_SIZE)
+        vectors = self.fallback.embed_documents(texts)
+        if size is not None and vectors and len(vectors[0]) != size:
+            raise ValueError(
+                f"Fallback embeddings have {len(vectors[0])} dimensions but the "
+                f"cassette holds {size}-dimensional vectors; re-record the "
+                f"cassette (--mode record)."
+            )
+        return vectors
+
+    def embed_documents(self, texts):
+        keys = [Cassette.key("embedding", self.model_name, text) for text in texts]
+        vectors = [self.cassette.get(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            if self.cassette.mode == "record":
+                embedded = self.underlying.embed_documents([texts[i] for i in missing])
+                for i, vector in zip(missing, embedded):
+                    vectors[i] = [round(value, 6) for value in vector]
+                    self.cassette.put(keys[i], vectors[i])
+            else:
+                embedded = self.embed_fallback([texts[i] for i in missing])
+                for i, vector in zip(missing, embedded):
+                    vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+# ----------------------------
+# Stub Pipeline
+# ----------------------------
+
+def build_stub_vector_store(file_path, embedding_model=None):
+    """
+    Builds an in-memory Chroma index of a document with deterministic fake
+    embeddings (or the given, e.g. replayed, embeddings), so the pipeline
+    runs without any API key.
+    """
+    from langchain_community.document_loaders import TextLoader
+    from langchain_community.vectorstores import Chroma
+
+    from .document_loader import chunk_document
+
+    text = TextLoader(file_path, encoding="utf-8").load()[0].page_content
+    splits = chunk_document(text, file_path)
+    return Chroma.from_documents(
+        splits,
+        embedding_model or DeterministicFakeEmbedding(size=STUB_EMBEDDING_SIZE),
+        collection_name=f"stub-{uuid.uuid4().hex[:8]}",
+    )